@@ -0,0 +1,304 @@
+#-*- coding: utf-8 -*-
+
+"""This module provides the parallel bulk load of a table (see
+Relation.parallel_load).
+
+A single COPY is bound by the CPU of one backend. The source is split in
+chunks of chunk_rows rows (records) that are copied over workers
+connections at once, one thread by connection:
+
+- each chunk is copied in its own transaction. A chunk failing on a
+  connection error (OperationalError, InterfaceError: lost connection,
+  deadlock...) is retried on a new connection at most retries times. Any
+  other error (invalid data...) stops the load and is raised: the chunks
+  already copied stay committed. The commit itself is never retried: if
+  it fails, the chunk may have been committed or not and the error is
+  raised (the rows are never loaded twice),
+- progress(rows, chunks) is called in the calling thread each time a chunk
+  is copied, with the numbers of rows and chunks copied so far,
+- the rows of a partitioned table are copied directly in its leaf
+  partitions. The partition of each row of a chunk is computed by
+  PostgreSQL from the partition constraints (pg_get_partition_constraintdef)
+  and the values of the partition key (routing).
+
+The source is either an iterable of rows (sequences of values in the order of
+the fields, or dictionaries), encoded in the text format of COPY (records)
+or packed in the binary format (see half_orm.copy_binary), or a text file
+object in the text or csv format of COPY whose records are copied as they
+are.
+"""
+
+import csv
+import datetime
+import io
+import json
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import psycopg2
+
+from half_orm import copy_binary, json_encoders
+from half_orm.parquet import partitions
+
+_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+_UNESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+_ESCAPED = re.compile(r'\\(x[0-9a-fA-F]{1,2}|[0-7]{1,3}|.)')
+
+def _array(value):
+    "Returns the PostgreSQL array literal of the sequence value."
+    elts = []
+    for elt in value:
+        if elt is None:
+            elts.append('NULL')
+        elif isinstance(elt, (list, tuple)):
+            elts.append(_array(elt))
+        else:
+            elts.append('"{}"'.format(_text(elt).replace('\\', '\\\\').replace('"', '\\"')))
+    return f"{{{','.join(elts)}}}"
+
+def _text(value):
+    "Returns the text representation of the (not None) value for PostgreSQL."
+    if isinstance(value, bool):
+        return value and 't' or 'f'
+    if isinstance(value, (list, tuple)):
+        return _array(value)
+    if isinstance(value, dict):
+        return json.dumps(value, default=json_encoders.default)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f'\\x{bytes(value).hex()}'
+    if isinstance(value, datetime.timedelta):
+        return f'{value.days} days {value.seconds} seconds {value.microseconds} microseconds'
+    return str(value)
+
+def encode_row(values):
+    "Returns the record (text format of COPY) of the sequence of values."
+    return '\t'.join(
+        '\\N' if value is None else _text(value).translate(_ESCAPES) for value in values) + '\n'
+
+def rows_values(rows, fields):
+    """Generator. Yields the rows (sequences of values or dictionaries indexed
+    by the names of the fields) as sequences of values in the order of the
+    fields.
+    """
+    for row in rows:
+        if isinstance(row, dict):
+            row = [row[name] for name in fields]
+        yield row
+
+def rows_records(rows, fields):
+    "Generator. Yields the records of the rows (see rows_values)."
+    for row in rows_values(rows, fields):
+        yield encode_row(row)
+
+def file_records(fileobj, format, header):
+    """Generator. Yields the records of the text file object fileobj in the
+    text or csv format of COPY. The first record is skipped if header is
+    True.
+    """
+    #pylint: disable=redefined-builtin
+    lines = (line if line.endswith('\n') else f'{line}\n' for line in fileobj)
+    if format == 'text':
+        if header:
+            next(lines, None)
+        yield from lines
+        return
+    record = []
+    quotes = 0
+    for line in lines:
+        # a csv record goes on while a quoted value is open.
+        record.append(line)
+        quotes += line.count('"')
+        if quotes % 2 == 0:
+            if header:
+                header = False
+            else:
+                yield ''.join(record)
+            record = []
+            quotes = 0
+    if record:
+        yield ''.join(record)
+
+def _unescape(value):
+    "Returns the value of a column of a record in the text format."
+    if value == '\\N':
+        return None
+    def replace(match):
+        char = match.group(1)
+        if char[0] == 'x' and len(char) > 1:
+            return chr(int(char[1:], 16))
+        if char[0] in '01234567':
+            return chr(int(char, 8))
+        return _UNESCAPES.get(char, char)
+    return _ESCAPED.sub(replace, value)
+
+def _keys(records, format, indexes):
+    """Returns the lists of the values (text) of the columns at indexes in
+    the records (rows in the binary format).
+    """
+    #pylint: disable=redefined-builtin
+    if format == 'binary':
+        return [
+            [None if row[idx] is None else _text(row[idx]) for row in records]
+            for idx in indexes]
+    if format == 'text':
+        splitted = [record[:-1].split('\t') for record in records]
+        return [[_unescape(values[idx]) for values in splitted] for idx in indexes]
+    splitted = [next(csv.reader([record])) for record in records]
+    return [[values[idx] or None for values in splitted] for idx in indexes]
+
+def routing(model, fqrn, fields):
+    """Returns the routing of the rows with the fields in the leaf partitions
+    of the partitioned table fqrn: (indexes of the columns of the partition
+    keys in the fields, query returning the partition of each row, names of
+    the leaf partitions). Returns None if the partition keys are expressions
+    or are not all in the fields.
+    """
+    keys = {}
+    for elt in model.execute_query(
+            """select a.attname, format_type(a.atttypid, a.atttypmod) as type,
+                 k.attnum = 0 as expression
+               from pg_partition_tree(%s::regclass) as t
+                 join pg_partitioned_table as p on p.partrelid = t.relid
+                 cross join unnest(p.partattrs::int2[]) as k(attnum)
+                 left join pg_attribute as a on
+                   a.attrelid = p.partrelid and a.attnum = k.attnum""", (fqrn,)):
+        if elt['expression'] or elt['attname'] not in fields:
+            return None
+        keys[elt['attname']] = elt['type']
+    leaves = partitions(model, fqrn)
+    if not leaves:
+        return None
+    columns = ', '.join('"{}"'.format(name.replace('"', '""')) for name in keys)
+    arrays = ', '.join(f'%s::text[]::{type_}[]' for type_ in keys.values())
+    cases = ' '.join(
+        f'when {condition} then {idx}' for idx, (_, condition) in enumerate(leaves))
+    query = (
+        f'select case {cases} end as partition '
+        f'from unnest({arrays}) with ordinality as q({columns}, half_orm_ord) '
+        'order by half_orm_ord')
+    return [fields.index(name) for name in keys], query, [name for name, _ in leaves]
+
+def chunks(records, chunk_rows):
+    "Generator. Yields the records by lists of chunk_rows records."
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _copy(cursor, fqrn, columns, options, fileobj):
+    "Copies the content of fileobj in the table fqrn."
+    cursor.copy_expert(f'copy {fqrn} ({columns}) from stdin with ({options})', fileobj)
+
+def load(
+        model, fqrn, fields, parts, format, workers, route=None, retries=3, progress=None,
+        fields_metadata=None):
+    """Copies the parts (chunks: lists of records) in the table fqrn with at
+    most workers threads, each one with its own connection. The records are
+    routed in the partitions according to route (see routing). Returns the
+    number of rows copied.
+
+    In the binary format, the records are rows (sequences of values) packed
+    according to the fields_metadata (see half_orm.copy_binary).
+    """
+    #pylint: disable=redefined-builtin,too-many-arguments,too-many-locals
+    columns = ', '.join('"{}"'.format(name.replace('"', '""')) for name in fields)
+    options = f'format {format}'
+    if format == 'binary':
+        # raises a ValueError if a type is not supported.
+        copy_binary.Encoder(fields_metadata, fields)
+    local = threading.local()
+    connections = []
+    lock = threading.Lock()
+
+    def connection():
+        if getattr(local, 'connection', None) is None:
+            local.connection = model._new_connection()
+            with lock:
+                connections.append(local.connection)
+        return local.connection
+
+    def source(conn, records):
+        "Returns the file object read by COPY."
+        if format != 'binary':
+            return io.StringIO(''.join(records))
+        # each thread packs its chunks in the buffer of its own encoder.
+        if getattr(local, 'encoder', None) is None:
+            local.encoder = copy_binary.Encoder(
+                fields_metadata, fields, psycopg2.extensions.encodings[conn.encoding])
+        return local.encoder.load(records)
+
+    def copy_chunk(conn, records):
+        with conn.cursor() as cursor:
+            if route is None:
+                _copy(cursor, fqrn, columns, options, source(conn, records))
+                return
+            indexes, query, leaves = route
+            cursor.execute(query, _keys(records, format, indexes))
+            routed = {}
+            for record, row in zip(records, cursor.fetchall()):
+                routed.setdefault(row['partition'], []).append(record)
+            for idx, part in routed.items():
+                # the rows without partition are copied in fqrn (and rejected).
+                _copy(
+                    cursor, fqrn if idx is None else leaves[idx], columns, options,
+                    source(conn, part))
+
+    def load_chunk(records):
+        attempt = 0
+        while True:
+            try:
+                conn = connection()
+                copy_chunk(conn, records)
+                break
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                conn = getattr(local, 'connection', None)
+                if conn is not None:
+                    conn.close()
+                local.connection = None
+                attempt += 1
+                if attempt > retries:
+                    raise
+            except BaseException:
+                if getattr(local, 'connection', None) is not None:
+                    local.connection.rollback()
+                raise
+        # the chunk may be committed even if the commit fails: not retried.
+        conn.commit()
+        return len(records)
+
+    loaded = [0, 0]
+
+    def collect(pending):
+        "Waits for a chunk of pending to be copied. Returns the chunks pending."
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            loaded[0] += future.result()
+            loaded[1] += 1
+            if progress is not None:
+                progress(*loaded)
+        return pending
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            try:
+                for records in parts:
+                    # at most two chunks by worker are held in memory.
+                    if len(pending) >= 2 * workers:
+                        pending = collect(pending)
+                    pending.add(executor.submit(load_chunk, records))
+                while pending:
+                    pending = collect(pending)
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+    finally:
+        for conn in connections:
+            conn.close()
+    return loaded[0]
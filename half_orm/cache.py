@@ -0,0 +1,109 @@
+#-*- coding: utf-8 -*-
+
+"""This module provides the LRUCache class used by the Model to store the
+compiled SQL queries.
+
+The cache is bounded: when it is full, the least recently used entry is
+evicted. The hits and misses are counted:
+
+    >>> model.sql_cache.stats()
+    {'hits': 1234, 'misses': 12, 'size': 12, 'maxsize': 1024}
+
+The cache is shared by the threads using the model: its operations are
+protected by a lock.
+"""
+
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """A dictionary bounded to maxsize entries (the least recently used entry
+    is evicted first). A maxsize of 0 disables the cache.
+
+    on_evict(key, value) is called for each entry evicted (with the lock of
+    the cache held).
+    """
+    def __init__(self, maxsize=1024, on_evict=None):
+        # reentrant: on_evict may use the cache.
+        self.__lock = threading.RLock()
+        self.__data = OrderedDict()
+        self.__maxsize = maxsize
+        self.__on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+
+    def __get_maxsize(self):
+        "Returns the maximum number of entries."
+        return self.__maxsize
+    def __set_maxsize(self, maxsize):
+        "Sets the maximum number of entries. The cache is shrunk if needed."
+        if not isinstance(maxsize, int) or maxsize < 0:
+            raise ValueError(f'{maxsize} is not a positive integer!')
+        with self.__lock:
+            self.__maxsize = maxsize
+            while len(self.__data) > maxsize:
+                self.__evict()
+
+    maxsize = property(__get_maxsize, __set_maxsize)
+
+    def get(self, key):
+        """Returns the value associated to key or None. Counts the hits and
+        the misses.
+        """
+        with self.__lock:
+            try:
+                value = self.__data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self.__data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Associates value to key. Evicts the least recently used entry if the
+        cache is full.
+        """
+        with self.__lock:
+            if not self.__maxsize:
+                return
+            self.__data[key] = value
+            self.__data.move_to_end(key)
+            if len(self.__data) > self.__maxsize:
+                self.__evict()
+
+    def __evict(self):
+        "Evicts the least recently used entry."
+        with self.__lock:
+            key, value = self.__data.popitem(last=False)
+            if self.__on_evict is not None:
+                self.__on_evict(key, value)
+
+    def pop(self, key, default=None):
+        """Removes the entry key and returns its value (on_evict is not
+        called).
+        """
+        with self.__lock:
+            return self.__data.pop(key, default)
+
+    def clear(self):
+        """Empties the cache and resets the statistics (on_evict is not
+        called).
+        """
+        with self.__lock:
+            self.__data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Returns the statistics of the cache."""
+        with self.__lock:
+            return {
+                'hits': self.hits, 'misses': self.misses,
+                'size': len(self.__data), 'maxsize': self.__maxsize}
+
+    def __len__(self):
+        return len(self.__data)
+
+    def __contains__(self, key):
+        return key in self.__data
@@ -0,0 +1,291 @@
+#-*- coding: utf-8 -*-
+
+"""This module provides the encoding of rows in the binary format of COPY
+(see Relation.parallel_load with format='binary').
+
+The text format of COPY requires to format and escape each value in Python.
+In the binary format, the values are packed as PostgreSQL receives them
+(the binary wire format of their type). The packing of each column is chosen
+from the fieldtype of the field (see pg_metaview):
+
+    fieldtype                        Python values
+    int2, int4, int8, oid            int
+    float4, float8                   float
+    numeric                          decimal.Decimal, int, float
+    bool                             bool
+    text, varchar, bpchar, name      str
+    json, jsonb                      JSON text (str) or JSON serializable
+    bytea                            bytes
+    date, time, timestamp[tz]        datetime objects or ISO 8601 strings
+    interval                         datetime.timedelta
+    uuid                             uuid.UUID or str
+    arrays of these types            (nested) lists
+
+The naive datetimes of a timestamptz column are in UTC. The other types
+(enums, composite types...) are not supported (see Encoder).
+
+The rows are packed in a buffer (bytearray) owned by the encoder and reused
+from one batch of rows to the next: the encoder is read by COPY as a binary
+file object.
+
+    >>> encoder = Encoder({'id': {'fieldtype': 'int4'}, 'tags': {'fieldtype': '_text'}}, ['id', 'tags'])
+    >>> cursor.copy_expert(
+    ...     'copy tagged (id, tags) from stdin with (format binary)',
+    ...     encoder.load([(1, ['a', 'b']), (2, None)]))
+"""
+
+import datetime
+import decimal
+import functools
+import json
+import operator
+import struct
+import uuid
+
+from half_orm import json_encoders
+
+_SIGNATURE = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+_TRAILER = struct.pack('>h', -1)
+_NULL = struct.pack('>i', -1)
+_LENGTH = struct.Struct('>i')
+_FIELD_COUNT = struct.Struct('>h')
+_EPOCH_DATE = datetime.date(2000, 1, 1)
+_EPOCH = datetime.datetime(2000, 1, 1)
+_EPOCH_TZ = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+def _fixed(fmt, convert=None):
+    """Returns the packer of the values of fixed size with the struct format
+    fmt (the length is packed with the value).
+    """
+    packer = struct.Struct(f'>i{fmt}')
+    size = packer.size - 4
+    if convert is None:
+        return lambda value: packer.pack(size, value)
+    return lambda value: packer.pack(size, convert(value))
+
+def _bytes(value):
+    return _LENGTH.pack(len(value)) + value
+
+def _text(value, encoding):
+    if not isinstance(value, str):
+        value = str(value)
+    data = value.encode(encoding)
+    return _LENGTH.pack(len(data)) + data
+
+def _json(value, encoding):
+    if not isinstance(value, str):
+        value = json.dumps(value, default=json_encoders.default)
+    return _text(value, encoding)
+
+def _jsonb(value, encoding):
+    if not isinstance(value, str):
+        value = json.dumps(value, default=json_encoders.default)
+    data = b'\x01' + value.encode(encoding)
+    return _LENGTH.pack(len(data)) + data
+
+def _date(value):
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value)
+    elif isinstance(value, datetime.datetime):
+        value = value.date()
+    return value.toordinal() - _EPOCH_DATE.toordinal()
+
+def _timestamp(value):
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None)
+    return (value - _EPOCH) // _MICROSECOND
+
+def _timestamptz(value):
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return (value - _EPOCH_TZ) // _MICROSECOND
+
+def _time(value):
+    if isinstance(value, str):
+        value = datetime.time.fromisoformat(value)
+    return ((value.hour * 60 + value.minute) * 60 + value.second) * 1000000 + value.microsecond
+
+_INTERVAL = struct.Struct('>iqii')
+def _interval(value):
+    return _INTERVAL.pack(16, value.seconds * 1000000 + value.microseconds, value.days, 0)
+
+_UUID = struct.Struct('>i16s')
+def _uuid(value):
+    if not isinstance(value, uuid.UUID):
+        value = uuid.UUID(str(value))
+    return _UUID.pack(16, value.bytes)
+
+_NUMERIC_SPECIALS = {'n': 0xC000, 'F': 0xD000, '-F': 0xF000}
+def _numeric(value):
+    """Returns the packed numeric value: number of digits, weight, sign and
+    display scale followed by the digits in base 10000.
+    """
+    if not isinstance(value, decimal.Decimal):
+        value = decimal.Decimal(str(value))
+    if not value.is_finite():
+        special = value.is_nan() and 'n' or f"{value < 0 and '-' or ''}F"
+        return struct.pack('>ihhHh', 8, 0, 0, _NUMERIC_SPECIALS[special], 0)
+    text = str(value)
+    if 'E' in text:
+        text = f'{value:f}'
+    sign = 0
+    if text[0] == '-':
+        sign = 0x4000
+        text = text[1:]
+    integer, _, fraction = text.partition('.')
+    scale = len(fraction)
+    # the digits are aligned on groups of 4 around the decimal point.
+    number = int(f"{integer}{fraction}{'0' * (-scale % 4)}")
+    weight = -(scale + -scale % 4) // 4
+    groups = []
+    while number:
+        number, group = divmod(number, 10000)
+        if group or groups:
+            groups.append(group)
+        else:
+            weight += 1
+    groups.reverse()
+    weight = groups and weight + len(groups) - 1 or 0
+    return struct.pack(
+        f'>ihhHh{len(groups)}h', 8 + 2 * len(groups), len(groups), weight, sign, scale, *groups)
+
+# the packers of the text values (called with the client encoding).
+_ENCODED = {_text, _json, _jsonb}
+
+# fieldtype: (oid, packer of the not None values)
+PACKERS = {
+    'bool': (16, _fixed('?')),
+    'bytea': (17, _bytes),
+    'name': (19, _text),
+    'int8': (20, _fixed('q')),
+    'int2': (21, _fixed('h')),
+    'int4': (23, _fixed('i')),
+    'text': (25, _text),
+    'oid': (26, _fixed('I')),
+    'json': (114, _json),
+    'float4': (700, _fixed('f')),
+    'float8': (701, _fixed('d')),
+    'bpchar': (1042, _text),
+    'varchar': (1043, _text),
+    'date': (1082, _fixed('i', _date)),
+    'time': (1083, _fixed('q', _time)),
+    'timestamp': (1114, _fixed('q', _timestamp)),
+    'timestamptz': (1184, _fixed('q', _timestamptz)),
+    'interval': (1186, _interval),
+    'numeric': (1700, _numeric),
+    'uuid': (2950, _uuid),
+    'jsonb': (3802, _jsonb),
+}
+
+def _array_packer(oid, pack):
+    """Returns the packer of the (nested) lists of elements of type oid
+    packed by pack.
+    """
+    header = struct.Struct('>iii')
+    dimension = struct.Struct('>ii')
+    def pack_array(value):
+        dims = []
+        elements = value
+        while elements and isinstance(elements[0], (list, tuple)):
+            dims.append(len(elements))
+            elements = [elt for sub in elements for elt in sub]
+        if not elements:
+            data = header.pack(0, 0, oid)
+        else:
+            dims.append(len(elements) // functools.reduce(operator.mul, dims, 1))
+            parts = [header.pack(len(dims), None in elements, oid)]
+            parts += [dimension.pack(dim, 1) for dim in dims]
+            parts += [_NULL if elt is None else pack(elt) for elt in elements]
+            data = b''.join(parts)
+        return _LENGTH.pack(len(data)) + data
+    return pack_array
+
+def packer(metadata, encoding='utf-8'):
+    """Returns the packer of the (not None) values of the field described by
+    the metadata, or None if its type is not supported. The text values are
+    encoded with encoding (Python codec of the client encoding).
+    """
+    fieldtype = metadata['fieldtype']
+    entry = PACKERS.get(fieldtype.lstrip('_'))
+    if entry is None:
+        return None
+    oid, pack = entry
+    if pack in _ENCODED:
+        pack = functools.partial(pack, encoding=encoding)
+    if fieldtype.startswith('_'):
+        return _array_packer(oid, pack)
+    return pack
+
+def _compile(packers):
+    """Returns the function returning the packed row (field count and values)
+    with the columns packed by packers.
+    """
+    namespace = {'count': _FIELD_COUNT.pack(len(packers)), 'null': _NULL, 'join': b''.join}
+    values = []
+    for idx, pack in enumerate(packers):
+        namespace[f'p{idx}'] = pack
+        values.append(f'null if v{idx} is None else p{idx}(v{idx})')
+    source = '\n'.join([
+        'def pack_row(row):',
+        f"    {''.join(f'v{idx}, ' for idx in range(len(packers)))}= row",
+        f"    return join((count, {', '.join(values)}))"])
+    exec(source, namespace) #pylint: disable=exec-used
+    return namespace['pack_row']
+
+class Encoder:
+    """Encodes rows (sequences of values in the order of the columns) in the
+    binary format of COPY in a reusable buffer. The encoder is read as a
+    binary file object (read).
+
+    Raises a ValueError if the type of a column is not supported.
+    """
+    def __init__(self, fields_metadata, columns, encoding='utf-8'):
+        self.__packers = [packer(fields_metadata[name], encoding) for name in columns]
+        unsupported = [
+            f"{name} ({fields_metadata[name]['fieldtype']})"
+            for name, pack in zip(columns, self.__packers) if pack is None]
+        if unsupported:
+            raise ValueError(f"Binary COPY doesn't support {', '.join(unsupported)}!")
+        self.__pack_row = _compile(self.__packers)
+        self.__buffer = bytearray(_SIGNATURE)
+        self.__size = 0
+        self.__position = 0
+
+    def load(self, rows):
+        """Packs the rows in the buffer (signature, rows and trailer),
+        replacing its content. Returns self.
+        """
+        # the content is overwritten: the buffer only grows.
+        buffer = self.__buffer
+        pack_row = self.__pack_row
+        start = len(_SIGNATURE)
+        for row in rows:
+            data = pack_row(row)
+            end = start + len(data)
+            buffer[start:end] = data
+            start = end
+        buffer[start:start + 2] = _TRAILER
+        self.__size = start + 2
+        self.__position = 0
+        return self
+
+    def read(self, size=-1):
+        "Returns at most size bytes of the buffer (file object interface)."
+        start = self.__position
+        end = self.__size
+        if size is not None and size >= 0:
+            end = min(end, start + size)
+        with memoryview(self.__buffer) as view:
+            data = bytes(view[start:end])
+        self.__position = end
+        return data
+
+    def getvalue(self):
+        "Returns the content of the buffer."
+        with memoryview(self.__buffer) as view:
+            return bytes(view[:self.__size])
@@ -0,0 +1,335 @@
+#-*- coding: utf-8 -*-
+
+"""This module provides the DiskCache class.
+
+The disk cache stores the results of Relation.select_columns and
+Relation.to_json in a local directory shared by the processes of the host.
+It is meant for the expensive analytical queries: a process maps the file
+written by another one instead of querying Postgres again.
+
+An entry is keyed by the fingerprint of the query (its SQL text with its
+values) and by a change marker of the relations read (see
+Model._change_marker): when a relation is changed, the marker changes and
+the entry is no longer used. The marker relies on the statistics of
+Postgres. They are flushed by the backends with a delay (at most every
+second, up to 10 seconds after the last query of an idle connection), so a
+change made by another connection can be seen with this delay. The entries depending
+on a relation changed by half_orm in the process are removed at once (see
+Model._relation_changed).
+
+An entry is a directory with a manifest (manifest.json) and a file per column:
+- int, float and bool columns are stored as native arrays (q, d and ?
+  formats). The columns are mapped (mmap) and returned as zero-copy
+  memoryviews (column.values),
+- str columns are stored as UTF-8 with an array of offsets,
+- the other values (dates, decimals, uuids, arrays, json...) are stored as
+  tagged text and converted back on access. A result with values of other
+  types (inet, ranges...) is not cached,
+- a column with NULL values has a null mask.
+
+The directory is set in the database section of the connection file or at
+runtime. The cache is disabled if it is not set:
+
+    [database]
+    ...
+    disk_cache_dir = /var/cache/half_orm
+
+The files are not encrypted: the directory must only be readable by the
+processes allowed to read the data.
+"""
+
+import datetime
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import uuid
+from array import array
+from collections.abc import Sequence
+from decimal import Decimal
+
+MANIFEST = 'manifest.json'
+INT64 = (-2 ** 63, 2 ** 63 - 1)
+
+def _tag(value):
+    """Returns the tagged text representation of value. Raises a TypeError if
+    the value can't be converted back (inet, ranges...).
+    """
+    if isinstance(value, bool):
+        return f'b{int(value)}'
+    if isinstance(value, int):
+        return f'i{value}'
+    if isinstance(value, float):
+        return f'f{value!r}'
+    if isinstance(value, datetime.datetime):
+        return f'T{value.isoformat()}'
+    if isinstance(value, datetime.date):
+        return f'D{value.isoformat()}'
+    if isinstance(value, datetime.time):
+        return f't{value.isoformat()}'
+    if isinstance(value, datetime.timedelta):
+        return f'I{value.total_seconds()!r}'
+    if isinstance(value, Decimal):
+        return f'N{value}'
+    if isinstance(value, uuid.UUID):
+        return f'U{value}'
+    if isinstance(value, (bytes, memoryview)):
+        return f'Y{bytes(value).hex()}'
+    if isinstance(value, list):
+        # arrays: the elements are tagged one by one.
+        return f'L{json.dumps([None if elt is None else _tag(elt) for elt in value])}'
+    if isinstance(value, dict):
+        return f'J{json.dumps(value)}'
+    if isinstance(value, str):
+        return f's{value}'
+    raise TypeError(f"Can't store a value of type {type(value).__name__} in the disk cache")
+
+UNTAG = {
+    'b': lambda text: text == '1',
+    'i': int,
+    'f': float,
+    'T': datetime.datetime.fromisoformat,
+    'D': datetime.date.fromisoformat,
+    't': datetime.time.fromisoformat,
+    'I': lambda text: datetime.timedelta(seconds=float(text)),
+    'N': Decimal,
+    'U': uuid.UUID,
+    'Y': bytes.fromhex,
+    'J': json.loads,
+    'L': lambda text: [None if elt is None else _untag(elt) for elt in json.loads(text)],
+    's': str,
+}
+
+def _untag(text):
+    "Returns the value represented by the tagged text."
+    return UNTAG[text[0]](text[1:])
+
+def _encoding(values):
+    """Returns the encoding of a column: 'q', 'd', '?', 'text' or 'tagged'."""
+    types = {type(value) for value in values if value is not None}
+    if types == {bool}:
+        return '?'
+    if types == {int} and all(
+            INT64[0] <= value <= INT64[1] for value in values if value is not None):
+        return 'q'
+    if types == {float}:
+        return 'd'
+    if types == {str}:
+        return 'text'
+    return types and 'tagged' or 'q'
+
+def _write_column(path, values):
+    """Writes the column values in the files path.*. Returns the description
+    of the column for the manifest.
+    """
+    encoding = _encoding(values)
+    nulls = None in values
+    if nulls:
+        with open(f'{path}.nulls', 'wb') as file_:
+            file_.write(bytes(value is None for value in values))
+    if encoding in {'q', 'd', '?'}:
+        default = {'q': 0, 'd': 0., '?': False}[encoding]
+        values = [default if value is None else value for value in values]
+        with open(f'{path}.values', 'wb') as file_:
+            if encoding == '?':
+                file_.write(bytes(values))
+            else:
+                file_.write(array(encoding, values).tobytes())
+        return {'encoding': encoding, 'nulls': nulls}
+    encode = encoding == 'text' and str or _tag
+    offsets = array('q', [0])
+    with open(f'{path}.values', 'wb') as file_:
+        for value in values:
+            if value is not None:
+                offsets.append(offsets[-1] + file_.write(encode(value).encode('utf-8')))
+            else:
+                offsets.append(offsets[-1])
+    with open(f'{path}.offsets', 'wb') as file_:
+        file_.write(offsets.tobytes())
+    return {'encoding': encoding, 'nulls': nulls}
+
+def _map(path):
+    "Returns a read only memoryview on the file path (mmap)."
+    with open(path, 'rb') as file_:
+        if not os.fstat(file_.fileno()).st_size:
+            return memoryview(b'')
+        return memoryview(mmap.mmap(file_.fileno(), 0, access=mmap.ACCESS_READ))
+
+class Column(Sequence):
+    """A column of a cached result mapped in memory.
+
+    values is the memoryview of the values for the int ('q'), float ('d')
+    and bool ('?') columns (the NULL values are 0, 0. and False: see nulls).
+    nulls is the memoryview of the null mask (None if there is no NULL).
+    """
+    def __init__(self, path, length, encoding, nulls):
+        self.__length = length
+        self.encoding = encoding
+        self.nulls = nulls and _map(f'{path}.nulls') or None
+        self.values = _map(f'{path}.values')
+        self.__offsets = None
+        self.__decode = None
+        if encoding in {'q', 'd', '?'}:
+            self.values = self.values.cast(encoding)
+        else:
+            self.__offsets = _map(f'{path}.offsets').cast('q')
+            self.__decode = encoding == 'text' and bytes.decode or (
+                lambda data: _untag(data.decode()))
+
+    def __len__(self):
+        return self.__length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[idx] for idx in range(*index.indices(self.__length))]
+        if index < 0:
+            index += self.__length
+        if not 0 <= index < self.__length:
+            raise IndexError('column index out of range')
+        if self.nulls is not None and self.nulls[index]:
+            return None
+        if self.__offsets is None:
+            return self.values[index]
+        return self.__decode(bytes(self.values[self.__offsets[index]:self.__offsets[index + 1]]))
+
+class DiskCache:
+    """Cache of the query results in the directory (see the module
+    documentation). The cache is disabled if directory is None.
+    """
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        "Returns True if the directory of the cache is set."
+        return self.directory is not None
+
+    @staticmethod
+    def fingerprint(*parts):
+        """Returns the fingerprint of a query (the hash of the parts)."""
+        hash_ = hashlib.sha256()
+        for part in parts:
+            hash_.update(part if isinstance(part, bytes) else repr(part).encode())
+            hash_.update(b'\0')
+        return hash_.hexdigest()[:32]
+
+    def __path(self, fingerprint, marker):
+        "Returns the path of the entry."
+        return os.path.join(self.directory, f'{fingerprint}-{marker}')
+
+    def __read_manifest(self, path, kind):
+        "Returns the manifest of the entry at path or None."
+        try:
+            with open(os.path.join(path, MANIFEST), encoding='utf-8') as file_:
+                manifest = json.load(file_)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        if manifest['kind'] != kind:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return manifest
+
+    def __write(self, fingerprint, marker, manifest, write):
+        """Writes the entry in a temporary directory (write(directory)) then
+        renames it (atomic). The entries of the same fingerprint with another
+        marker are removed.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        try:
+            write(tmp)
+            with open(os.path.join(tmp, MANIFEST), 'w', encoding='utf-8') as file_:
+                json.dump(manifest, file_)
+            os.rename(tmp, self.__path(fingerprint, marker))
+        except TypeError:
+            # a value can't be stored (see _tag): the result is not cached.
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        except OSError:
+            # written by another process in the meantime.
+            shutil.rmtree(tmp, ignore_errors=True)
+        for entry in os.listdir(self.directory):
+            if entry.startswith(f'{fingerprint}-') and entry != f'{fingerprint}-{marker}':
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+    def invalidate(self, relations):
+        """Removes the entries depending on one of the relations (set of
+        sfqrn).
+        """
+        relations = {tuple(sfqrn) for sfqrn in relations}
+        for entry in self.__entries():
+            path = os.path.join(self.directory, entry)
+            try:
+                with open(os.path.join(path, MANIFEST), encoding='utf-8') as file_:
+                    manifest = json.load(file_)
+            except (OSError, ValueError):
+                continue
+            if relations & {tuple(sfqrn) for sfqrn in manifest['relations']}:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def __entries(self):
+        "Returns the names of the entries in the directory."
+        if not (self.directory and os.path.isdir(self.directory)):
+            return []
+        return [entry for entry in os.listdir(self.directory) if entry[0] != '.']
+
+    def get_columns(self, fingerprint, marker):
+        """Returns the columns {name: Column} of the entry or None."""
+        path = self.__path(fingerprint, marker)
+        manifest = self.__read_manifest(path, 'columns')
+        if manifest is None:
+            return None
+        return {
+            column['name']: Column(
+                os.path.join(path, str(idx)), manifest['rows'],
+                column['encoding'], column['nulls'])
+            for idx, column in enumerate(manifest['columns'])}
+
+    def put_columns(self, fingerprint, marker, columns, relations):
+        """Stores the columns {name: list of values} of a query reading the
+        relations (set of sfqrn).
+        """
+        manifest = {
+            'kind': 'columns', 'relations': sorted(relations), 'rows': 0, 'columns': []}
+        def write(directory):
+            "Writes the columns files."
+            for idx, (name, values) in enumerate(columns.items()):
+                manifest['rows'] = len(values)
+                description = _write_column(os.path.join(directory, str(idx)), values)
+                manifest['columns'].append({'name': name, **description})
+        self.__write(fingerprint, marker, manifest, write)
+
+    def get_text(self, fingerprint, marker):
+        """Returns the text stored in the entry or None."""
+        path = self.__path(fingerprint, marker)
+        if self.__read_manifest(path, 'text') is None:
+            return None
+        return bytes(_map(os.path.join(path, 'text'))).decode('utf-8')
+
+    def put_text(self, fingerprint, marker, text, relations):
+        """Stores a text (a JSON document) built by reading the relations
+        (set of sfqrn).
+        """
+        def write(directory):
+            "Writes the text file."
+            with open(os.path.join(directory, 'text'), 'wb') as file_:
+                file_.write(text.encode('utf-8'))
+        self.__write(
+            fingerprint, marker, {'kind': 'text', 'relations': sorted(relations)}, write)
+
+    def clear(self):
+        """Removes all the entries."""
+        for entry in self.__entries():
+            shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+    def stats(self):
+        """Returns the statistics of the cache."""
+        return {
+            'directory': self.directory, 'hits': self.hits, 'misses': self.misses,
+            'entries': len(self.__entries())}
@@ -53,16 +53,15 @@ class Field():
     def __str__(self):
         return str(self.__value)
 
-    def _praf(self, query, id_):
-        """Returns field_name prefixed with relation alias if the query is
+    def _praf(self, query, alias):
+        """Returns field_name prefixed with the relation alias if the query is
         select. Otherwise, returns the field name quoted with ".
         """
-        id_ = f'r{id_}'
         if query == 'select':
-            return f'{id_}."{self.__name}"'
+            return f'{alias}."{self.__name}"'
         return f'"{self.__name}"'
 
-    def where_repr(self, query, id_):
+    def where_repr(self, query, alias):
         """Returns the SQL representation of the field for the where clause
         """
         where_repr = ''
@@ -76,11 +75,24 @@ class Field():
                 if comp == '@@':
                     comp_str = 'any(websearch_to_tsquery(%s))'
         if not self.unaccent:
-            where_repr = f"{self._praf(query, id_)} {comp} {comp_str}"
+            where_repr = f"{self._praf(query, alias)} {comp} {comp_str}"
         else:
-            where_repr = f"unaccent({self._praf(query, id_)}) {comp} unaccent({comp_str})"
+            where_repr = f"unaccent({self._praf(query, alias)}) {comp} unaccent({comp_str})"
         return where_repr
 
+    def _shape(self):
+        """Returns what determines the SQL text of where_repr (the value is
+        excluded). Used as a part of the key of the compiled queries cache.
+        """
+        is_list = isinstance(self.__value, (list, tuple)) and self.type_[0] != '_'
+        return (self.__name, self.comp(), self.__unaccent, is_list)
+
+    def _intent(self):
+        """Returns the tuple (name, comparator, value, unaccent) describing the
+        constraint on the field (see half_orm.intent).
+        """
+        return (self.__name, self.__comp, self.__value, self.__unaccent)
+
     @property
     def value(self):
         "Returns the value of the field object"
@@ -3,6 +3,9 @@
 
 """This module provides the FKey class."""
 
+from half_orm import sql
+from half_orm.identity_map import IdentityMap
+
 class FKey:
     """Foreign key class
 
@@ -32,11 +35,18 @@ class FKey:
         """Returns the relation on which the fkey is defined.
         If model._scope is set, instanciate the class from the scoped module.
         Uses the __cast if it is set.
+
+        In the scope of an identity map, the foreign key of a singleton is
+        followed with the values of its fields (see half_orm.identity_map).
         """
         model = self.__relation._model
         f_qrn = self.__get_fk_qrn()
         f_cast = None
         get_rel = model._import_class  if model._scope else model.get_relation_class
+        if not kwargs and IdentityMap.current() is not None:
+            constraint = self.__singleton_constraint()
+            if constraint is not None:
+                return get_rel(__cast__ or f_qrn)(**constraint)
         if self.__name.find('_reverse_fkey_') == 0 and __cast__:
             self.__relation = get_rel(__cast__)(**self.__relation.to_dict())
         else:
@@ -50,6 +60,20 @@ class FKey:
         f_relation._fkeys[rev_fkey_name].set(self.__relation)
         return f_relation
 
+    def __singleton_constraint(self):
+        """Returns the constraint {field name: value} on the relation pointed to
+        that is equivalent to the join if the relation is a singleton (see
+        Relation.get) with the fields of the foreign key set. Returns None
+        otherwise or for a reverse foreign key.
+        """
+        relation = self.__relation
+        if self.__name.find('_reverse_') == 0 or not relation._is_singleton:
+            return None
+        fields = [relation._fields[name] for name in self.__fields_names]
+        if not all(field.is_set() and field.comp() == '=' for field in fields):
+            return None
+        return {name: field.value for name, field in zip(self.__fk_names, fields)}
+
     def set(self, to_):
         """Sets the relation associated to the foreign key."""
         self.__set__(self.__relation, to_)
@@ -101,17 +125,20 @@ class FKey:
     def confdeltype(self):
         return self.__confdeltype
 
-    def _join_query(self, orig_rel):
-        """Returns the join_query, join_values of a foreign key.
+    def _join_query(self, orig_rel, aliases):
+        """Returns the join_query of a foreign key.
         fkey interface: frel, from_, to_, fields, fk_names
+
+        The relations are aliased with their position in aliases (see
+        sql.alias).
         """
         from_ = self.__fk_from
         to_ = self.to_
         if id(from_) == id(to_):
             raise RuntimeError("You can't join a relation with itself!")
-        orig_rel_id = f'r{orig_rel.id_}'
-        to_id = f'r{to_.id_}'
-        from_id = f'r{from_.id_}'
+        orig_rel_id = sql.alias(aliases, orig_rel.id_)
+        to_id = sql.alias(aliases, to_.id_)
+        from_id = sql.alias(aliases, from_.id_)
         if to_._qrn == orig_rel._qrn:
             to_id = orig_rel_id
         if from_._qrn == orig_rel._qrn:
@@ -121,6 +148,23 @@ class FKey:
         bounds = " and ".join([f'{a} = {b}' for a, b in zip(to_fields, from_fields)])
         return f"({bounds})"
 
+    def _shape(self, aliases):
+        """Returns what determines the SQL text of _join_query. aliases is the
+        dictionary {relation id_: position} of the relations already walked.
+        """
+        from_ = self.__fk_from
+        to_ = self.to_
+        return (
+            tuple(self.__fields), tuple(self.fk_names),
+            aliases.setdefault(from_.id_, len(aliases)), from_._qrn,
+            aliases.setdefault(to_.id_, len(aliases)), to_._qrn, from_ is to_)
+
+    def _intent(self):
+        """Returns the triple (name, fk_names, names) describing the foreign
+        key (see half_orm.intent).
+        """
+        return self.__name, tuple(self.__fk_names), tuple(self.__fields_names)
+
     def _prep_select(self):
         if self.__is_set:
             return self.__fields, self.to_._prep_select(*self.fk_names)
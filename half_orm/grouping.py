@@ -0,0 +1,211 @@
+#-*- coding: utf-8 -*-
+
+"""This module provides the grouping engine of Relation.group_by.
+
+The YAML directive describes the structure of the result. The keys that are
+fields of the relation are copied in the elements under the name given as
+value. The other keys are groups: their value is the directive of the
+elements grouped under this key, in a list ([directive]) or in a dictionary
+(directive):
+
+    title: post_title
+    comments:
+      - content: text
+        author: name
+
+The directive is compiled once (compile_directive keeps the last directives
+compiled). The rows are then read one by one: the elements of a list are
+found by the tuple of the values of their fields in a dictionary (one
+dictionary per list), so the cost is linear in the number of rows.
+
+The grouping can also be done by PostgreSQL (see to_sql and Relation.to_json
+with in_database): the directive is compiled in a query returning the JSON
+document.
+"""
+
+from operator import itemgetter
+
+import yaml
+
+from half_orm import relation_errors
+from half_orm.cache import LRUCache
+
+_DIRECTIVES = LRUCache(256)
+
+class Directive:
+    """A compiled directive.
+
+    - fields is the tuple of the pairs (field name, name in the element),
+    - groups is the tuple of the triples (group name, is a list, Directive).
+    """
+    __slots__ = ('fields', 'names', 'groups', 'values')
+    def __init__(self, fields, groups):
+        self.fields = fields
+        self.names = tuple(name for _, name in fields)
+        self.groups = groups
+        # returns the tuple of the values of the fields of a row.
+        self.values = lambda row: ()
+        if len(fields) == 1:
+            getter = itemgetter(fields[0][0])
+            self.values = lambda row: (getter(row),)
+        elif fields:
+            self.values = itemgetter(*(field for field, _ in fields))
+
+def _compile(directive, fields):
+    "Returns the Directive compiled from the directive loaded."
+    if isinstance(directive, list):
+        directive = directive[0]
+    if not isinstance(directive, dict):
+        raise ValueError(f'Invalid directive: {directive}')
+    own_fields = []
+    groups = []
+    for key, value in directive.items():
+        if key in fields:
+            own_fields.append((key, value))
+        elif isinstance(value, (list, dict)):
+            groups.append((key, isinstance(value, list), _compile(value, fields)))
+        else:
+            raise relation_errors.UnknownAttributeError(key)
+    return Directive(tuple(own_fields), tuple(groups))
+
+def compile_directive(yml_directive, fields):
+    """Returns the Directive compiled from the YAML directive for a relation
+    with the fields (tuple of the fields names).
+    """
+    key = (yml_directive, fields)
+    directive = _DIRECTIVES.get(key)
+    if directive is None:
+        directive = _compile(yaml.safe_load(yml_directive), frozenset(fields))
+        _DIRECTIVES.put(key, directive)
+    return directive
+
+def _feed(directive, group, row):
+    """Adds the row to the group [container, index, is a list] of the
+    elements of the directive. index is the dictionary {key: (element,
+    groups)} of the elements of the container.
+    """
+    container, index, is_list = group
+    values = directive.values(row)
+    if is_list:
+        key = values
+        try:
+            entry = index.get(key)
+        except TypeError:
+            # unhashable values (json, arrays)
+            key = repr(values)
+            entry = index.get(key)
+        if entry is None:
+            element = dict(zip(directive.names, values))
+            container.append(element)
+            entry = index[key] = (element, {})
+    else:
+        entry = index.get(None)
+        if entry is None:
+            entry = index[None] = (container, {})
+        if values:
+            container.update(zip(directive.names, values))
+    element, groups = entry
+    for name, group_is_list, group_directive in directive.groups:
+        group = groups.get(name)
+        if group is None:
+            group = groups[name] = [[] if group_is_list else {}, {}, group_is_list]
+            element[name] = group[0]
+        _feed(group_directive, group, row)
+
+def group(directive, rows):
+    """Returns the result of the grouping of the rows (iterable of
+    dictionaries) according to the compiled directive.
+    """
+    result = [{}, {}, False]
+    for row in rows:
+        _feed(directive, result, row)
+    return result[0]
+
+def _quote(name):
+    "Returns the SQL identifier of name (% escaped for psycopg2)."
+    return '"{}"'.format(str(name).replace('"', '""').replace('%', '%%'))
+
+def _literal(name):
+    "Returns the SQL string literal of name (% escaped for psycopg2)."
+    return "'{}'".format(str(name).replace("'", "''").replace('%', '%%'))
+
+def _node_sql(directive, key, is_list, ctes):
+    """Adds to ctes the CTE aggregating the elements of the directive by key
+    (the fields identifying the parent element). Returns its name. The CTE
+    has the columns key and v (the JSON list or object of the elements).
+    """
+    own = [field for field, _ in directive.fields]
+    element_key = key
+    values = []
+    if is_list:
+        element_key = key + tuple(field for field in own if field not in key)
+        what = [_quote(field) for field in element_key]
+        values = [f'e.{_quote(field)}' for field in own]
+    else:
+        what = [_quote(field) for field in key]
+        for idx, field in enumerate(own):
+            what.append(f'(array_agg({_quote(field)} order by half_orm_n desc))[1] as f{idx}')
+            values.append(f'e.f{idx}')
+    what.append('min(half_orm_n) as half_orm_n')
+    elements = f"select {', '.join(what)} from b"
+    if element_key:
+        elements += f" group by {', '.join(_quote(field) for field in element_key)}"
+    else:
+        elements += ' having count(*) > 0'
+    joins = []
+    for idx, (name, group_is_list, group_directive) in enumerate(directive.groups):
+        group = _node_sql(group_directive, element_key, group_is_list, ctes)
+        bounds = ' and '.join(
+            f'e.{_quote(field)} is not distinct from g{idx}.{_quote(field)}'
+            for field in element_key) or 'true'
+        joins.append(f'left join {group} as g{idx} on {bounds}')
+        values.append(f"coalesce(g{idx}.v, '{group_is_list and '[]' or '{}'}')")
+    pairs = ', '.join(
+        f'{_literal(name)}, {value}'
+        for name, value in zip(directive.names + tuple(elt[0] for elt in directive.groups), values))
+    element = f'json_build_object({pairs})'
+    columns = [f'e.{_quote(field)}' for field in key]
+    if is_list:
+        columns.append(f'json_agg({element} order by e.half_orm_n) as v')
+    else:
+        columns.append(f'{element} as v')
+    name = f't{len(ctes)}'
+    query = f"{name} as (\n  select {', '.join(columns)}\n  from ({elements}) as e"
+    query += ''.join(f'\n    {join}' for join in joins)
+    if is_list and key:
+        query += f"\n  group by {', '.join(f'e.{_quote(field)}' for field in key)}"
+    ctes.append(f'{query}\n)')
+    return name
+
+def _directive_fields(directive):
+    "Returns the list of the fields of the directive and of its groups."
+    fields = [field for field, _ in directive.fields]
+    for _, _, group_directive in directive.groups:
+        fields += _directive_fields(group_directive)
+    return list(dict.fromkeys(fields))
+
+def to_sql(directive, query, casts=None, order_by=None):
+    """Returns the SQL query computing in PostgreSQL the result of the
+    grouping of the rows returned by query according to the directive. The
+    query returns one row with one column (json): the JSON document (text).
+
+    The lists are built with json_agg, the objects with json_build_object. The
+    elements of a list are in the order of their first row in the result of
+    query, numbered in the order order_by (the order by clause of query) or
+    of the fields of the directive. The values of an object (dict directive)
+    are taken from the last row, as in group.
+
+    casts is the dictionary {field: cast} of the fields that can't be grouped
+    as they are: the json values have no equality operator ('::jsonb').
+    """
+    casts = casts or {}
+    fields = _directive_fields(directive)
+    values = [f'q.{_quote(field)}{casts.get(field, "")}' for field in fields]
+    order_by = order_by or ', '.join(values)
+    columns = [f'{value} as {_quote(field)}' for field, value in zip(fields, values)]
+    columns.append(
+        f"row_number() over ({order_by and f'order by {order_by}' or ''}) as half_orm_n")
+    ctes = [f"b as (select {', '.join(columns)} from ({query}) as q)"]
+    top = _node_sql(directive, (), False, ctes)
+    ctes = ',\n'.join(ctes)
+    return f"with {ctes}\nselect coalesce((select v::text from {top}), '{{}}') as json"
@@ -0,0 +1,91 @@
+#-*- coding: utf-8 -*-
+
+"""This module provides the IdentityMap class.
+
+An identity map keeps the objects returned by Relation.get in a scope (a web
+request for instance). Inside the scope, a get on the primary key of an
+object already loaded returns the same object without querying the database:
+
+    >>> with IdentityMap():
+    ...     author = post.author_.get()     # query
+    ...     author = comment.author_.get()  # same object, no query
+
+The foreign keys of a singleton (an object returned by get) are then
+followed with the values of its fields, so that post.author_.get() is a
+lookup on the primary key of the author.
+
+The map is bound to the current context (contextvars): each thread and each
+asyncio task has its own scope. An insert, update or delete made by half_orm
+in the scope removes the objects of the relations it may modify (see
+Model._dependent_relations). The map is emptied when a transaction is rolled
+back. The changes made by other connections are not seen inside the scope.
+
+The Relation classes also give access to the class: Relation.IdentityMap.
+"""
+
+from contextvars import ContextVar
+
+_CURRENT = ContextVar('half_orm_identity_map', default=None)
+
+class IdentityMap:
+    """Context manager binding an identity map to the current context. The
+    scopes can be nested: the inner scope has its own map.
+    """
+    def __init__(self):
+        self.__objects = {}
+        self.__tokens = []
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        self.__tokens.append(_CURRENT.set(self))
+        return self
+
+    def __exit__(self, *exc):
+        _CURRENT.reset(self.__tokens.pop())
+        if not self.__tokens:
+            self.clear()
+
+    @staticmethod
+    def current():
+        """Returns the identity map of the current context or None."""
+        return _CURRENT.get()
+
+    def get(self, key):
+        """Returns the object stored for key (relation class, primary key
+        values) or None.
+        """
+        try:
+            obj = self.__objects.get(key)
+        except TypeError:
+            # unhashable primary key
+            obj = None
+        if obj is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return obj
+
+    def put(self, key, obj):
+        """Stores obj under key (relation class, primary key values)."""
+        try:
+            self.__objects[key] = obj
+        except TypeError:
+            # unhashable primary key
+            pass
+
+    def invalidate(self, relations):
+        """Removes the objects of the relations (set of sfqrn)."""
+        for key in [key for key in self.__objects if getattr(key[0], '__sfqrn') in relations]:
+            del self.__objects[key]
+
+    def clear(self):
+        """Removes all the objects."""
+        self.__objects.clear()
+
+    def __len__(self):
+        return len(self.__objects)
+
+    def stats(self):
+        """Returns the statistics of the map."""
+        return {'size': len(self.__objects), 'hits': self.hits, 'misses': self.misses}
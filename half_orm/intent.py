@@ -0,0 +1,87 @@
+#-*- coding: utf-8 -*-
+
+"""This module provides the Intent class: the description of a relation
+object (see Relation.to_intent and Relation.from_intent).
+
+A relation object holds a cursor and references between its fields, its
+foreign keys and the relations it is joined to. It can't be pickled. Its
+intent is made of tuples of plain values: it can be pickled, sent to a pool
+of processes and used as a key in a cache.
+
+The intent is the graph of the relations walked through the foreign keys:
+
+- nodes: one tuple (sfqrn, only, where, select parameters) by relation.
+  where is the tree of the constraints:
+    ('fields', neg, ((field name, comparator, value, unaccent), ...))
+    ('op', neg, operator, left where, right where)
+- edges: one tuple (from node, foreign key name, reverse, to node) by
+  foreign key set. reverse is None or, for the reverse foreign keys built
+  by following a foreign key (FKey.__call__), the pair (fk_names, names).
+
+The digest of the intent is computed from a canonical text representation
+of the intent. It doesn't depend on the process (unlike the hash of str):
+
+    >>> intent = Person(last_name=('like', 'a%')).to_intent()
+    >>> intent.digest
+    'a1f0...'
+    >>> Person.from_intent(pickle.loads(pickle.dumps(intent))).count()
+    10
+"""
+
+import hashlib
+import json
+
+from half_orm.null import NULL
+
+def _canonical(obj):
+    """Returns the canonical text representation of obj. The type of a value
+    is part of its representation: 1, 1.0, True and '1' differ.
+    """
+    if obj is None:
+        return 'z'
+    if obj is NULL:
+        return 'n'
+    if isinstance(obj, str):
+        return f's{json.dumps(obj)}'
+    if isinstance(obj, tuple):
+        return f"({','.join(_canonical(elt) for elt in obj)})"
+    if isinstance(obj, list):
+        return f"[{','.join(_canonical(elt) for elt in obj)}]"
+    if isinstance(obj, dict):
+        items = sorted(f'{_canonical(key)}:{_canonical(value)}' for key, value in obj.items())
+        return f"{{{','.join(items)}}}"
+    if isinstance(obj, bool):
+        return f'b{int(obj)}'
+    if isinstance(obj, int):
+        return f'i{obj}'
+    if isinstance(obj, float):
+        return f'f{obj!r}'
+    if isinstance(obj, (bytes, memoryview)):
+        return f'y{bytes(obj).hex()}'
+    # dates, decimals, uuids...: their str is stable.
+    return f'o{type(obj).__qualname__}:{obj}'
+
+class Intent:
+    """The description of a relation object (see the module documentation)."""
+    __slots__ = ('nodes', 'edges', 'digest')
+    def __init__(self, nodes, edges):
+        self.nodes = nodes
+        self.edges = edges
+        self.digest = hashlib.sha256(
+            _canonical((nodes, edges)).encode('utf-8')).hexdigest()[:32]
+
+    def __getstate__(self):
+        return self.nodes, self.edges
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __eq__(self, other):
+        return isinstance(other, Intent) and self.digest == other.digest
+
+    def __hash__(self):
+        return int(self.digest[:16], 16)
+
+    def __repr__(self):
+        sfqrn = self.nodes[0][0]
+        return f'<Intent {sfqrn[1]}.{sfqrn[2]} {self.digest}>'
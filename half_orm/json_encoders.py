@@ -0,0 +1,175 @@
+#-*- coding: utf-8 -*-
+
+"""This module provides the JSON encoding of the rows of a relation.
+
+The type of each field is known from the metadata of the relation, so the
+conversion of each column is chosen once, when the class of the relation is
+built (encoder_table). For a given set of columns, the conversions are then
+compiled in a function returning the JSON text of a row (row_encoder)
+instead of letting json.dumps call its default handler on every value that
+is not JSON serializable:
+
+    fieldtype                           JSON
+    text, varchar, bpchar, name         string
+    int2, int4, int8, oid               number
+    bool                                true/false
+    date, time[tz], timestamp[tz]       ISO 8601 string
+    uuid                                string
+    numeric                             number (exact)
+    interval                            number of seconds
+
+The other columns (arrays, json...) are serialized by json.dumps with the
+default handler. The text is the one of json.dumps with its default
+parameters.
+
+A faster JSON backend can be plugged in with set_backend. It is called as
+dumps(obj, default=default) and returns a str or bytes. The rows are then
+passed as they are to the backend (orjson serializes the dates and the
+uuids natively):
+
+    >>> import orjson
+    >>> from half_orm import json_encoders
+    >>> json_encoders.set_backend(orjson.dumps)
+"""
+
+import datetime
+import decimal
+import json
+from json.encoder import encode_basestring_ascii
+import uuid
+
+from half_orm.cache import LRUCache
+
+_ROW_ENCODERS = LRUCache(256)
+_BACKEND = None
+
+def default(obj):
+    """Default handler of json.dumps for the values that are not JSON
+    serializable.
+    """
+    if hasattr(obj, 'isoformat'):
+        return str(obj.isoformat())
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, datetime.timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError(
+        f'Object of type {type(obj)} with value of {repr(obj)} is not JSON serializable')
+
+def _generic(value):
+    return json.dumps(value, default=default)
+
+def _bool(value):
+    return value and 'true' or 'false'
+
+def _isoformat(value):
+    return f'"{value.isoformat()}"'
+
+def _uuid(value):
+    return f'"{value}"'
+
+def _numeric(value):
+    if value.is_finite():
+        return str(value)
+    return _generic(float(value))
+
+def _interval(value):
+    return repr(value.total_seconds())
+
+_TEXT = encode_basestring_ascii
+_INTEGER = int.__repr__
+
+ENCODERS = {
+    'text': _TEXT,
+    'varchar': _TEXT,
+    'bpchar': _TEXT,
+    'name': _TEXT,
+    'int2': _INTEGER,
+    'int4': _INTEGER,
+    'int8': _INTEGER,
+    'oid': _INTEGER,
+    'bool': _bool,
+    'date': _isoformat,
+    'time': _isoformat,
+    'timetz': _isoformat,
+    'timestamp': _isoformat,
+    'timestamptz': _isoformat,
+    'uuid': _uuid,
+    'numeric': _numeric,
+    'interval': _interval,
+}
+
+def encoder_table(fields_metadata):
+    """Returns the dictionary {field name: encoder} from the metadata of the
+    fields of a relation. An encoder returns the JSON text of a (not None)
+    value. The arrays have no encoder.
+    """
+    table = {}
+    for name, metadata in fields_metadata.items():
+        encoder = ENCODERS.get(metadata['fieldtype'])
+        if encoder is not None and not metadata.get('fielddim'):
+            table[name] = encoder
+    return table
+
+def _compile(encoders):
+    """Returns the function returning the JSON text of a row with the columns
+    [(name, encoder), ...]. The source only references the names of the
+    namespace (the columns names are not in the source).
+    """
+    namespace = {}
+    lines = ['def encode(row):']
+    parts = []
+    for idx, (name, encoder) in enumerate(encoders):
+        namespace[f'c{idx}'] = name
+        namespace[f'k{idx}'] = f'{idx and ", " or ""}{encode_basestring_ascii(name)}: '
+        namespace[f'e{idx}'] = encoder or _generic
+        lines.append(f'    v{idx} = row[c{idx}]')
+        parts.append(f'{{k{idx}}}{{"null" if v{idx} is None else e{idx}(v{idx})}}')
+    lines.append(f"    return f'{{{{{''.join(parts)}}}}}'")
+    exec('\n'.join(lines), namespace) #pylint: disable=exec-used
+    return namespace['encode']
+
+def row_encoder(table, columns):
+    """Returns the function returning the JSON text of a row (dictionary)
+    with the columns (iterable of names) according to the encoder table.
+    The functions are compiled once for a set of columns and encoders.
+    """
+    key = tuple((name, table.get(name)) for name in columns)
+    encode = _ROW_ENCODERS.get(key)
+    if encode is None:
+        encode = _compile(key)
+        _ROW_ENCODERS.put(key, encode)
+    return encode
+
+def encode_rows(table, rows, separator=', '):
+    """Returns the JSON texts of the rows (iterable of dictionaries with the
+    same keys) joined by separator. With a backend (see set_backend), each
+    row is serialized by the backend.
+    """
+    if _BACKEND is not None:
+        return separator.join(dumps(row) for row in rows)
+    encode = None
+    texts = []
+    for row in rows:
+        if encode is None:
+            encode = row_encoder(table, row)
+        texts.append(encode(row))
+    return separator.join(texts)
+
+def set_backend(dumps_=None):
+    """Sets the function used to serialize the documents (json.dumps if
+    dumps_ is None).
+    """
+    global _BACKEND #pylint: disable=global-statement
+    _BACKEND = dumps_
+
+def dumps(obj):
+    "Returns the JSON text of obj serialized by the backend."
+    if _BACKEND is None:
+        return json.dumps(obj, default=default)
+    res = _BACKEND(obj, default=default)
+    if isinstance(res, bytes):
+        return res.decode('utf-8')
+    return res
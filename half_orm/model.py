@@ -36,8 +36,16 @@ CONF_DIR = os.path.abspath(environ.get('HALFORM_CONF_DIR', '/etc/half_orm'))
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
-from half_orm import model_errors
-from half_orm.relation import _normalize_fqrn, _normalize_qrn, _factory
+from half_orm import model_errors, notify
+from half_orm.cache import LRUCache
+from half_orm.disk_cache import DiskCache
+from half_orm.identity_map import IdentityMap
+from half_orm.prepared import PreparedStatements
+from half_orm.result_cache import ResultCache
+from half_orm.single_flight import SingleFlight
+from half_orm.snapshot import Snapshot
+from half_orm.replica import Replica
+from half_orm.relation import _normalize_fqrn, _normalize_qrn, _factory, _sfqrn_qtn
 
 __all__ = ["Model", "camel_case"]
 
@@ -91,6 +99,15 @@ class Model:
         self._relations_['classes'] = {}
         self.__raise_error = raise_error
         self.__production = False
+        self.__sql_cache = LRUCache()
+        self.__prepared_statements = PreparedStatements()
+        self.__result_cache = ResultCache(self._dependent_relations)
+        self.__dependents = {}
+        self.__views = None
+        self.__listener = None
+        self.__replicas = {}
+        self.__disk_cache = DiskCache()
+        self.__single_flight = SingleFlight()
         self._connect(raise_error=self.__raise_error)
 
     @staticmethod
@@ -171,6 +188,11 @@ class Model:
             self.__production = False
         if not isinstance(self.__production, bool):
             raise ValueError
+        self.__configure_prepared_statements(params)
+        self.__configure_result_cache(params)
+        self.__configure_single_flight(params)
+        if 'disk_cache_dir' in params:
+            self.__disk_cache.directory = params['disk_cache_dir'] or None
         if 'name' not in self._dbinfo:
             raise model_errors.MalformedConfigFile(
                 self.__config_file, {'name'})
@@ -185,13 +207,326 @@ class Model:
             sys.stderr.write(f"{err}\n")
             sys.stderr.flush()
         self.__conn.autocommit = True
+        self.__prepared_statements.reset(self.__conn)
         self.__metadata[self.__dbname] = self.__get_metadata()
+        self.__dependents = {}
+        self.__views = None
         self.__deja_vu[self.__dbname] = self
         self.__backend_pid = self.execute_query(
             "select pg_backend_pid()").fetchone()['pg_backend_pid']
 
     reconnect = _connect
 
+    def _new_connection(self):
+        """Returns a new psycopg2 connection to the database with the
+        parameters of the model.
+        """
+        params = dict(self._dbinfo)
+        params['dbname'] = params.pop('name')
+        return psycopg2.connect(**params, cursor_factory=RealDictCursor)
+
+    def __configure_prepared_statements(self, params):
+        """Configures the prepared statements with the parameters of the
+        database section of the connection file (see half_orm.prepared).
+        The parameters missing are left unchanged.
+        """
+        enabled = params.get('prepared_statements')
+        if enabled not in {None, 'True', 'False'}:
+            raise ValueError(f'prepared_statements: {enabled} is not True or False!')
+        threshold = params.get('prepare_threshold')
+        maxsize = params.get('prepared_statements_size')
+        self.__prepared_statements.configure(
+            enabled=enabled and enabled == 'True',
+            threshold=threshold and int(threshold),
+            maxsize=maxsize and int(maxsize))
+
+    @property
+    def sql_cache(self):
+        """Returns the cache of the SQL queries compiled by the relations of
+        the model (see half_orm.cache.LRUCache). The queries are cached by
+        shape: the relations with the same constraints (fields set,
+        comparators, set operations and foreign keys) share the same SQL
+        text, only the values differ.
+
+        - model.sql_cache.stats() returns the hits, misses, size and maxsize,
+        - model.sql_cache.maxsize = 0 disables the cache.
+        """
+        return self.__sql_cache
+
+    def __configure_result_cache(self, params):
+        """Configures the result cache with the parameters of the database
+        section of the connection file (see half_orm.result_cache). The
+        parameters missing are left unchanged.
+        """
+        enabled = params.get('result_cache')
+        if enabled not in {None, 'True', 'False'}:
+            raise ValueError(f'result_cache: {enabled} is not True or False!')
+        ttl = params.get('result_cache_ttl')
+        maxsize = params.get('result_cache_size')
+        self.__result_cache.configure(
+            enabled=enabled and enabled == 'True',
+            ttl=ttl and float(ttl),
+            maxsize=maxsize and int(maxsize))
+
+    @property
+    def result_cache(self):
+        """Returns the cache of the results of the relations queries (see
+        half_orm.result_cache.ResultCache). The cache is disabled by default.
+
+        - model.result_cache.enabled = True enables it,
+        - model.result_cache.stats() returns the hit ratio and the memory used.
+        """
+        return self.__result_cache
+
+    def __configure_single_flight(self, params):
+        """Configures the coalescing of the concurrent queries with the
+        parameters of the database section of the connection file (see
+        half_orm.single_flight). The parameters missing are left unchanged.
+        """
+        enabled = params.get('single_flight')
+        if enabled not in {None, 'True', 'False'}:
+            raise ValueError(f'single_flight: {enabled} is not True or False!')
+        timeout = params.get('single_flight_timeout')
+        self.__single_flight.configure(
+            enabled=enabled and enabled == 'True',
+            timeout=timeout and float(timeout))
+
+    @property
+    def single_flight(self):
+        """Returns the layer coalescing the identical read queries issued
+        concurrently by several threads (see
+        half_orm.single_flight.SingleFlight). It is disabled by default.
+
+        - model.single_flight.enabled = True enables it,
+        - model.single_flight.stats() returns the executions and the results
+          shared.
+        """
+        return self.__single_flight
+
+    @property
+    def disk_cache(self):
+        """Returns the on-disk cache of the results of select_columns and
+        to_json (see half_orm.disk_cache.DiskCache). The cache is disabled
+        until its directory is set:
+
+        - model.disk_cache.directory = '/var/cache/half_orm' enables it,
+        - model.disk_cache.stats() returns the hits, misses and entries.
+        """
+        return self.__disk_cache
+
+    def _change_marker(self, relations):
+        """Returns a marker of the state of the relations (set of sfqrn). The
+        marker changes when the tables read through the relations are
+        modified: it is computed from the files of the tables (relfilenode,
+        changed by truncate, vacuum full, cluster...) and from their counters
+        of inserted, updated and deleted tuples (pg_stat_all_tables).
+
+        The counters are flushed by the backends with a delay (see the
+        documentation of half_orm.disk_cache).
+        """
+        tables = tuple(sorted(sfqrn[1:] for sfqrn in self._base_relations(relations)))
+        query = """
+        select
+          n.nspname, c.relname, c.relfilenode,
+          s.n_tup_ins, s.n_tup_upd, s.n_tup_del
+        from pg_class c
+          join pg_namespace n on n.oid = c.relnamespace
+          left join pg_stat_all_tables s on s.relid = c.oid
+        where (n.nspname, c.relname) in %s
+        order by n.nspname, c.relname
+        """
+        with self.__conn.cursor() as cur:
+            cur.execute(query, (tables,))
+            state = [tuple(elt.values()) for elt in cur.fetchall()]
+        return DiskCache.fingerprint(*state)[:16]
+
+    def _base_relations(self, relations):
+        """Returns the set of the relations (sfqrn) whose content is read when
+        the relations are read: the relations themselves, their children
+        (inheritance and partitions) and the relations the views are built on,
+        recursively.
+        """
+        byname = self._metadata['byname']
+        underlying = {}
+        for key, relation in byname.items():
+            for parent in relation['inherits']:
+                underlying.setdefault(parent, set()).add(key)
+        for view, relation in self.__views_dependencies():
+            underlying.setdefault(view, set()).add(relation)
+        base = set(relations)
+        todo = list(relations)
+        while todo:
+            for relation in underlying.get(todo.pop(), ()):
+                if relation not in base:
+                    base.add(relation)
+                    todo.append(relation)
+        return base
+
+    def install_change_triggers(self, *qrns, channel=notify.CHANNEL, schema='public'):
+        """Installs on the tables qrns the triggers notifying their changes on
+        channel (see half_orm.notify). The trigger function is created in
+        schema.
+        """
+        for qrn in qrns:
+            schemaname, relationname = qrn.replace('"', '').rsplit('.', 1)
+            sfqrn = (self.__dbname, schemaname, relationname)
+            if sfqrn not in self._metadata['byname']:
+                raise model_errors.UnknownRelation(sfqrn)
+            if self._metadata['byname'][sfqrn]['tablekind'] not in {'r', 'p'}:
+                raise ValueError(f'{qrn} is not a table!')
+        # the SQL code is executed as is (no parameter).
+        self.execute_query(notify.triggers_sql(qrns, channel, schema), None)
+
+    def start_change_listener(self, channel=notify.CHANNEL, timeout=1.):
+        """Starts the thread listening to the changes notified on channel (see
+        install_change_triggers). The entries of the result cache depending
+        on a relation changed are evicted. The listener uses its own
+        connection. Returns the listener (listener.ready is set once it
+        listens).
+        """
+        if self.__listener is None:
+            # the dependencies are loaded here, not in the listener thread.
+            self.__views_dependencies()
+            self.__listener = notify.Listener(
+                self._new_connection, self._relation_changed, channel, timeout)
+            self.__listener.start()
+        return self.__listener
+
+    def stop_change_listener(self):
+        """Stops the thread listening to the changes."""
+        if self.__listener is not None:
+            self.__listener.stop()
+            self.__listener = None
+
+    def _relation_changed(self, schemaname, relationname):
+        """Called when the relation has been changed (by the relations DML
+        methods and by the listener). The result cache entries, the replicas,
+        the disk cache entries and the objects of the identity map of the
+        current context depending on the relation are invalidated.
+
+        The relation is None when the listener (re)connects: the changes made
+        while it was not listening are unknown.
+        """
+        if relationname is None:
+            self.__result_cache.invalidate_all()
+            for replica in self.__replicas.values():
+                replica.invalidate()
+            return
+        sfqrn = (self.__dbname, schemaname, relationname)
+        self.__result_cache.invalidate(sfqrn)
+        if self.__disk_cache.enabled:
+            self.__disk_cache.invalidate(self._dependent_relations(sfqrn))
+        identity_map = IdentityMap.current()
+        if identity_map is not None:
+            identity_map.invalidate(self._dependent_relations(sfqrn))
+        if self.__replicas:
+            for dependent in self._dependent_relations(sfqrn) & self.__replicas.keys():
+                self.__replicas[dependent].invalidate()
+
+    def replicate(self, qtn, refresh=None):
+        """Loads the relation qtn (<schema>.<relation>) in memory. The select,
+        get, count and is_empty calls on the relation are then answered
+        locally when possible (see half_orm.replica). The replica is reloaded
+        every refresh seconds (if set) and when the relation is changed.
+
+        Returns the Replica object.
+        """
+        schemaname, relationname = qtn.replace('"', '').rsplit('.', 1)
+        sfqrn = (self.__dbname, schemaname, relationname)
+        if sfqrn not in self._metadata['byname']:
+            raise model_errors.UnknownRelation(sfqrn)
+        replica = Replica(self, sfqrn, refresh)
+        replica.load()
+        self.__replicas[sfqrn] = replica
+        return replica
+
+    def drop_replica(self, qtn):
+        """Drops the replica of the relation qtn. The queries are sent to the
+        database again.
+        """
+        schemaname, relationname = qtn.replace('"', '').rsplit('.', 1)
+        self.__replicas.pop((self.__dbname, schemaname, relationname), None)
+
+    @property
+    def _replicas(self):
+        """Returns the dictionary {sfqrn: Replica} of the replicated relations."""
+        return self.__replicas
+
+    def _dependent_relations(self, sfqrn):
+        """Returns the set of the relations (sfqrn) whose content may be
+        modified by an insert, update or delete on the relation sfqrn:
+        - the relation itself,
+        - the relations referencing it through a foreign key (cascades),
+        - its parents and children (inheritance),
+        - the views built on them,
+        recursively.
+        """
+        if sfqrn in self.__dependents:
+            return self.__dependents[sfqrn]
+        byname = self._metadata['byname']
+        neighbours = {}
+        for key, relation in byname.items():
+            neighbours.setdefault(key, set())
+            for parent in relation['inherits']:
+                neighbours[key].add(parent)
+                neighbours.setdefault(parent, set()).add(key)
+            for fkey_name, fkey in relation['fkeys'].items():
+                if fkey_name.find('_reverse_fkey_') == 0:
+                    neighbours[key].add(fkey[0])
+        for view, relation in self.__views_dependencies():
+            neighbours.setdefault(relation, set()).add(view)
+        dependents = {sfqrn}
+        todo = [sfqrn]
+        while todo:
+            for neighbour in neighbours.get(todo.pop(), ()):
+                if neighbour not in dependents:
+                    dependents.add(neighbour)
+                    todo.append(neighbour)
+        self.__dependents[sfqrn] = dependents
+        return dependents
+
+    def __views_dependencies(self):
+        """Returns the list of the pairs (view, relation) where the view is
+        built on the relation (sfqrn). The list is loaded once.
+        """
+        if self.__views is not None:
+            return self.__views
+        query = """
+        select distinct
+          vn.nspname as view_schema, v.relname as view_name,
+          tn.nspname as rel_schema, t.relname as rel_name
+        from pg_depend d
+          join pg_rewrite r on r.oid = d.objid
+          join pg_class v on v.oid = r.ev_class
+          join pg_namespace vn on vn.oid = v.relnamespace
+          join pg_class t on t.oid = d.refobjid
+          join pg_namespace tn on tn.oid = t.relnamespace
+        where
+          d.classid = 'pg_rewrite'::regclass and
+          d.refclassid = 'pg_class'::regclass and
+          v.oid <> t.oid and v.relkind = 'v'
+        """
+        with self.__conn.cursor() as cur:
+            cur.execute(query)
+            self.__views = [
+                ((self.__dbname, elt['view_schema'], elt['view_name']),
+                 (self.__dbname, elt['rel_schema'], elt['rel_name']))
+                for elt in cur.fetchall()]
+        return self.__views
+
+    @property
+    def prepared_statements(self):
+        """Returns the cache of the statements prepared on the connection (see
+        half_orm.prepared.PreparedStatements). Once enabled, the queries of the
+        relations are prepared on the server once they have been executed
+        threshold times.
+
+        - model.prepared_statements.stats() returns the statistics,
+        - model.prepared_statements.enabled = True enables them (not with
+          pgbouncer in transaction mode).
+        """
+        return self.__prepared_statements
+
     @property
     def _pg_backend_pid(self):
         "backend PID"
@@ -296,6 +631,23 @@ class Model:
         fqrn, _ = _normalize_fqrn(fqrn)
         return _factory('Table', (), {'fqrn': fqrn, 'model': self})
 
+    def snapshot(self):
+        """Returns a context manager exporting a snapshot of the database (see
+        half_orm.snapshot). The connections attached to it see the database in
+        the same state.
+
+        >>> with model.snapshot() as snapshot:
+        ...     rows = list(Person().parallel_select(workers=4))
+        """
+        return Snapshot(self)
+
+    def from_intent(self, intent):
+        """Returns the relation object described by the intent (see
+        Relation.to_intent and half_orm.intent).
+        """
+        get_rel = self._import_class if self._scope else self.get_relation_class
+        return get_rel(_sfqrn_qtn(intent.nodes[0][0])).from_intent(intent)
+
     def has_relation(self, qtn):
         """Checks if the qtn is a relation in the database
 
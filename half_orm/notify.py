@@ -0,0 +1,129 @@
+#-*- coding: utf-8 -*-
+
+"""This module provides the cross-process notification of the changes made
+to the relations (LISTEN/NOTIFY).
+
+- triggers_sql returns the SQL code installing the triggers that notify the
+  changes (insert, update, delete or truncate) made on a list of relations,
+  whoever makes them (other processes, outside jobs, psql...),
+- the Listener class is a thread listening to the notifications on its own
+  connection.
+
+The Model uses them to keep the result cache of every process up to date:
+
+    >>> model.install_change_triggers('blog.post', 'blog.comment')
+    >>> model.start_change_listener()
+
+The triggers only need to be installed once. The listener must be started in
+each process (after the fork with gunicorn: post_fork hook).
+"""
+
+import json
+import select
+import sys
+import threading
+
+import psycopg2
+
+from half_orm import relation
+
+CHANNEL = 'half_orm_changes'
+FUNCTION = 'half_orm_notify_change'
+
+def _identifier(name):
+    "Returns the quoted SQL identifier name."
+    return '"{}"'.format(name.replace('"', '""'))
+
+def _literal(value):
+    "Returns the SQL string literal of value."
+    return "'{}'".format(value.replace("'", "''"))
+
+def triggers_sql(qrns, channel=CHANNEL, schema='public'):
+    """Returns the SQL code installing the triggers that notify the changes
+    made on the relations qrns on channel. The payload of a notification is
+    the JSON array [<schema name>, <relation name>].
+
+    The trigger function is created in schema. The triggers are statement
+    level triggers: on a partitioned table, they only fire for the queries
+    made on the partitioned table itself.
+    """
+    function = f'{_identifier(schema)}.{FUNCTION}'
+    sql = [f"""create or replace function {function}() returns trigger
+language plpgsql as $$
+begin
+  perform pg_notify(TG_ARGV[0], json_build_array(TG_TABLE_SCHEMA, TG_TABLE_NAME)::text);
+  return null;
+end;
+$$;"""]
+    for qrn in qrns:
+        qrn = relation._normalize_qrn(qrn)
+        sql.append(f"""drop trigger if exists {FUNCTION} on {qrn};
+create trigger {FUNCTION}
+  after insert or update or delete or truncate on {qrn}
+  for each statement execute procedure {function}({_literal(channel)});""")
+    return '\n'.join(sql)
+
+class Listener(threading.Thread):
+    """Thread listening to the notifications sent on channel.
+
+    - connect() returns a new connection to the database,
+    - callback(schema, relation) is called for each change notified. It is
+      called with (None, None) when the listener has (re)connected: the
+      changes made while it was not listening are lost.
+
+    The notifications whose payload is not a [schema, relation] pair and the
+    errors raised by the callback are reported on stderr: they don't stop
+    the listener.
+    """
+    def __init__(self, connect, callback, channel=CHANNEL, timeout=1.):
+        super().__init__(name=f'half_orm listener ({channel})', daemon=True)
+        self.__connect = connect
+        self.__callback = callback
+        self.__channel = channel
+        self.__timeout = timeout
+        self.__stop = threading.Event()
+        self.ready = threading.Event()
+
+    def stop(self):
+        """Stops the thread."""
+        self.__stop.set()
+        self.join()
+
+    def run(self):
+        while not self.__stop.is_set():
+            try:
+                self.__listen()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self.__stop.wait(self.__timeout)
+
+    def __listen(self):
+        "Listens to the channel until the thread is stopped."
+        connection = self.__connect()
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'listen {_identifier(self.__channel)}')
+            self.__call(None, None)
+            self.ready.set()
+            while not self.__stop.is_set():
+                if select.select([connection], [], [], self.__timeout) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    try:
+                        schema, relation_ = json.loads(notify.payload)
+                    except (ValueError, TypeError):
+                        sys.stderr.write(
+                            f'half_orm listener: invalid payload {notify.payload!r}\n')
+                        continue
+                    self.__call(schema, relation_)
+        finally:
+            connection.close()
+
+    def __call(self, schema, relation_):
+        "Calls the callback. Its errors are reported, not raised."
+        try:
+            self.__callback(schema, relation_)
+        except Exception as err: #pylint: disable=broad-except
+            sys.stderr.write(f'half_orm listener: {err!r}\n')
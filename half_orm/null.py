@@ -11,6 +11,9 @@ __all__ = ['NULL']
 
 class Null:
     """The Null class"""
+    def __reduce__(self):
+        # pickled by reference: NULL is still NULL once unpickled.
+        return 'NULL'
 
 def adapt_null(_):
     """NULL adapter"""
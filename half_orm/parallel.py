@@ -0,0 +1,107 @@
+#-*- coding: utf-8 -*-
+
+"""This module provides the parallel execution of the queries of a relation
+in a pool of processes (see Relation.parallel_select).
+
+The rows of the select query are split in ranges of a field (the primary key
+by default). The bounds of the ranges are the quantiles of the field, so
+the ranges have about the same number of rows whatever the distribution of
+the values (ranges).
+
+The workers are started with the spawn method. Each one opens its own
+connection to the database with the parameters of the model. The relation
+is shipped to the workers in serialized form: the SQL text of the query of
+each range, bound with the values of the constraints (mogrify). In the scope
+of a snapshot (see Model.snapshot), the workers attach to it: the ranges are
+read in the same state of the database.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from half_orm.snapshot import attach
+
+_CONNECTION = None
+
+def ranges(model, query, values, field, count):
+    """Returns the list of the conditions [(sql, values), ...] splitting the
+    result of the query (aliased q) in count ranges of the field. The bounds
+    are the quantiles of the field. The rows with a null value of the field
+    are in the first range.
+    """
+    column = '"{}"'.format(field.replace('"', '""'))
+    fractions = [idx / count for idx in range(1, count)]
+    bounds = model.execute_query(
+        f'select percentile_disc(%s::float8[]) within group (order by q.{column}) as bounds '
+        f'from ({query}) as q', (fractions, *values)).fetchone()['bounds'] or []
+    bounds = sorted(set(bound for bound in bounds if bound is not None))
+    if not bounds:
+        return [('true', ())]
+    # the rows with a null value are in the first range.
+    conditions = [(f'(q.{column} < %s or q.{column} is null)', (bounds[0],))]
+    for low, high in zip(bounds, bounds[1:]):
+        conditions.append((f'q.{column} >= %s and q.{column} < %s', (low, high)))
+    conditions.append((f'q.{column} >= %s', (bounds[-1],)))
+    return conditions
+
+def _connection_parameters(model):
+    "Returns the parameters of psycopg2.connect for the database of the model."
+    params = {key: value for key, value in model._dbinfo.items() if value is not None}
+    params['dbname'] = params.pop('name')
+    return params
+
+def _init_worker(params):
+    "Opens the connection of the worker process."
+    global _CONNECTION #pylint: disable=global-statement
+    _CONNECTION = psycopg2.connect(**params, cursor_factory=RealDictCursor)
+    _CONNECTION.autocommit = True
+
+def _select(query, callback, snapshot_id):
+    """Returns the rows (list of dictionaries) of the query executed by the
+    worker (in the snapshot snapshot_id if it is not None), or callback(rows).
+    """
+    if snapshot_id is not None:
+        attach(_CONNECTION, snapshot_id)
+    try:
+        with _CONNECTION.cursor() as cursor:
+            cursor.execute(query)
+            rows = [dict(row) for row in cursor]
+    finally:
+        if snapshot_id is not None:
+            _CONNECTION.rollback()
+            _CONNECTION.autocommit = True
+    if callback is not None:
+        return callback(rows)
+    return rows
+
+def executor(model, workers):
+    """Returns a pool of workers processes (spawn method), each one connected
+    to the database of the model.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker, initargs=(_connection_parameters(model),))
+
+def select(model, query, values, field, workers, callback=None, snapshot_id=None):
+    """Generator. Runs the query split in workers ranges of field in a pool of
+    workers processes. Yields the rows (or the results of callback applied to
+    the list of the rows of each range in the worker) as the ranges are
+    done. If snapshot_id is not None, the workers attach to the snapshot (see
+    half_orm.snapshot).
+    """
+    with model._connection.cursor() as cursor:
+        parts = [
+            cursor.mogrify(
+                f'select * from ({query}) as q where {condition}',
+                (*values, *condition_values)).decode('utf-8')
+            for condition, condition_values in ranges(model, query, values, field, workers)]
+    with executor(model, workers) as pool:
+        futures = [pool.submit(_select, part, callback, snapshot_id) for part in parts]
+        for future in as_completed(futures):
+            if callback is not None:
+                yield future.result()
+            else:
+                yield from future.result()
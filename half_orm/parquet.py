@@ -0,0 +1,199 @@
+#-*- coding: utf-8 -*-
+
+"""This module provides the Parquet export of the relations (see
+Relation.to_parquet). It requires pyarrow (pip install half_orm[parquet]).
+
+The Arrow schema is built from the metadata of the fields: the type of the
+column comes from the fieldtype, the arrays (fielddim) are lists and the
+fields without "not null" constraint are nullable:
+
+    fieldtype                           Arrow type
+    bool                                bool
+    int2, int4, int8, oid               int16, int32, int64, int64
+    float4, float8                      float32, float64
+    numeric(precision, scale)           decimal128 (decimal256 over 38 digits)
+    date, time, timestamp, timestamptz  date32, time64[us], timestamp[us], timestamp[us, UTC]
+    interval                            duration[us]
+    bytea                               binary
+    others (text, uuid, json...)        string
+
+The numeric columns without precision are exported as strings (exact), not
+as floats.
+
+The rows are read from a server side cursor, batch_rows at a time. Each
+batch is written as a row group, so the memory used is bounded by the size of
+a batch.
+
+The export can be split in several files written in parallel, each one with
+its own connection to the database (attached to the snapshot of the current
+scope, see Model.snapshot):
+
+- by ranges of the primary key (single column) or of another field: the
+  bounds are the quantiles of the field (see half_orm.parallel.ranges),
+- by partition for a partitioned table: one file per leaf partition
+  (partitions).
+"""
+
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+from half_orm.snapshot import attach
+
+def _pyarrow():
+    "Returns the modules pyarrow and pyarrow.parquet."
+    try:
+        #pylint: disable=import-outside-toplevel
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as err:
+        raise ImportError(
+            'The Parquet export requires pyarrow (pip install half_orm[parquet])') from err
+    return pyarrow, pyarrow.parquet
+
+# fieldtype: (name of the pyarrow type factory, arguments)
+ARROW_TYPES = {
+    'bool': ('bool_', ()),
+    'int2': ('int16', ()),
+    'int4': ('int32', ()),
+    'int8': ('int64', ()),
+    'oid': ('int64', ()),
+    'float4': ('float32', ()),
+    'float8': ('float64', ()),
+    'date': ('date32', ()),
+    'time': ('time64', ('us',)),
+    'timestamp': ('timestamp', ('us',)),
+    'timestamptz': ('timestamp', ('us', 'UTC')),
+    'interval': ('duration', ('us',)),
+    'bytea': ('binary', ()),
+}
+_STRING = ('string', ())
+
+# fieldtype: conversion of the values returned by psycopg2
+CONVERTERS = {
+    'bytea': bytes,
+    'json': json.dumps,
+    'jsonb': json.dumps,
+}
+
+def _decimal_type(metadata):
+    """Returns the Arrow decimal type (name, arguments) of a numeric column
+    or None if its precision is unknown (numeric without typmod).
+    """
+    typmod = metadata.get('fieldtypmod')
+    if metadata['fieldtype'].lstrip('_') != 'numeric' or typmod is None or typmod < 4:
+        return None
+    # see numeric_typmod_precision and numeric_typmod_scale in PostgreSQL.
+    precision = (typmod - 4) >> 16 & 0xffff
+    scale = (((typmod - 4) & 0x7ff) ^ 1024) - 1024
+    return (precision > 38 and 'decimal256' or 'decimal128', (precision, scale))
+
+def _column_type(metadata):
+    """Returns the triple (Arrow type name, arguments, dimension) of the
+    column described by the metadata of a field.
+    """
+    fieldtype = metadata['fieldtype']
+    dim = metadata.get('fielddim') or 0
+    if fieldtype.startswith('_'):
+        fieldtype = fieldtype[1:]
+        dim = max(dim, 1)
+    return (*(_decimal_type(metadata) or ARROW_TYPES.get(fieldtype, _STRING)), dim)
+
+def _converter(metadata):
+    """Returns the function converting the (not None) values of the column
+    described by the metadata, or None.
+    """
+    fieldtype = metadata['fieldtype'].lstrip('_')
+    convert = CONVERTERS.get(fieldtype)
+    if convert is None and fieldtype not in ARROW_TYPES and fieldtype not in (
+            'text', 'varchar', 'bpchar', 'name') and _decimal_type(metadata) is None:
+        convert = str
+    if convert is None:
+        return None
+    dim = _column_type(metadata)[2]
+    for _ in range(dim):
+        convert = (lambda convert: lambda value: [
+            elt if elt is None else convert(elt) for elt in value])(convert)
+    return convert
+
+def arrow_schema(fields_metadata, columns):
+    """Returns the Arrow schema of the columns (names of the fields)."""
+    pa_, _ = _pyarrow()
+    fields = []
+    for name in columns:
+        metadata = fields_metadata[name]
+        type_name, args, dim = _column_type(metadata)
+        type_ = getattr(pa_, type_name)(*args)
+        for _ in range(dim):
+            type_ = pa_.list_(type_)
+        fields.append(pa_.field(name, type_, nullable=not metadata.get('notnull')))
+    return pa_.schema(fields)
+
+def write(connection, query, values, path, fields_metadata, batch_rows):
+    """Writes the rows returned by the query in the Parquet file path.
+    Returns the number of rows written.
+    """
+    pa_, pq_ = _pyarrow()
+    cursor = connection.cursor(
+        name=f'half_orm_{uuid.uuid4().hex}',
+        cursor_factory=psycopg2.extensions.cursor, withhold=connection.autocommit)
+    count = 0
+    try:
+        cursor.execute(query, values)
+        rows = cursor.fetchmany(batch_rows)
+        columns = [column[0] for column in cursor.description]
+        schema = arrow_schema(fields_metadata, columns)
+        converters = [_converter(fields_metadata[name]) for name in columns]
+        with pq_.ParquetWriter(path, schema) as writer:
+            while rows:
+                arrays = []
+                for idx, convert in enumerate(converters):
+                    column = [row[idx] for row in rows]
+                    if convert is not None:
+                        column = [value if value is None else convert(value) for value in column]
+                    arrays.append(pa_.array(column, type=schema.field(idx).type))
+                writer.write_table(pa_.Table.from_arrays(arrays, schema=schema))
+                count += len(rows)
+                rows = cursor.fetchmany(batch_rows)
+    finally:
+        cursor.close()
+    return count
+
+def partitions(model, fqrn):
+    """Returns the list of the pairs (name, condition) of the leaf partitions
+    of the partitioned table fqrn. The condition is the partition constraint
+    (on the unqualified columns).
+    """
+    return [
+        (elt['relid'], elt['condition'].replace('%', '%%'))
+        for elt in model.execute_query(
+            """select relid::text, coalesce(pg_get_partition_constraintdef(relid), 'true') as condition
+               from pg_partition_tree(%s::regclass)
+               where isleaf
+               order by relid::text""", (fqrn,))]
+
+def write_parts(
+        model, parts, directory, fields_metadata, batch_rows, workers, snapshot_id=None):
+    """Writes each part [(file name, query, values), ...] in directory with
+    at most workers threads, each one with its own connection (attached to
+    the snapshot snapshot_id if it is not None). Returns the dictionary
+    {path: number of rows}.
+    """
+    os.makedirs(directory, exist_ok=True)
+    def write_part(part):
+        name, query, values = part
+        path = os.path.join(directory, name)
+        connection = model._new_connection()
+        try:
+            if snapshot_id is not None:
+                attach(connection, snapshot_id)
+            else:
+                connection.autocommit = True
+            return path, write(connection, query, values, path, fields_metadata, batch_rows)
+        finally:
+            connection.close()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(executor.map(write_part, parts))
@@ -15,6 +15,7 @@ SELECT
     adesc.description AS fielddescription,
     a.attndims AS fielddim,
     pt.typname AS fieldtype,
+    a.atttypmod AS fieldtypmod,
     a.attnum AS fieldnum,
     NOT( a.attislocal ) AS inherited,
     cn_uniq.contype AS uniq,
@@ -78,6 +79,7 @@ GROUP BY
     a.attndims,
     a.attislocal,
     pt.typname,
+    a.atttypmod,
     cn_uniq.contype,
     a.attnotnull,
     cn_pk.contype,
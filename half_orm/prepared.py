@@ -0,0 +1,192 @@
+#-*- coding: utf-8 -*-
+
+"""This module provides the PreparedStatements class.
+
+The queries executed by the relations (select, count, insert, update, ...)
+are prepared on the server (PREPARE) once they have been executed threshold
+times on the connection. They are then run with EXECUTE: Postgres parses and
+plans them only once. The SQL text of a relation query is stable (see the
+SQL cache of the model), so the same shapes are met again and again.
+
+The prepared statements belong to the session of the connection. The cache
+is emptied when the model reconnects (see Model.ping). They are disabled by
+default: they must stay disabled if the connections go through a pooler in
+transaction mode (pgbouncer). A statement whose result type is changed by a
+DDL query run on the session is deallocated and the query is run again
+unprepared (or the error is raised in a transaction). The configuration is
+read from the database section of the connection file:
+
+    [database]
+    ...
+    prepared_statements = True      # default False
+    prepare_threshold = 5           # default 5
+    prepared_statements_size = 256  # default 256
+
+The cache can also be changed at runtime with model.prepared_statements:
+
+    >>> model.prepared_statements.enabled = True
+    >>> model.prepared_statements.stats()
+    {'enabled': True, 'threshold': 5, 'size': 12, 'maxsize': 256, ...}
+"""
+
+import re
+import threading
+
+import psycopg2
+from psycopg2.errors import FeatureNotSupported
+
+from half_orm.cache import LRUCache
+
+# %s is a placeholder, %% an escaped %.
+PLACEHOLDER = re.compile('%(%|s)')
+# "is NULL" can't be prepared as "is $1".
+IS_PLACEHOLDER = re.compile(r'\bis (not )?(unaccent\()?%s')
+
+class PreparedStatements:
+    """Per connection cache of the server side prepared statements.
+
+    - threshold is the number of executions of a query before it is prepared,
+    - maxsize is the maximum number of statements prepared on the connection
+      (the least recently used one is deallocated first).
+
+    The cache is shared by the threads using the connection of the model: the
+    statements are looked up, prepared, executed and deallocated under a
+    lock.
+    """
+    def __init__(self, threshold=5, maxsize=256, enabled=False):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.__statements = LRUCache(maxsize, on_evict=self.__deallocate)
+        self.__counts = LRUCache(maxsize * 4)
+        self.__unpreparable = LRUCache(maxsize * 4)
+        self.__connection = None
+        self.__last_id = 0
+        # reentrant: a statement is deallocated by the put of another one.
+        self.__lock = threading.RLock()
+
+    def configure(self, enabled=None, threshold=None, maxsize=None):
+        """Sets the parameters of the cache that are not None (see the module
+        documentation).
+        """
+        if enabled is not None:
+            self.enabled = enabled
+        if threshold is not None:
+            self.threshold = threshold
+        if maxsize is not None:
+            with self.__lock:
+                self.__statements.maxsize = maxsize
+                self.__counts.maxsize = maxsize * 4
+                self.__unpreparable.maxsize = maxsize * 4
+
+    def reset(self, connection=None):
+        """Forgets the statements prepared. Called on a new connection: the
+        statements of the previous session are gone.
+        """
+        with self.__lock:
+            self.__statements.clear()
+            self.__counts.clear()
+            self.__unpreparable.clear()
+            self.__connection = connection
+
+    def clear(self):
+        """Deallocates the statements prepared on the connection and forgets
+        them.
+        """
+        with self.__lock:
+            maxsize = self.__statements.maxsize
+            # all the statements are evicted (deallocated)
+            self.__statements.maxsize = 0
+            self.__statements.maxsize = maxsize
+            self.reset(self.__connection)
+
+    def stats(self):
+        """Returns the statistics of the cache. The hits are the executions of
+        prepared statements.
+        """
+        stats = self.__statements.stats()
+        return {'enabled': self.enabled, 'threshold': self.threshold, **stats}
+
+    def __contains__(self, query):
+        return query in self.__statements
+
+    def execute(self, cursor, query, values):
+        """Executes query with cursor. The query is prepared if it has been
+        executed threshold times on the connection of the cursor.
+        """
+        if not self.enabled:
+            return cursor.execute(query, values)
+        # the statement can't be deallocated by another thread before it is
+        # executed.
+        with self.__lock:
+            if query in self.__unpreparable:
+                return cursor.execute(query, values)
+            if cursor.connection is not self.__connection:
+                self.reset(cursor.connection)
+            name = self.__statements.get(query)
+            if name is None:
+                count = (self.__counts.get(query) or 0) + 1
+                self.__counts.put(query, count)
+                if count < self.threshold:
+                    return cursor.execute(query, values)
+                name = self.__prepare(cursor, query)
+                if name is None:
+                    return cursor.execute(query, values)
+            args = values and f"({', '.join(['%s'] * len(values))})" or ''
+            try:
+                return cursor.execute(f'execute {name}{args}', values)
+            except FeatureNotSupported:
+                # cached plan must not change result type (DDL on the session).
+                self.__forget(query)
+                if not cursor.connection.autocommit:
+                    raise
+                return cursor.execute(query, values)
+
+    def __forget(self, query):
+        "Deallocates the statement of query and forgets it."
+        name = self.__statements.pop(query)
+        self.__counts.pop(query)
+        if name is not None:
+            self.__deallocate(query, name)
+
+    def __prepare(self, cursor, query):
+        """Prepares the query on the server. Returns the name of the
+        statement or None if the query can't be prepared.
+        """
+        if IS_PLACEHOLDER.search(query):
+            self.__unpreparable.put(query, True)
+            return None
+        position = 0
+        def placeholder(match):
+            "Replaces the psycopg2 placeholders with the $<position> ones."
+            nonlocal position
+            if match.group(1) == '%':
+                return '%'
+            position += 1
+            return f'${position}'
+        self.__last_id += 1
+        name = f'half_orm_{self.__last_id}'
+        statement = f'prepare {name} as {PLACEHOLDER.sub(placeholder, query)}'
+        in_transaction = not cursor.connection.autocommit
+        try:
+            if in_transaction:
+                cursor.execute('savepoint half_orm_prepare')
+            cursor.execute(statement)
+            if in_transaction:
+                cursor.execute('release savepoint half_orm_prepare')
+        except psycopg2.ProgrammingError:
+            if in_transaction:
+                cursor.execute('rollback to savepoint half_orm_prepare')
+            self.__unpreparable.put(query, True)
+            return None
+        self.__statements.put(query, name)
+        return name
+
+    def __deallocate(self, _, name):
+        "Deallocates the statement evicted from the cache."
+        if self.__connection is None or self.__connection.closed:
+            return
+        try:
+            with self.__connection.cursor() as cursor:
+                cursor.execute(f'deallocate {name}')
+        except psycopg2.Error:
+            pass
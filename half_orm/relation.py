@@ -24,23 +24,30 @@ Main methods provided by the class Relation:
 The following methods can be chained on the object before a select.
 
 - distinct: ensures that there are no duplicates on the select result.
+- semi_join: the relations joined through the foreign keys are only used as
+  filters (no duplicates are introduced by the joins).
 - order_by: sets the order of the select result.
 - limit: limits the number of elements returned by the select method.
 - offset: sets the offset for the select method.
+- prefetch: loads the relations of some foreign keys with the select (one
+  query per foreign key) and adds them to the rows.
 """
 
 from functools import wraps
 from collections import OrderedDict
 import datetime
+import io
+import re
 import sys
 import uuid
 import psycopg2
 from typing import Generator
 
-import yaml
-
-from half_orm import relation_errors
+from half_orm import bulk_load, grouping, json_encoders, parallel, parquet, relation_errors, sql
 from half_orm.transaction import Transaction
+from half_orm.identity_map import IdentityMap
+from half_orm.intent import Intent
+from half_orm.snapshot import Snapshot
 from half_orm.field import Field
 
 class SetOp:
@@ -100,10 +107,6 @@ def __init__(self, **kwargs):
     self.__set_fields()
     self.__set_fkeys()
     self._joined_to = {}
-    self.__query = ""
-    self.__query_type = None
-    self.__sql_query = []
-    self.__sql_values = []
     self.__set_op = SetOp(self)
     self.__select_params = {}
     self.__id_cast = None
@@ -143,14 +146,18 @@ def __setattr__(self, key, value):
     object.__setattr__(self, key, value)
 
 def __execute(self, query, values):
+    """Executes the query. The frequent queries are executed as prepared
+    statements (see Model.prepared_statements).
+    """
+    prepared_statements = self._model.prepared_statements
     try:
         if self.__mogrify:
             print(self.__cursor.mogrify(query, values).decode('utf-8'))
-        return self.__cursor.execute(query, values)
+        return prepared_statements.execute(self.__cursor, query, values)
     except (psycopg2.OperationalError, psycopg2.InterfaceError):
         self._model.ping()
         self.__cursor = self._model._connection.cursor()
-        return self.__cursor.execute(query, values)
+        return prepared_statements.execute(self.__cursor, query, values)
 
 @property
 def id_(self):
@@ -249,104 +256,369 @@ def _set_fkey_property(self, property_name, fkey_name, _cast=None):
         raise relation_errors.DuplicateAttributeError(
             f"ERROR: Can't set '{property_name}' as a FKEY property in {self.__class__}!")
     self._fkeys_prop.append(property_name)
+    self.__class__.__fkeys_aliases = {**self.__fkeys_aliases, property_name: fkey_name}
     setattr(self.__class__, property_name, property(fget=fget, fset=fset))
 
 def group_by(self, yml_directive):
     """Returns an aggregation of the data according to the yml directive
-    description.
-    """
-    def inner_group_by(data, directive, grouped_data, gdata=None):
-        """recursive fonction to actually group the data in grouped_data."""
-        deja_vu_key = set()
-        if gdata is None:
-            gdata = grouped_data
-        if isinstance(directive, list):
-            directive = directive[0]
-        keys = set(directive)
-        for elt in data:
-            res_elt = {}
-            for key in keys.intersection(self._fields.keys()):
-                deja_vu_key.add(directive[key])
-                try:
-                    res_elt.update({directive[key]:elt[key]})
-                except:
-                    raise relation_errors.UnknownAttributeError(key)
-            if isinstance(gdata, list):
-                different = None
-                for selt in gdata:
-                    different = True
-                    for key in deja_vu_key:
-                        different = selt[key] != res_elt[key]
-                        if different:
-                            break
-                    if not different:
-                        break
-                if not gdata or different:
-                    gdata.append(res_elt)
-            else:
-                gdata.update(res_elt)
-            for group_name in keys.difference(
-                    keys.intersection(self._fields.keys())):
-                type_directive = type(directive[group_name])
-                suite = None
-                if not gdata:
-                    gdata[group_name] = type_directive()
-                    suite = gdata[group_name]
-                elif isinstance(gdata, list):
-                    suite = None
-                    for selt in gdata:
-                        different = True
-                        for skey in deja_vu_key:
-                            different = selt[skey] != res_elt[skey]
-                            if different:
-                                break
-                        if not different:
-                            if selt.get(group_name) is None:
-                                selt[group_name] = type_directive()
-                            suite = selt[group_name]
-                            break
-                    if suite is None:
-                        gdata.append(res_elt)
-                elif gdata.get(group_name) is None:
-                    #TODO: Raise ExpectedOneError if necessary
-                    gdata[group_name] = type_directive()
-                    suite = gdata[group_name]
-                else:
-                    suite = gdata[group_name]
-                inner_group_by(
-                    [elt], directive[group_name], suite, None)
-
-    grouped_data = {}
-    data = [elt for elt in self.select()]
-    directive = yaml.safe_load(yml_directive)
-    inner_group_by(data, directive, grouped_data)
-    return grouped_data
-
-def to_json(self, yml_directive=None, res_field_name='elements', **kwargs):
+    description (see half_orm.grouping). The rows are grouped as they are
+    read from the select query.
+    """
+    directive = grouping.compile_directive(yml_directive, tuple(self._fields))
+    return grouping.group(directive, self.select())
+
+def to_json(self, yml_directive=None, res_field_name='elements', in_database=False, **kwargs):
     """Returns a JSON representation of the set returned by the select query.
     if kwargs, returns {res_field_name: [list of elements]}.update(kwargs)
+
+    The values are converted according to the types of the columns (see
+    half_orm.json_encoders).
+
+    With in_database, the JSON document is built by PostgreSQL (json_agg and
+    json_build_object, see half_orm.grouping.to_sql) and returned as is. The
+    values are then in the JSON representation of PostgreSQL (the intervals
+    are strings, the numerics are numbers).
+    """
+    import json
+
+    entry = self.__disk_cache_entry(
+        'json', yml_directive, res_field_name, in_database, sorted(kwargs.items()))
+    if entry is not None:
+        res = self._model.disk_cache.get_text(*entry)
+        if res is not None:
+            return res
+    if res_field_name in kwargs:
+        # {res_field_name: res}.update(kwargs): the elements are replaced.
+        res = json_encoders.dumps(kwargs[res_field_name])
+    elif in_database:
+        res = self.__json_document(yml_directive)
+    elif yml_directive:
+        res = json_encoders.dumps(self.group_by(yml_directive))
+    else:
+        res = f'[{json_encoders.encode_rows(self.__json_encoders, self.select())}]'
+    if kwargs:
+        res = '{%s}' % ', '.join(
+            [f'{json.dumps(res_field_name)}: {res}'] +
+            [f'{json.dumps(key)}: {json_encoders.dumps(value)}'
+             for key, value in kwargs.items() if key != res_field_name])
+    if entry is not None:
+        self._model.disk_cache.put_text(*entry, res, self.__read_relations())
+    return res
+
+def to_json_stream(
+        self, fileobj=None, res_field_name='elements', ndjson=False, chunk_size=1000, **kwargs):
+    """Writes the JSON representation of the set returned by the select query
+    (see to_json) in fileobj without loading the whole result in memory. The
+    rows are read from a server side cursor, chunk_size rows at a time.
+
+    - fileobj is a text or binary file object (the text is encoded in UTF-8),
+      a gzip file for instance. If fileobj is None, returns a generator of the
+      chunks of text (for an HTTP chunked response),
+    - with ndjson, the rows are written one per line (newline delimited
+      JSON). Otherwise a JSON array is written or, if kwargs,
+      {res_field_name: [list of elements]}.update(kwargs).
+
+    >>> with gzip.open('persons.json.gz', 'wt') as fileobj:
+    ...     Person().to_json_stream(fileobj)
     """
+    if ndjson and kwargs:
+        raise ValueError('No envelope (kwargs) with ndjson!')
+    chunks = self.__json_chunks(res_field_name, ndjson, chunk_size, kwargs)
+    if fileobj is None:
+        return chunks
+    binary = not isinstance(fileobj, io.TextIOBase)
+    for chunk in chunks:
+        fileobj.write(chunk.encode('utf-8') if binary else chunk)
+    return None
+
+def __json_chunks(self, res_field_name, ndjson, chunk_size, envelope):
+    """Generator of the chunks of the JSON text written by to_json_stream."""
     import json
 
-    def handler(obj):
-        """Replacement of default handler for json.dumps."""
-        if hasattr(obj, 'isoformat'):
-            return str(obj.isoformat())
-        if isinstance(obj, uuid.UUID):
-            return str(obj)
-        if isinstance(obj, datetime.timedelta):
-            return obj.total_seconds()
-        raise TypeError(
-            f'Object of type {type(obj)} with value of {repr(obj)} is not JSON serializable')
+    if res_field_name in envelope:
+        # {res_field_name: [...]}.update(envelope): the elements are replaced.
+        yield json_encoders.dumps({res_field_name: None, **envelope})
+        return
 
+    query, values = self._prep_select()
+    connection = self._model._connection
+    # a server side cursor must be held to be used outside of a transaction.
+    cursor = connection.cursor(
+        name=f'half_orm_{uuid.uuid4().hex}', withhold=connection.autocommit)
+    try:
+        cursor.execute(query, values)
+        separator = ndjson and '\n' or ',\n'
+        prefix = ''
+        if not ndjson:
+            prefix = envelope and f'{{{json.dumps(res_field_name)}: [' or '['
+        first = True
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            chunk = json_encoders.encode_rows(self.__json_encoders, rows, separator)
+            if ndjson:
+                yield f'{chunk}\n'
+            else:
+                yield f'{first and prefix or separator}{chunk}'
+            first = False
+        if not ndjson:
+            suffix = ''.join(
+                f', {json.dumps(key)}: {json_encoders.dumps(value)}'
+                for key, value in envelope.items() if key != res_field_name)
+            yield f"{first and prefix or ''}]{envelope and suffix + '}' or ''}"
+    finally:
+        cursor.close()
+
+def copy_to(self, fileobj, format='csv', fields=None, header=True, connection=None):
+    """Exports the set returned by the select query in fileobj with the
+    PostgreSQL COPY command. The data is written by PostgreSQL, without
+    building the rows in Python. Returns the number of rows copied.
+
+    - fileobj is a text or binary file object (binary for the binary format),
+    - format is 'csv', 'text' or 'binary',
+    - fields is the list of the names of the fields to export (all the
+      fields by default),
+    - header adds the names of the columns on the first line (csv format),
+    - connection is the psycopg2 connection used (the connection of the
+      model by default), a connection attached to a snapshot for instance
+      (see Model.snapshot).
+
+    The constraints, the joins through the foreign keys, order_by, limit and
+    offset are applied as for select.
+
+    >>> with open('persons.csv', 'w') as fileobj:
+    ...     Person(last_name=('like', 'a%')).order_by('last_name').copy_to(fileobj)
+    """
+    #pylint: disable=redefined-builtin
+    if format not in ('csv', 'text', 'binary'):
+        raise ValueError(f"Unknown format {format}! Expecting 'csv', 'text' or 'binary'.")
+    fields = list(fields or [])
+    unknown = set(fields).difference(self._fields)
+    if unknown:
+        raise relation_errors.UnknownAttributeError(str(unknown))
+    query, values = self._prep_select(
+        *('"{}"'.format(field.replace('"', '""')) for field in fields))
+    options = f'format {format}'
+    if format == 'csv' and header:
+        options += ', header true'
+    if connection is not None:
+        cursor = connection.cursor()
+    else:
+        try:
+            cursor = self._model._connection.cursor()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self._model.ping()
+            cursor = self._model._connection.cursor()
+    try:
+        query = cursor.mogrify(query, values).decode('utf-8')
+        if self.__mogrify:
+            print(query)
+        cursor.copy_expert(f'copy ({query}) to stdout with ({options})', fileobj)
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+def to_parquet(self, path, batch_rows=65536, split=None, split_on=None, workers=4):
+    """Exports the set returned by the select query in Parquet (see
+    half_orm.parquet, requires pyarrow). The rows are read from a server side
+    cursor and written by row groups of batch_rows rows.
+
+    - split is None: the rows are written in the file path,
+    - split is an integer n: path is a directory in which the rows are
+      written in n files (part-0000.parquet, ...), one by range of the
+      field split_on (the primary key by default, if it is a single column),
+    - split is 'partitions' (partitioned table): path is a directory in
+      which each leaf partition is written in its own file
+      (<partition>.parquet).
+
+    The files are written in parallel by at most workers threads.
+
+    Returns the dictionary {file path: number of rows}.
+    """
+    query, values = self._prep_select()
+    fields_metadata = self.__metadata['fields']
+    if split is None:
+        return {path: parquet.write(
+            self._model._connection, query, values, path, fields_metadata, batch_rows)}
+    if split == 'partitions':
+        if self.__metadata['tablekind'] != 'p':
+            raise ValueError(f'{self._fqrn} is not a partitioned table!')
+        conditions = [
+            (name.replace('"', ''), condition, ())
+            for name, condition in parquet.partitions(self._model, self._fqrn.split('.', 1)[1])]
+    elif isinstance(split, int) and split > 0:
+        split_on = self.__split_field(split_on)
+        conditions = [
+            (f'part-{idx:04}', condition, condition_values)
+            for idx, (condition, condition_values) in enumerate(parallel.ranges(
+                self._model, query, values, split_on, split))]
+    else:
+        raise ValueError("split must be None, a positive integer or 'partitions'!")
+    parts = [
+        (f'{name}.parquet', f'select * from ({query}) as q where {condition}',
+         (*values, *condition_values))
+        for name, condition, condition_values in conditions]
+    return parquet.write_parts(
+        self._model, parts, path, fields_metadata, batch_rows, workers, _snapshot_id())
+
+def parallel_load(
+        self, source, workers=4, fields=None, format='text', header=False,
+        chunk_rows=10000, retries=3, progress=None, analyze=False):
+    """Loads the rows of source in the table with COPY over workers
+    connections at once (see half_orm.bulk_load). Returns the number of rows
+    loaded.
+
+    - source is an iterable of rows (sequences of values in the order of
+      fields, or dictionaries) or a text file object in the COPY format
+      format ('text' or 'csv', with a first line to skip if header is True),
+    - the rows are sent in the text format of COPY, or in the binary format
+      if format is 'binary' (see half_orm.copy_binary, rows only),
+    - fields is the list of the names of the fields loaded (all the fields
+      by default),
+    - the rows are copied by chunks of chunk_rows rows, each one in its own
+      transaction. A chunk failing on a connection error is retried at most
+      retries times,
+    - progress(rows, chunks) is called each time a chunk is loaded,
+    - analyze runs ANALYZE on the table once the rows are loaded.
+
+    The rows of a partitioned table are copied directly in its leaf
+    partitions.
+
+    >>> with open('persons.csv') as fileobj:
+    ...     Person().parallel_load(fileobj, format='csv', header=True, analyze=True)
+    """
+    #pylint: disable=redefined-builtin,too-many-arguments
+    if format not in ('csv', 'text', 'binary'):
+        raise ValueError(f"Unknown format {format}! Expecting 'csv', 'text' or 'binary'.")
+    fields = list(fields or self._fields)
+    unknown = set(fields).difference(self._fields)
+    if unknown:
+        raise relation_errors.UnknownAttributeError(str(unknown))
+    if hasattr(source, 'read'):
+        if format == 'binary':
+            raise ValueError('The binary format is only supported for rows!')
+        records = bulk_load.file_records(source, format, header)
+    elif format == 'binary':
+        records = bulk_load.rows_values(source, fields)
+    else:
+        records = bulk_load.rows_records(source, fields)
+        format = 'text'
+    fqrn = self._fqrn.split('.', 1)[1]
+    route = None
+    if self.__metadata['tablekind'] == 'p':
+        route = bulk_load.routing(self._model, fqrn, fields)
+    try:
+        rows = bulk_load.load(
+            self._model, fqrn, fields, bulk_load.chunks(records, chunk_rows), format,
+            workers, route, retries, progress, self.__metadata['fields'])
+    finally:
+        self._model._relation_changed(*self.__sfqrn[1:])
+    if analyze:
+        self._model.execute_query(f'analyze {fqrn}')
+    return rows
+
+def _snapshot_id():
+    "Returns the id of the snapshot of the current scope or None."
+    snapshot = Snapshot.current()
+    return snapshot and snapshot.id
+
+def __split_field(self, split_on):
+    """Returns the name of the field on which the rows are split in ranges:
+    split_on or the primary key if it is a single column.
+
+    Raises a ValueError if limit or offset is set without order_by: the
+    rows of each range would not be the same from one query to the next.
+    """
+    params = self.__select_params
+    if (params.get('limit') is not None or params.get('offset') is not None) and \
+            not params.get('order_by'):
+        raise ValueError('Splitting a relation with limit or offset requires an order_by!')
+    if split_on is None:
+        if len(self._pkey) != 1:
+            raise ValueError(f'{self._fqrn} has no single column primary key!')
+        split_on = list(self._pkey)[0]
+    if split_on not in self._fields:
+        raise relation_errors.UnknownAttributeError(split_on)
+    return split_on
+
+def parallel_select(self, workers=4, split_on=None, callback=None):
+    """Generator. Yields the result of the select query computed by a pool
+    of workers processes (see half_orm.parallel), each one with its own
+    connection to the database.
+
+    The rows are split in workers ranges of the field split_on (the primary
+    key by default, if it is a single column). The rows are yielded as the
+    ranges are done: the order of the rows is only kept within a range.
+
+    If callback is set, it is called in the worker with the list of the rows
+    of the range, and its results are yielded instead of the rows. The
+    callback must be picklable (a function defined at module level).
+    """
+    split_on = self.__split_field(split_on)
+    query, values = self._prep_select()
+    return parallel.select(
+        self._model, query, values, split_on, workers, callback, _snapshot_id())
+
+def __json_document(self, yml_directive=None):
+    """Returns the JSON document (text) of the select query (grouped
+    according to the yml_directive) built by PostgreSQL.
+    """
+    query, values = self._prep_select()
     if yml_directive:
-        res = self.group_by(yml_directive)
+        directive = grouping.compile_directive(yml_directive, tuple(self._fields))
+        casts = {
+            name: {'json': '::jsonb', '_json': '::jsonb[]'}[metadata['fieldtype']]
+            for name, metadata in self.__metadata['fields'].items()
+            if metadata['fieldtype'] in ('json', '_json')}
+        query = grouping.to_sql(
+            directive, query, casts, self.__select_params.get('order_by'))
     else:
-        res = [elt for elt in self.select()]
-    if kwargs:
-        res = {res_field_name: res}
-        res.update(kwargs)
-    return json.dumps(res, default=handler)
+        query = f"select coalesce(json_agg(q), '[]')::text as json from ({query}) as q"
+    return self.__read(query, values, lambda cursor: cursor.fetchone()['json'])
+
+def select_columns(self, *args):
+    """Returns the result of the select query by column: a dictionary
+    {column name: sequence of the values}.
+
+    - @args are fields names to restrict the returned columns
+
+    If the disk cache of the model is enabled (see Model.disk_cache), the
+    columns are read from the cache when the query has already been made
+    on the same state of the relations (possibly by another process). The
+    columns are then mapped in memory (see half_orm.disk_cache.Column).
+    """
+    entry = self.__disk_cache_entry('columns', *args)
+    if entry is not None:
+        columns = self._model.disk_cache.get_columns(*entry)
+        if columns is not None:
+            return columns
+    query, values = self._prep_select(*args)
+    self.__execute(query, values)
+    names = [column.name for column in self.__cursor.description]
+    columns = {name: [] for name in names}
+    while True:
+        rows = self.__cursor.fetchmany(10000)
+        if not rows:
+            break
+        for name, values in columns.items():
+            values.extend(row[name] for row in rows)
+    if entry is not None:
+        self._model.disk_cache.put_columns(*entry, columns, self.__read_relations())
+    return columns
+
+def __disk_cache_entry(self, kind, *parts):
+    """Returns the key (fingerprint, marker) of the select query of self in
+    the disk cache or None if the cache is disabled. The fingerprint is
+    computed from the query, its values and parts. The cache is bypassed in
+    a transaction.
+    """
+    cache = self._model.disk_cache
+    if not (cache.enabled and self._model._connection.autocommit):
+        return None
+    query, values = self._prep_select(*(kind == 'columns' and parts or ()))
+    fingerprint = cache.fingerprint(kind, self.__cursor.mogrify(query, values), *parts)
+    return fingerprint, self._model._change_marker(self.__read_relations())
 
 def to_dict(self, str_conv=False):
     """Returns a dictionary containing only the values of the fields
@@ -397,123 +669,237 @@ def __get_set_fields(self):
     """Returns a list containing only the fields that are set."""
     return [field for field in self._fields.values() if field.is_set()]
 
-def __walk_op(self, rel_id_, out=None, _fields_=None):
-    """Walk the set operators tree and return a list of SQL where
-    representation of the query with a list of the fields of the query.
+def __table(self, aliases, only=False):
+    """Returns the Table node of the relation (see sql.alias)."""
+    return sql.Table(self._fqrn, sql.alias(aliases, self.id_), only and self.__only)
+
+def __pkey_sql(self, aliases):
+    """Returns the SQL list of the primary key fields prefixed with the alias."""
+    alias = sql.alias(aliases, self.id_)
+    return ', '.join([field._praf('select', alias) for field in self._pkey.values()])
+
+def __where_node(self, alias=None):
+    """Returns the where expression of the set operations tree of self.
+
+    The fields are prefixed with alias (select queries) unless alias is None
+    (update and delete queries).
     """
-    if out is None:
-        out = []
-        _fields_ = []
     if self.__set_op.op_:
-        if self.__neg:
-            out.append("not (")
-        out.append("(")
-        left = self.__set_op.left
-        left.__query_type = self.__query_type
-        left.__walk_op(rel_id_, out, _fields_)
-        if self.__set_op.right is not None:
-            out.append(f" {self.__set_op.op_}\n    ")
-            right = self.__set_op.right
-            right.__query_type = self.__query_type
-            right.__walk_op(rel_id_, out, _fields_)
-        out.append(")")
-        if self.__neg:
-            out.append(")")
+        node = self.__set_op.left.__where_node(alias)
+        right = self.__set_op.right
+        if right is not None:
+            right_node = right.__where_node(alias)
+            if self.__set_op.op_ == 'or':
+                node = sql.Or(node, right_node)
+            elif self.__set_op.op_ == 'and':
+                node = sql.And(node, right_node)
+            else: # 'and not'
+                node = sql.And(node, sql.Not(right_node))
     else:
-        out.append(self.__where_repr(rel_id_))
-        _fields_ += self.__get_set_fields()
-    return out, _fields_
+        query_type = alias is None and 'update' or 'select'
+        preds = [
+            sql.Pred(field.where_repr(query_type, alias), (field,))
+            for field in self.__get_set_fields()]
+        node = len(preds) == 1 and preds[0] or sql.And(*preds)
+    if self.__neg:
+        node = sql.Not(node)
+    return node
 
-def __join(self, orig_rel, deja_vu):
+def __where_shape(self, params):
+    """Returns the shape of the where expression of self (see __where_node):
+    what determines its SQL text, the values excluded. The fields set are
+    appended to params in the order of the walk.
+    """
+    set_op = self.__set_op
+    if set_op.op_:
+        right = set_op.right
+        shape = (
+            set_op.op_, set_op.left.__where_shape(params),
+            right is not None and right.__where_shape(params) or None)
+    else:
+        shape = []
+        for field in self.__get_set_fields():
+            params.append(field)
+            shape.append(field._shape())
+        shape = tuple(shape)
+    return self.__neg, shape
+
+def __graph_shape(self, params, aliases, fkeys):
+    """Returns the shape of self and of the relations it is joined to
+    (recursively). The relations are identified by their position in the
+    walk (aliases is the dictionary {id_: position} used to alias them in the
+    query, see sql.alias), the foreign keys as well (fkeys is the dictionary
+    {id(fkey): position}).
+
+    Two relations with the same shape have the same SQL queries, only the
+    values differ. The fields set are appended to params in the order of the
+    walk.
+    """
+    shape = [
+        aliases.setdefault(self.id_, len(aliases)),
+        self._fqrn, self.__only, self.__where_shape(params)]
     for fkey, fk_rel in self._joined_to.items():
-        fk_rel.__query_type = orig_rel.__query_type
-        fk_rel.__get_from(orig_rel, deja_vu)
-        if fk_rel.id_ not in deja_vu:
-            deja_vu[fk_rel.id_] = []
-        elif (fk_rel, fkey) in deja_vu[fk_rel.id_] or fk_rel is orig_rel:
-            #sys.stderr.write(f"déjà vu in from! {fk_rel._fqrn}\n")
+        seen = fk_rel.id_ in aliases
+        shape.append((
+            fkeys.setdefault(id(fkey), len(fkeys)),
+            fkey._shape(aliases),
+            aliases.setdefault(fk_rel.id_, len(aliases))))
+        if not seen:
+            shape.append(fk_rel.__graph_shape(params, aliases, fkeys))
+    return tuple(shape)
+
+def __compiled(self, key, params, compile_):
+    """Returns the SQL text and the values of a query.
+
+    key is the shape of the query. The query is compiled (compile_()) only if
+    key is not in the SQL cache of the model (see Model.sql_cache). params is
+    the list of the objects passed as values (Field and sql.Param objects) in
+    the order of the walk that produced key: the cache stores the SQL text
+    with the positions of its values in params.
+    """
+    cache = self._model.sql_cache
+    compiled = cache.get(key)
+    if compiled is None:
+        query, values = compile_()
+        positions = {id(param): idx for idx, param in enumerate(params)}
+        try:
+            cache.put(key, (query, tuple(positions[id(value)] for value in values)))
+        except KeyError:
+            # a value is not in params. The query is not cached.
+            pass
+        return query, tuple(values)
+    query, positions = compiled
+    return query, tuple(params[idx] for idx in positions)
+
+def __add_joins(self, select, deja_vu, aliases):
+    """Adds to the select node the joins on the relations self is joined to
+    (recursively). Their constraints are added to the where clause of the
+    select node (an And node).
+
+    deja_vu is a dictionary {relation id_: set of the fkeys ids}. The value is
+    None for the relation selected. aliases is the dictionary of the aliases
+    of the query (see sql.alias).
+    """
+    for fkey, fk_rel in self._joined_to.items():
+        fkeys = deja_vu.setdefault(fk_rel.id_, set())
+        if fkeys is None or id(fkey) in fkeys:
             continue
-        deja_vu[fk_rel.id_].append((fk_rel, fkey))
-        if fk_rel.__set_op.op_:
-            fk_rel.__get_from(self.id_)
-        _, where, values = fk_rel.__where_args()
-        where = f" and\n    {where}"
-        orig_rel.__sql_query.insert(1, f'\n  join {__sql_id(fk_rel)} on\n   ')
-        orig_rel.__sql_query.insert(2, fkey._join_query(self))
-        orig_rel.__sql_query.append(where)
-        orig_rel.__sql_values += values
-
-def __sql_id(self):
-    """Returns the FQRN as alias for the sql query."""
-    return f"{self._fqrn} as r{self.id_}"
-
-def __get_from(self, orig_rel=None, deja_vu=None):
-    """Constructs the __sql_query and gets the __sql_values for self."""
-    if deja_vu is None:
-        orig_rel = self
-        self.__sql_query = [__sql_id(self)]
-        deja_vu = {self.id_:[(self, None)]}
-    self.__join(orig_rel, deja_vu)
-
-def __where_repr(self, rel_id_):
-    where_repr = []
-    for field in self.__get_set_fields():
-        where_repr.append(field.where_repr(self.__query_type, rel_id_))
-    where_repr = ' and\n    '.join(where_repr) or '1 = 1'
-    ret = f"({where_repr})"
-    if self.__neg:
-        ret = f"not ({ret})"
-    return ret
-
-def __where_args(self, *args):
-    """Returns the what, where and values needed to construct the queries.
+        first_seen = not fkeys
+        fkeys.add(id(fkey))
+        select.joins.append(sql.Join(
+            fk_rel.__table(aliases), sql.Pred(fkey._join_query(self, aliases))))
+        if first_seen:
+            select.where.items.append(fk_rel.__where_node(sql.alias(aliases, fk_rel.id_)))
+            fk_rel.__add_joins(select, deja_vu, aliases)
+
+def __exists_nodes(self, deja_vu, aliases):
+    """Returns the list of the "exists" sub-queries constraining self with the
+    relations it is joined to (each sub-query is correlated to self).
+
+    Returns None if a relation is reached twice in the join graph. The
+    constraints can't then be split in independent semi-joins.
     """
-    rel_id_ = self.id_
-    what = f'r{rel_id_}.*'
-    if args:
-        what = ', '.join([f'r{rel_id_}.{arg}' for arg in args])
-    s_where, set_fields = self.__walk_op(rel_id_)
-    s_where = ''.join(s_where)
-    if s_where == '()':
-        s_where = '(1 = 1)'
-    return what, s_where, set_fields
-
-def __get_query(self, query_template, *args):
-    """Prepare the SQL query to be executed."""
-    self.__sql_values = []
-    self.__query_type = 'select'
-    what, where, values = self.__where_args(*args)
-    where = f"\nwhere\n    {where}"
-    self.__get_from()
-    # remove duplicates
-    for idx, elt in reversed(list(enumerate(self.__sql_query))):
-        if elt.find('\n  join ') == 0 and self.__sql_query.count(elt) > 1:
-            self.__sql_query[idx] = '  and\n'
-    return (
-        query_template.format(
-            what,
-            self.__only and "only" or "",
-            ' '.join(self.__sql_query), where),
-        values)
+    nodes = []
+    for fkey, fk_rel in self._joined_to.items():
+        if fk_rel.id_ in deja_vu:
+            return None
+        deja_vu.add(fk_rel.id_)
+        exists = fk_rel.__exists_nodes(deja_vu, aliases)
+        if exists is None:
+            return None
+        nodes.append(sql.Exists(sql.Select(
+            ['1'], fk_rel.__table(aliases),
+            where=sql.And(
+                sql.Pred(fkey._join_query(self, aliases)),
+                fk_rel.__where_node(sql.alias(aliases, fk_rel.id_)), *exists))))
+    return nodes
+
+def __select_node(self, aliases, *args, joins=True):
+    """Returns the Select node of the relation. @args are the fields to select.
+
+    The relations constrained through the foreign keys are joined to self
+    unless joins is False.
+    """
+    alias = sql.alias(aliases, self.id_)
+    select = sql.Select(
+        [f'{alias}.{arg}' for arg in args] or [f'{alias}.*'],
+        self.__table(aliases, only=True),
+        where=sql.And(self.__where_node(alias)))
+    if joins:
+        self.__add_joins(select, {self.id_: None}, aliases)
+    return select
+
+def __semi_join_node(self, aliases, *args):
+    """Returns the Select node of the relation in which the relations joined
+    through the foreign keys are only used as filters: each one is compiled
+    in an "exists" sub-query if the join graph is a tree. Otherwise, the
+    primary key of the relation is constrained with "in (sub-query)".
+
+    Returns None if the relation has no primary key and the join graph is
+    not a tree.
+    """
+    exists = self.__exists_nodes({self.id_}, aliases)
+    select = self.__select_node(aliases, *args, joins=False)
+    if exists is not None:
+        select.where = sql.And(select.where, *exists)
+        return select
+    if not self._pkey:
+        return None
+    pkey = self.__pkey_sql(aliases)
+    select.where = sql.In(pkey, self.__select_node(aliases).copy(what=[pkey]))
+    return select
 
 def _prep_select(self, *args):
-    self.__sql_values = []
-    query_template = f"select\n {self.__select_params.get('distinct', '')} {{}}\nfrom\n  {{}} {{}}\n  {{}}"
-    query, values = self.__get_query(query_template, *args)
-    values = tuple(self.__sql_values + values)
-    if 'order_by' in self.__select_params.keys():
-        query = f"{query} order by {self.__select_params['order_by']}"
-    if 'limit' in self.__select_params.keys():
-        query = f"{query} limit {self.__select_params['limit']}"
-    if 'offset' in self.__select_params.keys():
-        query = f"{query} offset {self.__select_params['offset']}"
-    return query, values
+    """Returns the SQL select query and its values.
+
+    The SQL text is compiled once for all the relations of the same shape
+    (see __compiled).
+    """
+    select_params = self.__select_params
+    distinct = bool(select_params.get('distinct'))
+    semi_join = bool(select_params.get('semi_join'))
+    params = []
+    aliases = {}
+    key = (
+        'select', args, distinct, semi_join, select_params.get('order_by'),
+        self.__graph_shape(params, aliases, {}))
+    limit_offset = []
+    for name in ('limit', 'offset'):
+        value = select_params.get(name)
+        limit_offset.append(value is not None and sql.Param(value) or None)
+        key += (value is not None,)
+    params += [param for param in limit_offset if param is not None]
+
+    def compile_():
+        "Compiles the select query."
+        select = None
+        nonlocal distinct
+        if semi_join:
+            select = self.__semi_join_node(aliases, *args)
+            distinct = distinct or select is None
+        if select is None:
+            select = self.__select_node(aliases, *args)
+        limit, offset = limit_offset
+        return select.simplify().copy(
+            distinct=distinct, order_by=select_params.get('order_by'),
+            limit=limit, offset=offset).compile()
+
+    return self.__compiled(key, params, compile_)
 
 def distinct(self):
     """Set distinct in SQL select request."""
     self.__select_params['distinct'] = 'distinct'
     return self
 
+def semi_join(self):
+    """The relations joined through the foreign keys are used as filters only.
+
+    They are compiled in "exists" (or "in") sub-queries instead of joins. The
+    rows of the relation are not multiplied by the joins: distinct is useless.
+    """
+    self.__select_params['semi_join'] = True
+    return self
+
 def unaccent(self, *fields_names):
     "Sets unaccent for each field listed in fields_names"
     for field_name in fields_names:
@@ -541,18 +927,158 @@ def offset(self, _offset_):
     self.__select_params['offset'] = _offset_
     return self
 
+def __read_relations(self):
+    """Returns the set of the relations (sfqrn) read by the select queries of
+    self: self and the relations it is joined to (recursively).
+    """
+    relations = set()
+    deja_vu = set()
+    todo = [self]
+    while todo:
+        relation = todo.pop()
+        if id(relation) in deja_vu:
+            continue
+        deja_vu.add(id(relation))
+        relations.add(relation.__sfqrn)
+        todo += relation._joined_to.values()
+    return frozenset(relations)
+
+def __read(self, query, values, fetch):
+    """Executes the read query and returns fetch(cursor).
+
+    If the result cache of the model is enabled (see Model.result_cache), the
+    result is looked up in the cache before the query is executed. If the
+    single flight layer is enabled (see Model.single_flight), the result of
+    an identical query running in another thread is shared. fetch must then
+    return an immutable value. Both are bypassed in a transaction.
+    """
+    cache = self._model.result_cache
+    single_flight = self._model.single_flight
+    if not ((cache.enabled or single_flight.enabled) and self._model._connection.autocommit):
+        self.__execute(query, values)
+        return fetch(self.__cursor)
+    key = self.__cursor.mogrify(query, values)
+    if cache.enabled:
+        result = cache.get(key)
+        if result is not None:
+            return result
+    def execute():
+        "Executes the query and stores its result in the cache."
+        self.__execute(query, values)
+        result = fetch(self.__cursor)
+        if cache.enabled:
+            cache.put(key, result, self.__read_relations())
+        return result
+    if single_flight.enabled:
+        return single_flight.do(key, execute)
+    return execute()
+
+def __replica_rows(self, *args):
+    """Returns the rows of self found in the replica of the relation (see
+    Model.replicate) or None if the relation is not replicated or if the
+    query can't be answered locally.
+    """
+    replica = self._model._replicas.get(self.__sfqrn)
+    if (replica is None or not self._model._connection.autocommit or
+            self._joined_to or self.__set_op.op_ or self.__neg or self.__only or
+            any(self.__select_params.get(param) is not None
+                for param in ('order_by', 'limit', 'offset'))):
+        return None
+    return replica.rows(
+        self.__get_set_fields(), args, bool(self.__select_params.get('distinct')))
+
 def select(self, *args) -> Generator[any, None, None]:
     """Generator. Yields the result of the query as a dictionary.
 
     - @args are fields names to restrict the returned attributes
+
+    The elements of the relations set with prefetch are added to the rows.
     """
+    prefetch_ = self.__select_params.get('prefetch')
+    if prefetch_:
+        return iter(self.__prefetched(prefetch_, *args))
+    return self.__select(*args)
+
+def __select(self, *args):
+    """Returns the result of the select query (iterator on dictionaries)."""
+    rows = self.__replica_rows(*args)
+    if rows is not None:
+        return iter(rows)
     query, values = self._prep_select(*args)
+    cached = self._model.result_cache.enabled or self._model.single_flight.enabled
     try:
-        self.__execute(query, values)
+        if cached:
+            rows = self.__read(query, values, lambda cursor: tuple(cursor.fetchall()))
+            return (dict(row) for row in rows)
+        return self.__read(query, values, lambda cursor: cursor)
     except Exception as err:
         sys.stderr.write(f"QUERY: {query}\nVALUES: {values}\n")
         raise err
-    return self.__cursor
+
+def prefetch(self, *fkeys_names):
+    """Sets the foreign keys whose relations are loaded with the next select.
+
+    - @fkeys_names are the names of the foreign keys or of their properties
+      (see FKEYS). The reverse foreign keys are supported.
+
+    Each foreign key is loaded with one query for all the rows selected. The
+    elements are added to the rows under the name given: a dictionary (or
+    None) for a foreign key, a list of dictionaries for a reverse foreign key.
+    The rows referencing the same element share the same dictionary.
+
+    >>> for post in Post().prefetch('author_', 'comment_fk').select():
+    ...     print(post['author_']['last_name'], len(post['comment_fk']))
+    """
+    for name in fkeys_names:
+        self.__prefetch_fkey(name)
+    self.__select_params['prefetch'] = fkeys_names
+    return self
+
+def __prefetch_fkey(self, name):
+    """Returns the pair (fkey name, FKey) corresponding to name (the name of
+    a foreign key or of its property).
+    """
+    fkey_name = self.__fkeys_aliases.get(name, name)
+    if name in self._fields or fkey_name not in self._fkeys:
+        raise relation_errors.UnknownAttributeError(name)
+    return fkey_name, self._fkeys[fkey_name]
+
+def __prefetched(self, names, *args):
+    """Returns the list of the rows selected with the elements of the foreign
+    keys names (see prefetch).
+    """
+    fkeys = [(name, *self.__prefetch_fkey(name)) for name in names]
+    missing = []
+    if args:
+        selected = {_column_name(arg) for arg in args}
+        for _, _, fkey in fkeys:
+            missing += [
+                name for name in fkey.names if name not in selected and name not in missing]
+    rows = list(self.__select(*args, *missing))
+    for name, fkey_name, fkey in fkeys:
+        reverse = fkey_name.find('_reverse_') == 0
+        keys = {tuple(row[field] for field in fkey.names) for row in rows}
+        keys = [key for key in keys if None not in key]
+        index = {}
+        if keys:
+            qrn = fkey.fk_fqrn.split('.', 1)[1]
+            columns = ', '.join(f'"{field}"' for field in fkey.fk_names)
+            if len(fkey.fk_names) == 1:
+                query = f'select * from {qrn} where {columns} = any(%s)'
+                values = ([key[0] for key in keys],)
+            else:
+                query = f'select * from {qrn} where ({columns}) in %s'
+                values = (tuple(keys),)
+            for element in self._model.execute_query(query, values):
+                index.setdefault(
+                    tuple(element[field] for field in fkey.fk_names), []).append(dict(element))
+        for row in rows:
+            elements = index.get(tuple(row[field] for field in fkey.names), [])
+            row[name] = elements if reverse else (elements[0] if elements else None)
+    for row in rows:
+        for field in missing:
+            del row[field]
+    return rows
 
 def _mogrify(self):
     """Prints the select query."""
@@ -563,79 +1089,188 @@ def get(self):
     """Returns the Relation object extracted.
 
     Raises an exception if no or more than one element is found.
+
+    In the scope of an identity map (see half_orm.identity_map), the object
+    is looked up in the map first if self is constrained by its primary key
+    only.
     """
+    identity_map = IdentityMap.current()
+    if identity_map is not None:
+        key = self.__identity_key()
+        ret = identity_map.get(key) if key else None
+        if ret is not None:
+            self._is_singleton = True
+            ret._is_singleton = True
+            return ret
     _count = len(self)
     if _count != 1:
         raise relation_errors.ExpectedOneError(self, _count)
     self._is_singleton = True
     ret = self(**(next(self.select())))
     ret._is_singleton = True
+    if identity_map is not None and ret._pkey:
+        identity_map.put(
+            (ret.__class__, tuple(field.value for field in ret._pkey.values())), ret)
     return ret
 
+def __identity_key(self):
+    """Returns the key of self in the identity map: (class, primary key
+    values), or None if self is not constrained by its primary key only.
+    """
+    if (not self._pkey or self._joined_to or self.__set_op.op_ or self.__neg or
+            self.__only):
+        return None
+    fields = self.__get_set_fields()
+    if {field.name for field in fields} != set(self._pkey) or any(
+            field.comp() != '=' or field.unaccent for field in fields):
+        return None
+    return (self.__class__, tuple(field.value for field in self._pkey.values()))
+
+def __count_query(self, *args, _distinct=False, _semi_join=False):
+    """Returns the query and the values to count the elements of the relation.
+    The SQL text is compiled once for all the relations of the same shape (see
+    __count_node).
+    """
+    params = []
+    aliases = {}
+    key = ('count', args, _distinct, _semi_join, self.__graph_shape(params, aliases, {}))
+    return self.__compiled(
+        key, params,
+        lambda: self.__count_node(
+            aliases, *args, _distinct=_distinct, _semi_join=_semi_join).compile())
+
+def __count_node(self, aliases, *args, _distinct=False, _semi_join=False):
+    """Returns the Select node counting the elements of the relation.
+
+    With _semi_join, the rows of the select query in semi join mode are
+    counted (see semi_join): the distinct rows only if the relation has no
+    primary key and the join graph is not a tree.
+
+    With _distinct and no argument, the cheapest correct count is generated:
+    - the relations joined through the foreign keys are only filters. They are
+      compiled in "exists" sub-queries so that the rows are not multiplied and
+      count(*) is used (count(*) is also used if there is no join at all);
+    - if a relation is reached twice in the join graph, the joins are kept
+      and the distinct values of the primary key are counted.
+    The rows are compared as a whole (count(distinct r.*)) only if the
+    relation has no primary key.
+    """
+    if _semi_join:
+        select = self.__semi_join_node(aliases)
+        if select is not None:
+            select.what = ['count(*)']
+            return select.simplify()
+        _distinct = True
+    if args or not _distinct:
+        select = self.__select_node(aliases, *args)
+        what = args and ', '.join(select.what) or '*'
+        select.what = [f"count({_distinct and 'distinct ' or ''}{what})"]
+    else:
+        exists = self.__exists_nodes({self.id_}, aliases)
+        if exists is not None:
+            select = self.__select_node(aliases, joins=False)
+            select.where = sql.And(select.where, *exists)
+            if self._pkey:
+                select.what = ['count(*)']
+        else:
+            select = self.__select_node(aliases)
+            if self._pkey:
+                pkey = self.__pkey_sql(aliases)
+                select.what = [len(self._pkey) > 1 and f'({pkey})' or pkey]
+        if select.what[0] != 'count(*)':
+            select.what = [f'count(distinct {select.what[0]})']
+    return select.simplify()
+
 def __len__(self):
     """Returns the number of tuples matching the intention in the relation.
 
     See select for arguments.
     """
-    self.__query = "select"
-    query_template = "select\n  count(distinct {})\nfrom {}\n  {}\n  {}"
-    query, values = self.__get_query(query_template)
-    try:
-        vars_ = tuple(self.__sql_values + values)
-        self.__execute(query, vars_)
-    except Exception as err:
-        self._mogrify()
-        self.__execute(query, vars_)
-    return self.__cursor.fetchone()['count']
+    return self.count(_distinct=True)
 
 def is_empty(self):
     """Returns True if the relation is empty, False otherwise.
 
-    Same as __len__ but limits the request to 1 element (faster).
+    Faster than __len__: the request stops at the first element found.
     Use it instead of len(relation) == 0.
     """
-    self.__query = "select"
-    query_template = "select\n  count(distinct {})\nfrom {}\n  {}\n  {} limit 1"
-    query, values = self.__get_query(query_template)
+    rows = self.__replica_rows()
+    if rows is not None:
+        return not rows
+    params = []
+    aliases = {}
+    key = ('is_empty', self.__graph_shape(params, aliases, {}))
+    limit = sql.Param(1)
+    params.append(limit)
+    query, vars_ = self.__compiled(
+        key, params,
+        lambda: self.__select_node(aliases).copy(what=['1'], limit=limit).simplify().compile())
     try:
-        vars_ = tuple(self.__sql_values + values)
-        self.__execute(query, vars_)
+        return self.__read(query, vars_, lambda cursor: cursor.fetchone() is None)
     except Exception as err:
         print(query, vars_)
         raise err
-    return self.__cursor.fetchone()['count'] != 1
 
 def count(self, *args, _distinct=False):
     """Returns the number of tuples matching the intention in the relation.
 
     See select for arguments.
     """
-    self.__query = "select"
-    if _distinct:
-        query_template = "select\n  count(distinct {})\nfrom {}\n  {}\n  {}"
-    else:
-        query_template = "select\n  count({})\nfrom {}\n  {}\n  {}"
-    query, values = self.__get_query(query_template, *args)
+    # in semi join mode, the rows returned by select are counted.
+    semi_join = bool(self.__select_params.get('semi_join')) and not args and not _distinct
+    if not args and (self._pkey or not _distinct):
+        rows = self.__replica_rows()
+        if rows is not None:
+            return len(rows)
+    query, vars_ = self.__count_query(*args, _distinct=_distinct, _semi_join=semi_join)
+    def fetch(cursor):
+        "Returns the count."
+        return cursor.fetchone()['count']
     try:
-        vars_ = tuple(self.__sql_values + values)
-        self.__execute(query, vars_)
+        return self.__read(query, vars_, fetch)
     except Exception as err:
         self._mogrify()
-        self.__execute(query, vars_)
-    return self.__cursor.fetchone()['count']
+        return self.__read(query, vars_, fetch)
+
+def __dml_where(self):
+    """Returns the where clause (SQL text and values) of the update and delete
+    queries. The constraints on the foreign keys are compiled in
+    "(fields) in (sub-query)".
+
+    The where clause is compiled once for all the relations of the same shape
+    (see __compiled).
+    """
+    params = []
+    where_shape = self.__where_shape(params)
+    fk_preds = []
+    for fkey in self._fkeys.values():
+        fk_prep_select = fkey._prep_select()
+        if fk_prep_select is not None:
+            fk_fields, (fk_query, fk_values) = fk_prep_select
+            params += fk_values
+            fk_preds.append(sql.Pred(f"({', '.join(fk_fields)}) in ({fk_query})", fk_values))
+
+    def compile_():
+        "Compiles the where clause."
+        where = sql.And(self.__where_node(), *fk_preds).simplify()
+        if where is sql.TRUE:
+            return '', []
+        where, values = where.compile()
+        return f' where {where}', values
+
+    key = ('dml', where_shape, tuple(pred.sql for pred in fk_preds))
+    return self.__compiled(key, params, compile_)
 
 def __update_args(self, **kwargs):
     """Returns the what, where an values for the update query."""
     what_fields = []
     new_values = []
-    self.__query_type = 'update'
-    _, where, values = self.__where_args()
-    where = f" where {where}"
+    where, values = self.__dml_where()
     for field_name, new_value in kwargs.items():
         what_fields.append(field_name)
         new_values.append(new_value)
     what = ", ".join([f'"{elt}" = %s' for elt in what_fields])
-    return what, where, new_values + values
+    return what, where, new_values + list(values)
 
 def update(self, update_all=False, **kwargs):
     """
@@ -655,15 +1290,11 @@ def update(self, update_all=False, **kwargs):
             f'Attempt to update all rows of {self.__class__.__name__}'
             ' without update_all being set to True!')
 
-    query_template = "update {} set {} {}"
+    query_template = "update {} set {}{}"
     what, where, values = self.__update_args(**update_args)
-    _, _, fk_fields, fk_query, fk_values = self.__what_to_insert()
-    if fk_fields:
-        fk_where = " and ".join([f"({a}) in ({b})" for a, b in zip(fk_fields, fk_query)])
-        where = f"{where} and {fk_where}"
-        values += fk_values
     query = query_template.format(self._fqrn, what, where)
     self.__execute(query, tuple(values))
+    self._model._relation_changed(*self.__sfqrn[1:])
     for field_name, value in update_args.items():
         self._fields[field_name].set(value)
 
@@ -688,7 +1319,6 @@ def __what_to_insert(self):
 def insert(self):
     """Insert a new tuple into the Relation."""
     query_template = "insert into {} ({}) values ({}) returning *"
-    self.__query_type = 'insert'
     fields_names, values, fk_fields, fk_query, fk_values = self.__what_to_insert()
     what_to_insert = ["%s" for _ in range(len(values))]
     if fk_fields:
@@ -697,6 +1327,7 @@ def insert(self):
         values += fk_values
     query = query_template.format(self._fqrn, ", ".join(fields_names), ", ".join(what_to_insert))
     self.__execute(query, tuple(values))
+    self._model._relation_changed(*self.__sfqrn[1:])
     return self.__cursor.fetchall()
 
 def delete(self, delete_all=False):
@@ -707,19 +1338,11 @@ def delete(self, delete_all=False):
         raise ValueError(
             f'Attempt to delete all rows from {self.__class__.__name__}'
             ' without delete_all being set to True!')
-    query_template = "delete from {} {}"
-    self.__query_type = 'delete'
-    _, where, values = self.__where_args()
-    _, values, fk_fields, fk_query, fk_values = self.__what_to_insert()
-    where = f" where {where}"
-    if where == "(1 = 1)" and not delete_all:
-        raise RuntimeError
-    if fk_fields:
-        fk_where = " and ".join([f"({a}) in ({b})" for a, b in zip(fk_fields, fk_query)])
-        where = f"{where} and {fk_where}"
-        values += fk_values
+    query_template = "delete from {}{}"
+    where, values = self.__dml_where()
     query = query_template.format(self._fqrn, where)
     self.__execute(query, tuple(values))
+    self._model._relation_changed(*self.__sfqrn[1:])
 
 def __call__(self, **kwargs):
     return self.__class__(**kwargs)
@@ -733,7 +1356,121 @@ def cast(self, qrn):
     new.__set_op = self.__set_op
     return new
 
-def join(self, *f_rels):
+def to_intent(self):
+    """Returns the intent of self (see half_orm.intent): a picklable and
+    hashable description of its constraints, of the relations it is joined
+    to and of its select parameters. See from_intent.
+    """
+    nodes = []
+    edges = []
+    self.__intent_walk(nodes, edges, {})
+    return Intent(tuple(nodes), tuple(edges))
+
+def __intent_walk(self, nodes, edges, positions):
+    """Adds the node of self and the edges of the foreign keys set to nodes
+    and edges, then walks the relations self is joined to. positions is the
+    dictionary {relation id_: position of its node}.
+    """
+    position = positions[self.id_] = len(nodes)
+    nodes.append((
+        self.__sfqrn, self.__only, self.__where_intent(),
+        tuple(sorted(self.__select_params.items()))))
+    for fkey, fk_rel in self._joined_to.items():
+        if fk_rel.id_ not in positions:
+            fk_rel.__intent_walk(nodes, edges, positions)
+        name, fk_names, names = fkey._intent()
+        reverse = None
+        if name.find('_reverse_') == 0 and name[9:].isdigit():
+            # reverse fkey built by FKey.__call__ (named after an id).
+            name, reverse = None, (fk_names, names)
+        edges.append((position, name, reverse, positions[fk_rel.id_]))
+
+def __where_intent(self):
+    """Returns the tree of the constraints of self (see __where_node)."""
+    set_op = self.__set_op
+    if set_op.op_:
+        right = set_op.right
+        return (
+            'op', self.__neg, set_op.op_, set_op.left.__where_intent(),
+            right is not None and right.__where_intent() or None)
+    return (
+        'fields', self.__neg, tuple(field._intent() for field in self.__get_set_fields()))
+
+def __where_relation(cls, where):
+    """Returns the relation of class cls with the constraints described by
+    where (see __where_intent).
+    """
+    kind, neg, *args = where
+    if kind == 'fields':
+        relation = cls()
+        for name, comp, value, unaccent in args[0]:
+            relation._fields[name].set(comp, value)
+            relation._fields[name].unaccent = unaccent
+    else:
+        op_, left, right = args
+        relation = __where_relation(cls, left).__set__op__(
+            op_, right is not None and __where_relation(cls, right) or None)
+    relation.__neg = neg
+    return relation
+
+def from_intent(cls, intent):
+    """Returns the relation object described by the intent (see to_intent).
+    The relation is an instance of cls if cls is the class of the relation
+    described.
+    """
+    model = cls._model
+    get_rel = model._import_class if model._scope else model.get_relation_class
+    relations = []
+    for sfqrn, only, where, select_params in intent.nodes:
+        rel_class = cls
+        if sfqrn != getattr(cls, '__sfqrn') or relations:
+            rel_class = get_rel(_sfqrn_qtn(sfqrn))
+        relation = __where_relation(rel_class, where)
+        relation.__only = only
+        relation.__select_params.update(select_params)
+        relations.append(relation)
+    for from_, name, reverse, to_ in intent.edges:
+        relation = relations[from_]
+        if name is None:
+            from half_orm.fkey import FKey
+            name = f'_reverse_{relation.id_}'
+            fk_names, names = reverse
+            relation._fkeys[name] = FKey(
+                name, relation, relation._fqrn.split('.'), list(fk_names), list(names))
+        relation._fkeys[name].set(relations[to_])
+    return relations[0]
+
+def _sfqrn_qtn(sfqrn):
+    "Returns the <schema>.<relation> name of the relation sfqrn."
+    schema = sfqrn[1]
+    if '.' in schema:
+        schema = f'"{schema}"'
+    return f'{schema}.{sfqrn[2]}'
+
+def _column_name(arg):
+    """Returns the name of the column returned by the select argument arg
+    (field name, quoted or not, or expression aliased with "as").
+    """
+    name = re.split(r'\s+as\s+', arg.strip(), flags=re.IGNORECASE)[-1]
+    if len(name) > 1 and name[0] == name[-1] == '"':
+        return name[1:-1].replace('""', '"')
+    return name
+
+_TO_PROCESS = frozenset(
+    {uuid.UUID, datetime.date, datetime.datetime, datetime.time, datetime.timedelta})
+
+def _to_str(value):
+    """Returns value in string format if the type of value is
+    in _TO_PROCESS
+
+    Args:
+        value (any): the value to return in string format.
+    """
+    if value.__class__ in _TO_PROCESS:
+        return str(value)
+    return value
+
+def join(self, *f_rels, single_query=False):
     """Joins data to self.select() result. Returns a dict
     f_rels is a list of [(obj: Relation(), name: str, fields: Optional(<str|str[]>)), ...].
 
@@ -744,31 +1481,25 @@ def join(self, *f_rels):
     Otherwise (str[]), res[name] is a list of dict.
     If the fields argument is ommited, all the fields of obj are returned in a list of dict.
 
+    With single_query, the whole join is compiled in one SQL statement (see
+    __join_query): PostgreSQL builds the lists with json_agg. The values of
+    the lists are then converted by PostgreSQL (JSON representation: the
+    timestamps are in ISO 8601 format).
+
     Raises:
         RuntimeError: if self.__class__ and foreign.__class__ don't have fkeys to each other.
 
     Returns:
         dict: all values are converted to string.
     """
-    def to_str(value):
-        """Returns value in string format if the type of value is
-        in TO_PROCESS
-
-        Args:
-            value (any): the value to return in string format.
-        """
-        #pylint: disable=import-outside-toplevel
-        from uuid import UUID
-        from datetime import date, datetime, time, timedelta
-
-        TO_PROCESS = {UUID, date, datetime, time, timedelta}
-        if value.__class__ in TO_PROCESS:
-            return str(value)
-        return value
+    if single_query:
+        query, values = self.__join_query(*f_rels)
+        self.__execute(query, values)
+        return [{key: _to_str(value) for key, value in elt.items()} for elt in self.__cursor]
 
     # constraint = {self.__dict__[field].name: self.__dict__[field].value for field in self._fields}
     res = list(
-        {key: to_str(value) for key, value in elt.items()}
+        {key: _to_str(value) for key, value in elt.items()}
         for elt in self.distinct().select()
     )
     result_as_list = False
@@ -810,16 +1541,16 @@ def join(self, *f_rels):
         if not fkey_found:
             raise RuntimeError(f"No foreign key between {self._fqrn} and {f_relation._fqrn}!")
 
-        inter = [{key: to_str(val) for key, val in elt.items()}
+        inter = [{key: _to_str(val) for key, val in elt.items()}
             for elt in remote1().distinct().select(*([f'"{field}"' for field in fields] + f_relation_fk_names))]
         for elt in inter:
             key = tuple(elt[subelt] for subelt in f_relation_fk_names)
             if key not in res_remote:
                 res_remote[key] = []
             if result_as_list:
-                res_remote[key].append(to_str(elt[fields[0]]))
+                res_remote[key].append(_to_str(elt[fields[0]]))
             else:
-                res_remote[key].append({key: to_str(elt[key]) for key in fields})
+                res_remote[key].append({key: _to_str(elt[key]) for key in fields})
 
         if relation1_pk_names:
             for delt in res:
@@ -835,6 +1566,62 @@ def join(self, *f_rels):
 
     return res
 
+def __join_query(self, *f_rels):
+    """Returns the query and the values of join in single_query mode:
+
+        select r0.*, l1.v as "<name>", ...
+        from (<self.distinct() select query>) as r0
+          left join lateral (
+            select coalesce(json_agg(r1), '[]') as v
+            from (select distinct <fields> from <f_rel> where <fkey> = r0.<key>) as r1
+          ) as l1 on true
+          ...
+    """
+    query, values = self.distinct()._prep_select()
+    what = ['r0.*']
+    laterals = []
+    for idx, f_rel in enumerate(f_rels, 1):
+        if not isinstance(f_rel, tuple):
+            raise RuntimeError("f_rels must be a list of tuples.")
+        if len(f_rel) == 3:
+            f_relation, name, fields = f_rel
+        elif len(f_rel) == 2:
+            f_relation, name = f_rel
+            fields = list(f_relation._fields.keys())
+        else:
+            raise RuntimeError(f"f_rel must have 2 or 3 arguments. Got {len(f_rel)}.")
+        result_as_list = isinstance(fields, str)
+        if result_as_list:
+            fields = [fields]
+        bounds = self.__join_bounds(f_relation)
+        if bounds is None:
+            raise RuntimeError(f"No foreign key between {self._fqrn} and {f_relation._fqrn}!")
+        columns = ', '.join(f'"{field}"' for field in fields)
+        where = ' and '.join(f'"{remote}" = r0."{local}"' for local, remote in bounds)
+        element = result_as_list and f'r{idx}."{fields[0]}"' or f'r{idx}'
+        laterals.append(
+            f"left join lateral (\n"
+            f"    select coalesce(json_agg({element}), '[]') as v\n"
+            f"    from (select distinct {columns} from {f_relation._fqrn} where {where}) as r{idx}\n"
+            f"  ) as l{idx} on true")
+        what.append(f'l{idx}.v as "{name}"')
+    query = '\n'.join([
+        f"select {', '.join(what)}", f"from ({query}) as r0", *[f'  {elt}' for elt in laterals]])
+    return query, values
+
+def __join_bounds(self, f_relation):
+    """Returns the list of the pairs (field of self, field of f_relation)
+    joining self and f_relation through a foreign key (direct or reverse) or
+    None if there is none.
+    """
+    for fkey in self._fkeys.values():
+        if fkey.fk_fqrn == f_relation._fqrn:
+            return list(zip(fkey.names, fkey.fk_names))
+    for fkey in f_relation._fkeys.values():
+        if fkey.fk_fqrn == self._fqrn:
+            return list(zip(fkey.fk_names, fkey.names))
+    return None
+
 def __set__op__(self, op_=None, right=None):
     """Si l'opérateur du self est déjà défini, il faut aller modifier
     l'opérateur du right ???
@@ -961,6 +1748,7 @@ COMMON_INTERFACE = {
     'limit': limit,
     'offset': offset,
     'distinct': distinct,
+    'semi_join': semi_join,
     'unaccent': unaccent,
     '__call__': __call__,
     'cast': cast,
@@ -971,20 +1759,52 @@ COMMON_INTERFACE = {
     'is_empty': is_empty,
     'group_by':group_by,
     'to_json': to_json,
+    'to_json_stream': to_json_stream,
+    'copy_to': copy_to,
+    'to_parquet': to_parquet,
+    'parallel_select': parallel_select,
+    'parallel_load': parallel_load,
+    'to_intent': to_intent,
+    '__intent_walk': __intent_walk,
+    '__where_intent': __where_intent,
+    'from_intent': classmethod(from_intent),
+    '__split_field': __split_field,
+    '__json_chunks': __json_chunks,
+    '__json_document': __json_document,
+    'select_columns': select_columns,
+    '__disk_cache_entry': __disk_cache_entry,
     'to_dict': to_dict,
     '_to_dict_val_comp': _to_dict_val_comp,
-    '__get_from': __get_from,
-    '__get_query': __get_query,
+    '__table': __table,
+    '__pkey_sql': __pkey_sql,
+    '__where_node': __where_node,
+    '__where_shape': __where_shape,
+    '__graph_shape': __graph_shape,
+    '__compiled': __compiled,
+    '__add_joins': __add_joins,
+    '__exists_nodes': __exists_nodes,
+    '__select_node': __select_node,
+    '__semi_join_node': __semi_join_node,
+    '__count_query': __count_query,
+    '__count_node': __count_node,
     'is_set': is_set,
-    '__where_repr': __where_repr,
-    '__where_args': __where_args,
     '_prep_select': _prep_select,
     'select': select,
+    '__select': __select,
+    'prefetch': prefetch,
+    '__prefetch_fkey': __prefetch_fkey,
+    '__prefetched': __prefetched,
     '_mogrify': _mogrify,
+    '__read_relations': __read_relations,
+    '__read': __read,
+    '__replica_rows': __replica_rows,
     '__len__': __len__,
     'count': count,
     'get': get,
+    '__identity_key': __identity_key,
     'join': join,
+    '__join_query': __join_query,
+    '__join_bounds': __join_bounds,
     '__set__op__': __set__op__,
     '__and__': __and__,
     '__iand__': __iand__,
@@ -997,15 +1817,14 @@ COMMON_INTERFACE = {
     '__neg__': __neg__,
     '__contains__': __contains__,
     '__eq__': __eq__,
-    '__sql_id': __sql_id,
-    '__walk_op': __walk_op,
-    '__join': __join,
     'insert': insert,
     '__what_to_insert': __what_to_insert,
     'update': update,
+    '__dml_where': __dml_where,
     '__update_args': __update_args,
     'delete': delete,
     'Transaction': Transaction,
+    'IdentityMap': IdentityMap,
     '_set_fkeys_properties': _set_fkeys_properties,
     '_set_fkey_property': _set_fkey_property,
     '__enter__': __enter__,
@@ -1036,6 +1855,7 @@ def _factory(class_name, bases, dct, reload=False):
     tbl_attr['__cls_fkeys_dict'] = {}
     tbl_attr['__base_classes'] = set()
     tbl_attr['__fkeys_properties'] = False
+    tbl_attr['__fkeys_aliases'] = {}
     tbl_attr['_fqrn'], sfqrn = _normalize_fqrn(dct['fqrn'])
     tbl_attr['_qrn'] = tbl_attr['_fqrn'].split('.', 1)[1].replace('"', '')
     attr_names = ['_dbname', '_schemaname', '_relationname']
@@ -1059,6 +1879,7 @@ def _factory(class_name, bases, dct, reload=False):
         parent_fqrn = ".".join([f'"{elt}"' for elt in parent_fqrn])
         bases.append(_factory(None, None, {'fqrn': parent_fqrn}))
     tbl_attr['__metadata'] = metadata
+    tbl_attr['__json_encoders'] = json_encoders.encoder_table(metadata['fields'])
     if dct.get('model'):
         tbl_attr['_model'] = dct['model']
     tbl_attr['__sfqrn'] = tuple(sfqrn)
@@ -0,0 +1,152 @@
+#-*- coding: utf-8 -*-
+
+"""This module provides the Replica class.
+
+A replica is a copy in the memory of the process of a small relation
+(countries, statuses, roles...) built by Model.replicate:
+
+    >>> model.replicate('actor.role', refresh=300)
+
+The select, get, count and is_empty calls on the relation are then answered
+locally when the constraint is a conjunction of equalities on the fields
+(no foreign key, set operation, order by, limit or offset) on fields whose
+equality in Python is the equality in SQL (EXACT_TYPES, deterministic
+collation). The rows are
+found through hash indexes on the primary key and on each unique column
+(pkey and uniq metadata). The other queries are sent to the database.
+
+The replica is reloaded:
+- refresh seconds after it has been loaded (if refresh is set),
+- after an insert, update or delete made by half_orm on the relation (or on
+  a relation modified with it, see Model._dependent_relations),
+- when the change is notified by the listener of the model (see
+  half_orm.notify).
+
+The replica is not used inside a transaction.
+"""
+
+import time
+
+# the types for which the equality of the values returned by psycopg2 is the
+# equality in SQL. Excluded: bpchar (padding), citext, numeric and floats
+# (NaN), timestamptz (naive values compared in the time zone of the session),
+# json...
+EXACT_TYPES = {
+    'bool', 'int2', 'int4', 'int8', 'oid', 'text', 'varchar', 'name', 'uuid', 'date',
+    'time', 'timestamp', 'bytea'}
+
+def _exact_columns(fields, nondeterministic):
+    """Returns the set of the names of the fields (metadata) on which an
+    equality can be checked in Python: an exact type (EXACT_TYPES) and not
+    in the nondeterministic set (columns with a nondeterministic collation).
+    """
+    return {
+        name for name, field in fields.items()
+        if field['fieldtype'] in EXACT_TYPES and name not in nondeterministic}
+
+class Replica:
+    """In memory copy of the relation sfqrn of the model."""
+    def __init__(self, model, sfqrn, refresh=None):
+        self.__model = model
+        self.__fqrn = '.'.join([f'"{elt}"' for elt in sfqrn])
+        self.refresh = refresh
+        fields = model._metadata['byname'][sfqrn]['fields']
+        self.__columns = tuple(fields)
+        self.__pkey = tuple(name for name, field in fields.items() if field['pkey'])
+        self.__uniques = [(name,) for name, field in fields.items() if field['uniq']]
+        self.__exact = _exact_columns(fields, {
+            elt['attname'] for elt in model.execute_query(
+                """select a.attname
+                   from pg_attribute as a
+                     join pg_collation as c on c.oid = a.attcollation
+                   where a.attrelid = %s::regclass and not c.collisdeterministic""",
+                (self.__fqrn,))})
+        self.__rows = []
+        self.__types = {}
+        self.__indexes = {}
+        self.__loaded_at = None
+        self.stale = True
+        self.hits = 0
+        self.fallbacks = 0
+
+    def load(self):
+        """Loads the relation and builds the indexes."""
+        rows = self.__model.execute_query(f'select * from {self.__fqrn}').fetchall()
+        types = {}
+        for row in rows:
+            for name, value in row.items():
+                if value is not None:
+                    types.setdefault(name, type(value))
+        indexes = {}
+        for columns in [self.__pkey] + self.__uniques:
+            if not columns or columns in indexes:
+                continue
+            index = {}
+            try:
+                for row in rows:
+                    index.setdefault(tuple(row[name] for name in columns), []).append(row)
+            except TypeError:
+                # unhashable values. No index on these columns.
+                continue
+            indexes[columns] = index
+        self.__rows, self.__types, self.__indexes = rows, types, indexes
+        self.__loaded_at = time.monotonic()
+        self.stale = False
+
+    def invalidate(self):
+        """The replica will be reloaded before its next use."""
+        self.stale = True
+
+    def __check(self):
+        "Reloads the replica if it is stale or too old."
+        if self.stale or (
+                self.refresh is not None and
+                time.monotonic() - self.__loaded_at > self.refresh):
+            self.load()
+
+    def stats(self):
+        """Returns the statistics of the replica."""
+        return {
+            'rows': len(self.__rows), 'indexes': list(self.__indexes),
+            'hits': self.hits, 'fallbacks': self.fallbacks}
+
+    def rows(self, fields, args=(), distinct=False):
+        """Returns the list of the rows (dictionaries) matching the fields set,
+        restricted to the columns args. Returns None if the query can't be
+        served locally: a comparator other than "=", a field whose equality
+        differs in Python (see EXACT_TYPES), a value of another type than the
+        column or an unknown column.
+        """
+        self.__check()
+        constraints = {}
+        for field in fields:
+            value = field.value
+            if (field.comp() != '=' or field.unaccent or field.name not in self.__exact or
+                    type(value) is not self.__types.get(field.name, type(value))):
+                self.fallbacks += 1
+                return None
+            constraints[field.name] = value
+        columns = [arg.strip('"') for arg in args]
+        if set(columns) - set(self.__columns):
+            self.fallbacks += 1
+            return None
+        rows = self.__rows
+        for index_columns, index in self.__indexes.items():
+            if constraints.keys() >= set(index_columns):
+                rows = index.get(tuple(constraints[name] for name in index_columns), [])
+                break
+        rows = [
+            row for row in rows
+            if all(row[name] == value for name, value in constraints.items())]
+        self.hits += 1
+        result = [{column: row[column] for column in columns or self.__columns} for row in rows]
+        if distinct:
+            deja_vu = set()
+            unique = []
+            for row in result:
+                key = repr(tuple(row.values()))
+                if key not in deja_vu:
+                    deja_vu.add(key)
+                    unique.append(row)
+            result = unique
+        return result
@@ -0,0 +1,175 @@
+#-*- coding: utf-8 -*-
+
+"""This module provides the ResultCache class.
+
+The result cache is an opt-in cache of the results of the read queries of
+the relations (select, get, count, is_empty and to_json). The entries are
+keyed by the SQL text of the query with its values. They expire after ttl
+seconds and the least recently used entry is evicted when the cache is full.
+
+Each entry depends on the relations read by the query. An insert, update or
+delete issued by half_orm on a relation invalidates the entries depending on
+it and on the relations that may be modified with it (see
+Model._dependent_relations): the relations referencing it through a foreign
+key (cascades), its parents and children (inheritance) and the views built on
+them. The modifications made by other means (other connections, raw SQL) are
+only seen when the entries expire.
+
+The cache is bypassed inside a transaction (the connection is not in
+autocommit mode).
+
+The changes made by other processes can be notified to the cache with
+LISTEN/NOTIFY (see half_orm.notify and Model.start_change_listener).
+
+The configuration is read from the database section of the connection file:
+
+    [database]
+    ...
+    result_cache = True         # default False
+    result_cache_ttl = 60       # seconds, default 60
+    result_cache_size = 1024    # default 1024
+
+The cache can also be changed at runtime with model.result_cache:
+
+    >>> model.result_cache.enabled = True
+    >>> model.result_cache.stats()
+    {'enabled': True, 'hits': 12, 'misses': 3, 'hit_ratio': 0.8, 'memory': 10240, ...}
+"""
+
+import sys
+import threading
+import time
+
+from half_orm.cache import LRUCache
+
+def _sizeof(result):
+    """Returns the approximate size in bytes of the result of a query."""
+    if not isinstance(result, tuple):
+        return sys.getsizeof(result)
+    size = sys.getsizeof(result)
+    for row in result:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+    return size
+
+class ResultCache:
+    """Cache of the results of the queries.
+
+    dependents(relation) returns the relations (sfqrn) whose content may be
+    modified by a DML query on relation (sfqrn).
+    """
+    def __init__(self, dependents, ttl=60, maxsize=1024, enabled=False):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.__dependents = dependents
+        self.__entries = LRUCache(maxsize, on_evict=self.__forget)
+        self.__by_relation = {}
+        self.__memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.__lock = threading.RLock()
+
+    def configure(self, enabled=None, ttl=None, maxsize=None):
+        """Sets the parameters of the cache that are not None (see the module
+        documentation).
+        """
+        if enabled is not None:
+            self.enabled = enabled
+        if ttl is not None:
+            self.ttl = ttl
+        if maxsize is not None:
+            self.__entries.maxsize = maxsize
+
+    def get(self, key):
+        """Returns the result stored for key or None if there is none or if it
+        has expired.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                self.__remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, result, relations):
+        """Stores the result of the query key. relations is the set of the
+        relations (sfqrn) read by the query.
+        """
+        with self.__lock:
+            self.__remove(key)
+            size = _sizeof(result)
+            self.__entries.put(key, (result, time.monotonic() + self.ttl, relations, size))
+            if key not in self.__entries:
+                # the cache is disabled (maxsize = 0)
+                return
+            self.__memory += size
+            for relation in relations:
+                self.__by_relation.setdefault(relation, set()).add(key)
+
+    def invalidate(self, relation):
+        """Removes the entries depending on relation (sfqrn) or on the
+        relations modified with it.
+        """
+        with self.__lock:
+            if not self.__entries:
+                return
+            for dependent in self.__dependents(relation):
+                for key in self.__by_relation.pop(dependent, ()):
+                    if self.__remove(key):
+                        self.invalidations += 1
+
+    def invalidate_all(self):
+        """Removes all the entries (the statistics are kept)."""
+        with self.__lock:
+            self.invalidations += len(self.__entries)
+            self.__entries.clear()
+            self.__by_relation.clear()
+            self.__memory = 0
+
+    def clear(self):
+        """Empties the cache and resets the statistics."""
+        with self.__lock:
+            self.__entries.clear()
+            self.__by_relation.clear()
+            self.__memory = 0
+            self.hits = 0
+            self.misses = 0
+            self.invalidations = 0
+
+    def stats(self):
+        """Returns the statistics of the cache. memory is the approximate size
+        in bytes of the results stored.
+        """
+        total = self.hits + self.misses
+        return {
+            'enabled': self.enabled, 'ttl': self.ttl,
+            'hits': self.hits, 'misses': self.misses,
+            'hit_ratio': total and self.hits / total or 0.,
+            'invalidations': self.invalidations,
+            'size': len(self.__entries), 'maxsize': self.__entries.maxsize,
+            'memory': self.__memory}
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __remove(self, key):
+        "Removes the entry key. Returns True if it was in the cache."
+        entry = self.__entries.pop(key)
+        if entry is None:
+            return False
+        self.__forget(key, entry)
+        return True
+
+    def __forget(self, key, entry):
+        "Updates the counters and the index of an entry removed."
+        self.__memory -= entry[3]
+        for relation in entry[2]:
+            keys = self.__by_relation.get(relation)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.__by_relation[relation]
@@ -0,0 +1,107 @@
+#-*- coding: utf-8 -*-
+
+"""This module provides the SingleFlight class.
+
+The single flight layer coalesces the identical read queries issued at the
+same time by several threads (select, get, count, is_empty and to_json):
+the first caller executes the query and the callers arriving while it runs
+wait for its result instead of sending the same query to the database. It
+protects the database when many threads miss the result cache at the same
+moment (thundering herd).
+
+The queries are identified by their SQL text with their values. A waiter
+executes the query itself if the result is not ready after timeout seconds.
+If the query fails, the waiters get the same exception.
+
+The layer is opt-in and bypassed inside a transaction. The configuration is
+read from the database section of the connection file:
+
+    [database]
+    ...
+    single_flight = True            # default False
+    single_flight_timeout = 30      # seconds, default 30
+
+It can also be changed at runtime with model.single_flight:
+
+    >>> model.single_flight.enabled = True
+    >>> model.single_flight.stats()
+    {'enabled': True, 'timeout': 30.0, 'executions': 10, 'shared': 90, ...}
+"""
+
+import threading
+
+class _Flight:
+    "A query being executed."
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Coalescing of the identical concurrent calls."""
+    def __init__(self, timeout=30., enabled=False):
+        self.enabled = enabled
+        self.timeout = timeout
+        self.__flights = {}
+        self.__lock = threading.Lock()
+        self.executions = 0
+        self.shared = 0
+        self.timeouts = 0
+        self.__waiting = 0
+
+    def configure(self, enabled=None, timeout=None):
+        """Sets the parameters that are not None (see the module
+        documentation).
+        """
+        if enabled is not None:
+            self.enabled = enabled
+        if timeout is not None:
+            self.timeout = timeout
+
+    def do(self, key, function):
+        """Returns function(). If a call with the same key is in progress in
+        another thread, waits for its result instead.
+        """
+        with self.__lock:
+            flight = self.__flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.__flights[key] = _Flight()
+                self.executions += 1
+            else:
+                self.__waiting += 1
+        if not leader:
+            done = flight.done.wait(self.timeout)
+            with self.__lock:
+                self.__waiting -= 1
+            if done:
+                with self.__lock:
+                    self.shared += 1
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result
+            with self.__lock:
+                self.timeouts += 1
+                self.executions += 1
+            return function()
+        try:
+            flight.result = function()
+            return flight.result
+        except Exception as err:
+            flight.error = err
+            raise
+        finally:
+            with self.__lock:
+                del self.__flights[key]
+            flight.done.set()
+
+    def stats(self):
+        """Returns the statistics: the number of executions, of results
+        shared with waiters and of waits that timed out, the number of calls
+        in progress and of threads waiting for them.
+        """
+        return {
+            'enabled': self.enabled, 'timeout': self.timeout,
+            'executions': self.executions, 'shared': self.shared,
+            'timeouts': self.timeouts, 'in_flight': len(self.__flights),
+            'waiting': self.__waiting}
@@ -0,0 +1,86 @@
+#-*- coding: utf-8 -*-
+
+"""This module provides the Snapshot class (see Model.snapshot).
+
+The connections used to export a database in parallel (by relation or by
+range) don't see the same state of the database: each one takes its own
+snapshot. A Snapshot opens a REPEATABLE READ READ ONLY DEFERRABLE
+transaction on a dedicated connection and exports its snapshot
+(pg_export_snapshot). The other connections attach to it (SET TRANSACTION
+SNAPSHOT): they all see the database in the same state, whatever the
+changes committed in the meantime.
+
+    >>> with model.snapshot() as snapshot:
+    ...     persons = Person().to_parquet('persons', split=4)
+    ...     with snapshot.connection() as connection:
+    ...         Post().copy_to(fileobj, connection=connection)
+
+In the scope of the snapshot (bound to the current context, see
+contextvars), the workers of Relation.parallel_select and
+Relation.to_parquet attach to it. The snapshot is released at the end of the
+scope.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
+
+_CURRENT = ContextVar('half_orm_snapshot', default=None)
+
+def attach(connection, snapshot_id):
+    """Starts on the connection a repeatable read, read only transaction on
+    the snapshot snapshot_id.
+    """
+    connection.autocommit = False
+    connection.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+    with connection.cursor() as cursor:
+        cursor.execute('set transaction snapshot %s', (snapshot_id,))
+
+class Snapshot:
+    """Context manager exporting a snapshot of the database of the model."""
+    def __init__(self, model):
+        self.__model = model
+        self.__connection = None
+        self.__token = None
+        self.id = None
+
+    def __enter__(self):
+        connection = self.__model._new_connection()
+        try:
+            connection.set_session(
+                isolation_level=ISOLATION_LEVEL_REPEATABLE_READ, readonly=True, deferrable=True)
+            with connection.cursor() as cursor:
+                cursor.execute('select pg_export_snapshot() as id')
+                self.id = cursor.fetchone()['id']
+        except:
+            connection.close()
+            raise
+        self.__connection = connection
+        self.__token = _CURRENT.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _CURRENT.reset(self.__token)
+        # the snapshot can't be imported once its transaction is over.
+        self.__connection.rollback()
+        self.__connection.close()
+        self.__connection = None
+        self.id = None
+
+    @staticmethod
+    def current():
+        """Returns the snapshot of the current context or None."""
+        return _CURRENT.get()
+
+    @contextmanager
+    def connection(self):
+        """Context manager returning a new connection attached to the
+        snapshot. The connection is closed on exit.
+        """
+        connection = self.__model._new_connection()
+        try:
+            attach(connection, self.id)
+            yield connection
+        finally:
+            connection.close()
@@ -0,0 +1,249 @@
+#-*- coding: utf-8 -*-
+# pylint: disable=too-few-public-methods
+
+"""This module provides the nodes of the SQL query tree built by the Relation
+class.
+
+A select query is a Select node made of a Table node (from), a list of Join
+nodes and a where expression. The expressions are And, Or, Not, Pred, Exists
+and In nodes. A Pred node is a piece of SQL with a %s placeholder for each of
+its values. The values of the limit and offset clauses are passed to psycopg2
+too.
+
+The tree is simplified then compiled once in a SQL text with the list of
+values to be passed to psycopg2:
+
+    text, values = select.simplify().compile()
+
+The simplification:
+- flattens the nested and/or expressions,
+- removes the "1 = 1" predicates (TRUE) from the and expressions (an or
+  expression with a TRUE operand is TRUE),
+- merges the joins made on the same alias (the conditions of the duplicates
+  are moved to the where clause).
+"""
+
+from psycopg2.extensions import register_adapter, adapt
+
+class Param:
+    """A value passed to psycopg2. Like the Field objects, a Param object is
+    adapted when the query is executed.
+    """
+    def __init__(self, value):
+        self.value = value
+
+    def _psycopg_adapter(self):
+        "Returns the SQL representation of the value."
+        return adapt(self.value)
+
+register_adapter(Param, Param._psycopg_adapter)
+
+def alias(aliases, id_):
+    """Returns the alias r<position> of the relation id_ in the query.
+
+    aliases is the dictionary {relation id_: position} of the query. The
+    relations are numbered in the order they are met, so that the same query
+    always has the same SQL text.
+    """
+    return f'r{aliases.setdefault(id_, len(aliases))}'
+
+class Node:
+    """Base class of the nodes of the SQL query tree."""
+    def _compile(self, sql, values):
+        "Appends the SQL text of the node to sql and its values to values."
+        raise NotImplementedError
+
+    def simplify(self):
+        "Returns the simplified version of the node."
+        return self
+
+    def compile(self):
+        "Returns the SQL text of the node and the list of its values."
+        sql = []
+        values = []
+        self._compile(sql, values)
+        return ''.join(sql), values
+
+class Pred(Node):
+    """A predicate. sql is a SQL text with a %s placeholder for each value."""
+    def __init__(self, sql, values=()):
+        self.sql = sql
+        self.values = values
+
+    def _compile(self, sql, values):
+        sql.append(self.sql)
+        values.extend(self.values)
+
+TRUE = Pred('1 = 1')
+
+class And(Node):
+    """Conjunction of expressions. Without operand, the expression is TRUE."""
+    operator = ' and\n    '
+
+    def __init__(self, *items):
+        self.items = list(items)
+
+    def simplify(self):
+        items = []
+        for item in self.items:
+            item = item.simplify()
+            if item.__class__ is self.__class__:
+                items += item.items
+            else:
+                items.append(item)
+        return self._reduce(items)
+
+    @staticmethod
+    def _reduce(items):
+        "Removes the TRUE operands."
+        if TRUE in items:
+            items = [item for item in items if item is not TRUE]
+        if not items:
+            return TRUE
+        if len(items) == 1:
+            return items[0]
+        return And(*items)
+
+    def _compile(self, sql, values):
+        if not self.items:
+            TRUE._compile(sql, values)
+            return
+        for idx, item in enumerate(self.items):
+            if idx:
+                sql.append(self.operator)
+            sql.append('(')
+            item._compile(sql, values)
+            sql.append(')')
+
+class Or(And):
+    """Disjunction of expressions."""
+    operator = ' or\n    '
+
+    @staticmethod
+    def _reduce(items):
+        "An or expression is TRUE if one of its operands is TRUE."
+        if TRUE in items:
+            return TRUE
+        if len(items) == 1:
+            return items[0]
+        return Or(*items)
+
+class Not(Node):
+    """Negation of an expression."""
+    def __init__(self, item):
+        self.item = item
+
+    def simplify(self):
+        item = self.item.simplify()
+        if isinstance(item, Not):
+            return item.item
+        return Not(item)
+
+    def _compile(self, sql, values):
+        sql.append('not (')
+        self.item._compile(sql, values)
+        sql.append(')')
+
+class Exists(Node):
+    """exists (<select>)"""
+    def __init__(self, select):
+        self.select = select
+
+    def simplify(self):
+        return Exists(self.select.simplify())
+
+    def _compile(self, sql, values):
+        sql.append('exists (\n')
+        self.select._compile(sql, values)
+        sql.append(')')
+
+class In(Node):
+    """(<columns>) in (<select>). columns is a SQL text."""
+    def __init__(self, columns, select):
+        self.columns = columns
+        self.select = select
+
+    def simplify(self):
+        return In(self.columns, self.select.simplify())
+
+    def _compile(self, sql, values):
+        sql.append(f'({self.columns}) in (\n')
+        self.select._compile(sql, values)
+        sql.append(')')
+
+class Table(Node):
+    """A relation aliased in the from clause."""
+    def __init__(self, fqrn, alias, only=False):
+        self.fqrn = fqrn
+        self.alias = alias
+        self.only = only
+
+    def _compile(self, sql, values):
+        sql.append(f"{self.only and 'only ' or ''}{self.fqrn} as {self.alias}")
+
+class Join(Node):
+    """join <table> on <expression>"""
+    def __init__(self, table, on_):
+        self.table = table
+        self.on_ = on_
+
+    def _compile(self, sql, values):
+        sql.append('\n  join ')
+        self.table._compile(sql, values)
+        sql.append(' on\n    ')
+        self.on_._compile(sql, values)
+
+class Select(Node):
+    """The select query.
+
+    - what is the list of the SQL expressions selected,
+    - table is the Table node of the from clause,
+    - joins is a list of Join nodes,
+    - where is an expression,
+    - limit and offset are values (see Param).
+    """
+    def __init__(self, what, table, joins=None, where=TRUE,
+                 distinct=False, order_by=None, limit=None, offset=None):
+        self.what = what
+        self.table = table
+        self.joins = joins or []
+        self.where = where
+        self.distinct = distinct
+        self.order_by = order_by
+        self.limit = limit
+        self.offset = offset
+
+    def copy(self, **kwargs):
+        "Returns a copy of the node with the attributes in kwargs replaced."
+        attrs = dict(self.__dict__)
+        attrs.update(kwargs)
+        return Select(**attrs)
+
+    def simplify(self):
+        joins = []
+        wheres = [self.where]
+        aliases = set()
+        for join in self.joins:
+            if join.table.alias in aliases:
+                wheres.append(join.on_)
+                continue
+            aliases.add(join.table.alias)
+            joins.append(join)
+        return self.copy(joins=joins, where=And(*wheres).simplify())
+
+    def _compile(self, sql, values):
+        sql.append(f"select{self.distinct and ' distinct' or ''}\n  {', '.join(self.what)}\nfrom\n  ")
+        self.table._compile(sql, values)
+        for join in self.joins:
+            join._compile(sql, values)
+        if self.where is not TRUE:
+            sql.append('\nwhere\n    ')
+            self.where._compile(sql, values)
+        if self.order_by:
+            sql.append(f'\norder by {self.order_by}')
+        if self.limit is not None:
+            sql.append('\nlimit %s')
+            values.append(self.limit)
+        if self.offset is not None:
+            sql.append('\noffset %s')
+            values.append(self.offset)
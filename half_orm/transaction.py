@@ -5,6 +5,8 @@
 
 import sys
 
+from half_orm.identity_map import IdentityMap
+
 class Transaction:
     """The Transaction class is intended to be used as a class attribute of
     relation.Relation class:
@@ -67,5 +69,8 @@ class Transaction:
             Transaction.__level = 0
             relation._model._connection.rollback()
             relation._model._connection.autocommit = True
+            if IdentityMap.current() is not None:
+                # the objects loaded or changed in the transaction are gone.
+                IdentityMap.current().clear()
             raise err
         return res
@@ -22,7 +22,9 @@ setup(
     install_requires=[
         'psycopg2-binary',
         'PyYAML'],
+    extras_require={'parquet': ['pyarrow']},
     package_data={'half_orm': ['version.txt']},
+    python_requires='>=3.7',
     classifiers=[
         # How mature is this project? Common values are
         #   3 - Alpha
@@ -39,7 +41,6 @@ setup(
 
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
     ],
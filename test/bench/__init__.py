@@ -0,0 +1,68 @@
+#-*- coding: utf-8 -*-
+
+"""Benchmarks of half_orm.
+
+The benchmarks are run against the halftest database (see test/init.py):
+
+    HALFORM_CONF_DIR=./.config python -m test.bench.<benchmark>
+
+The data is loaded by `populate` in a transaction that is rolled back when the
+benchmark is done. The halftest database is left untouched.
+"""
+
+import time
+from contextlib import contextmanager
+
+from ..init import halftest
+
+def best_of(func, number=5, repeat=3):
+    """Returns the best mean time (in seconds) of `number` calls to func."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        mean = (time.perf_counter() - start) / number
+        if best is None or mean < best:
+            best = mean
+    return best
+
+def report(title, results):
+    """Prints the results [(label, seconds), ...] of a benchmark."""
+    print(f'\n{title}')
+    width = max(len(label) for label, _ in results)
+    for label, seconds in results:
+        print(f'  {label:<{width}}  {seconds * 1000:10.3f} ms')
+
+@contextmanager
+def populate(persons=10000, posts_per_person=5, comments_per_post=4):
+    """Loads halftest like data in a transaction rolled back on exit."""
+    model = halftest.pers._model
+    conn = model._connection
+    conn.autocommit = False
+    try:
+        model.execute_query(
+            """insert into actor.person (first_name, last_name, birth_date)
+               select 'bench' || i, 'bench' || (i %% 100), current_date - i
+               from generate_series(1, %s) as i""", (persons,))
+        model.execute_query(
+            """insert into blog.post
+                 (title, content, author_first_name, author_last_name, author_birth_date)
+               select 'title ' || j, 'content', first_name, last_name, birth_date
+               from actor.person, generate_series(1, %s) as j
+               where first_name like 'bench%%'""", (posts_per_person,))
+        model.execute_query(
+            """insert into blog.comment (content, post_id, author_id)
+               select 'comment', post.id, person.id
+               from blog.post
+                 join actor.person on
+                   person.first_name = post.author_first_name and
+                   person.last_name = post.author_last_name and
+                   person.birth_date = post.author_birth_date,
+                 generate_series(1, %s) as k
+               where post.title like 'title %%'""", (comments_per_post,))
+        model.execute_query('analyze actor.person, blog.post, blog.comment')
+        yield halftest
+    finally:
+        conn.rollback()
+        conn.autocommit = True
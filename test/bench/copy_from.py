@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+#-*- coding: utf-8 -*-
+
+"""Compares the load of 100k rows (int, float, bool, text, timestamp, uuid,
+numeric and array columns) in the text format of COPY (bulk_load.encode_row),
+in the binary format (copy_binary.Encoder) and by inserts (executemany, one
+insert by row, on 10k rows).
+
+    HALFORM_CONF_DIR=./.config python -m test.bench.copy_from
+"""
+
+import datetime
+import decimal
+import io
+import uuid
+
+from half_orm import bulk_load, copy_binary
+
+from ..init import halftest
+from . import best_of, report
+
+COLUMNS = {
+    'id': 'int4', 'big': 'int8', 'ratio': 'float8', 'flag': 'bool', 'label': 'text',
+    'created': 'timestamp', 'key': 'uuid', 'amount': 'numeric', 'tags': '_int4'}
+METADATA = {name: {'fieldtype': fieldtype} for name, fieldtype in COLUMNS.items()}
+NAMES = ', '.join(COLUMNS)
+
+def rows(count):
+    "Returns count rows."
+    start = datetime.datetime(2024, 1, 1)
+    return [
+        (idx, idx * 1000003, idx / 7, idx % 2 == 0, f'label\t{idx}', start + datetime.timedelta(
+            seconds=idx), uuid.UUID(int=idx), decimal.Decimal(idx) / 100, [idx, None, 3])
+        for idx in range(count)]
+
+def copy_text(cursor, data):
+    "Load in the text format."
+    cursor.execute('truncate half_orm_bench')
+    cursor.copy_expert(
+        f'copy half_orm_bench ({NAMES}) from stdin',
+        io.StringIO(''.join(bulk_load.encode_row(row) for row in data)))
+
+def copy_binary_(cursor, encoder, data):
+    "Load in the binary format."
+    cursor.execute('truncate half_orm_bench')
+    cursor.copy_expert(
+        f'copy half_orm_bench ({NAMES}) from stdin with (format binary)', encoder.load(data))
+
+def insert(cursor, data):
+    "Load by inserts."
+    cursor.execute('truncate half_orm_bench')
+    cursor.executemany(
+        f"insert into half_orm_bench ({NAMES}) values ({', '.join(['%s'] * len(COLUMNS))})",
+        data)
+
+def main():
+    conn = halftest.pers._model._connection
+    conn.autocommit = False
+    try:
+        cursor = conn.cursor()
+        cursor.execute('create temp table half_orm_bench ({})'.format(', '.join(
+            f"{name} {fieldtype.startswith('_') and fieldtype[1:] + '[]' or fieldtype}"
+            for name, fieldtype in COLUMNS.items())))
+        data = rows(100000)
+        encoder = copy_binary.Encoder(METADATA, list(COLUMNS))
+        copy_text(cursor, data)
+        cursor.execute('select * from half_orm_bench order by id')
+        text_rows = cursor.fetchall()
+        copy_binary_(cursor, encoder, data)
+        cursor.execute('select * from half_orm_bench order by id')
+        assert cursor.fetchall() == text_rows
+        report('encoding of 100k rows', [
+            ('text (encode_row)', best_of(
+                lambda: ''.join(bulk_load.encode_row(row) for row in data), number=1)),
+            ('binary (Encoder.load)', best_of(lambda: encoder.load(data), number=1))])
+        report('load of 100k rows', [
+            ('COPY text', best_of(lambda: copy_text(cursor, data), number=1)),
+            ('COPY binary', best_of(lambda: copy_binary_(cursor, encoder, data), number=1))])
+        report('load of 10k rows', [
+            ('insert (executemany)', best_of(lambda: insert(cursor, data[:10000]), number=1)),
+            ('COPY binary', best_of(
+                lambda: copy_binary_(cursor, encoder, data[:10000]), number=1))])
+    finally:
+        conn.rollback()
+        conn.autocommit = True
+
+if __name__ == '__main__':
+    main()
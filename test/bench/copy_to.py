@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+#-*- coding: utf-8 -*-
+
+"""Compares the CSV export of the posts joined to their authors (250k rows)
+with select() and csv.writer against Relation.copy_to (COPY ... TO STDOUT).
+
+    HALFORM_CONF_DIR=./.config python -m test.bench.copy_to
+"""
+
+import csv
+import io
+
+from . import best_of, populate, report
+
+def select_csv(relation):
+    "The export built in Python."
+    fileobj = io.StringIO()
+    writer = None
+    for row in relation.select():
+        if writer is None:
+            writer = csv.DictWriter(fileobj, fieldnames=list(row))
+            writer.writeheader()
+        writer.writerow(row)
+    return fileobj.getvalue()
+
+def copy_csv(relation, format='csv'):
+    "The export with copy_to."
+    #pylint: disable=redefined-builtin
+    fileobj = io.BytesIO()
+    relation.copy_to(fileobj, format=format)
+    return fileobj.getvalue()
+
+def main():
+    with populate(persons=50000, posts_per_person=5, comments_per_post=0) as halftest:
+        posts = halftest.post(title=('like', 'title %'))
+        posts.author_ = halftest.pers(first_name=('like', 'bench%'))
+        posts.order_by('id')
+        assert select_csv(posts).splitlines() == copy_csv(posts).decode().splitlines()
+        report(f'export of {posts.count()} posts', [
+            ('select + csv.writer', best_of(lambda: select_csv(posts), number=1)),
+            ('copy_to csv', best_of(lambda: copy_csv(posts), number=1)),
+            ('copy_to binary', best_of(lambda: copy_csv(posts, 'binary'), number=1))])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+#-*- coding: utf-8 -*-
+
+"""Compares count(distinct r.*) over the joins with the count planner.
+
+    HALFORM_CONF_DIR=./.config python -m test.bench.count
+"""
+
+from . import best_of, populate, report
+
+def legacy_count(relation):
+    "count(distinct r0.*) on the joined relations (before the planner)."
+    select = getattr(relation, '__select_node')({})
+    select.what = [f'count(distinct {select.what[0]})']
+    query, values = select.simplify().compile()
+    cursor = relation._model.execute_query(query, values)
+    return cursor.fetchone()['count']
+
+def main():
+    with populate() as halftest:
+        Person = halftest.pers.__class__
+        Post = halftest.post.__class__
+        Comment = halftest.comment.__class__
+        def no_join():
+            return Post(title=('like', 'title %'))
+        def fkey_filter():
+            post = Post()
+            post.author_ = Person(last_name=('like', 'bench1%'))
+            return post
+        def reverse_fkey():
+            return Post(title='title 1').author_
+        def nested_fkeys():
+            comment = Comment()
+            comment.post_ = Post(title='title 2')
+            comment.author_ = Person(last_name=('like', 'bench2%'))
+            return comment
+        def shared_relation():
+            author = Person(last_name=('like', 'bench3%'))
+            post = Post()
+            post.author_ = author
+            comment = Comment()
+            comment.author_ = author
+            comment.post_ = post
+            return comment
+        results = []
+        for scenario in (no_join, fkey_filter, reverse_fkey, nested_fkeys, shared_relation):
+            assert legacy_count(scenario()) == len(scenario())
+            results.append((f'{scenario.__name__} legacy', best_of(lambda: legacy_count(scenario()))))
+            results.append((f'{scenario.__name__} planner', best_of(lambda: len(scenario()))))
+        report('len(relation)', results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+#-*- coding: utf-8 -*-
+
+"""Compares the grouping engine of Relation.group_by (half_orm.grouping) with
+the previous implementation (linear scans of the groups) on 10k, 100k and 1M
+rows (posts of 1000 authors with 2 comments each). The previous
+implementation is only run up to 100k rows.
+
+    HALFORM_CONF_DIR=./.config python -m test.bench.group_by
+"""
+
+import yaml
+
+from half_orm import grouping
+
+from . import best_of, report
+
+DIRECTIVE = """
+authors:
+  - author_id: id
+    author_name: name
+    posts:
+      - post_id: id
+        post_title: title
+        comments:
+          - comment_id: id
+            comment_content: content
+"""
+FIELDS = (
+    'author_id', 'author_name', 'post_id', 'post_title', 'comment_id', 'comment_content')
+
+def rows(count):
+    "Yields count rows."
+    for idx in range(count):
+        post = idx // 2
+        yield {
+            'author_id': post % 1000, 'author_name': f'author {post % 1000}',
+            'post_id': post, 'post_title': f'title {post}',
+            'comment_id': idx, 'comment_content': 'comment'}
+
+def legacy_group_by(data, yml_directive, fields=FIELDS):
+    "The group_by implementation replaced by half_orm.grouping."
+    def inner_group_by(data, directive, grouped_data, gdata=None):
+        deja_vu_key = set()
+        if gdata is None:
+            gdata = grouped_data
+        if isinstance(directive, list):
+            directive = directive[0]
+        keys = set(directive)
+        for elt in data:
+            res_elt = {}
+            for key in keys.intersection(fields):
+                deja_vu_key.add(directive[key])
+                res_elt.update({directive[key]:elt[key]})
+            if isinstance(gdata, list):
+                different = None
+                for selt in gdata:
+                    different = True
+                    for key in deja_vu_key:
+                        different = selt[key] != res_elt[key]
+                        if different:
+                            break
+                    if not different:
+                        break
+                if not gdata or different:
+                    gdata.append(res_elt)
+            else:
+                gdata.update(res_elt)
+            for group_name in keys.difference(keys.intersection(fields)):
+                type_directive = type(directive[group_name])
+                suite = None
+                if not gdata:
+                    gdata[group_name] = type_directive()
+                    suite = gdata[group_name]
+                elif isinstance(gdata, list):
+                    suite = None
+                    for selt in gdata:
+                        different = True
+                        for skey in deja_vu_key:
+                            different = selt[skey] != res_elt[skey]
+                            if different:
+                                break
+                        if not different:
+                            if selt.get(group_name) is None:
+                                selt[group_name] = type_directive()
+                            suite = selt[group_name]
+                            break
+                    if suite is None:
+                        gdata.append(res_elt)
+                elif gdata.get(group_name) is None:
+                    gdata[group_name] = type_directive()
+                    suite = gdata[group_name]
+                else:
+                    suite = gdata[group_name]
+                inner_group_by([elt], directive[group_name], suite, None)
+    grouped_data = {}
+    inner_group_by(list(data), yaml.safe_load(yml_directive), grouped_data)
+    return grouped_data
+
+def group_by(data, yml_directive, fields=FIELDS):
+    "The group_by implementation of half_orm.grouping."
+    return grouping.group(grouping.compile_directive(yml_directive, fields), data)
+
+def main():
+    assert legacy_group_by(rows(5000), DIRECTIVE) == group_by(rows(5000), DIRECTIVE)
+    results = []
+    for count in (10000, 100000, 1000000):
+        if count <= 100000:
+            results.append((
+                f'{count} rows: legacy',
+                best_of(lambda: legacy_group_by(rows(count), DIRECTIVE), number=1, repeat=1)))
+        results.append((
+            f'{count} rows: grouping',
+            best_of(lambda: group_by(rows(count), DIRECTIVE), number=1)))
+    report('per call', results)
+
+if __name__ == '__main__':
+    main()
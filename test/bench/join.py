@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+#-*- coding: utf-8 -*-
+
+"""Compares Relation.join (one query per joined relation, stitched in
+Python) with its single_query mode (one query with json_agg laterals).
+
+    HALFORM_CONF_DIR=./.config python -m test.bench.join
+"""
+
+from . import best_of, populate, report
+
+def main():
+    with populate(persons=2000) as halftest:
+        Person = halftest.pers.__class__
+        Post = halftest.post.__class__
+        Comment = halftest.comment.__class__
+        scenarios = {
+            'one person, posts and comments': lambda **kwargs: Person(
+                first_name='bench10', last_name='bench10').join(
+                    (Post(), 'posts', 'title'), (Comment(), 'comments'), **kwargs),
+            '20 persons, posts': lambda **kwargs: Person(last_name='bench1').join(
+                (Post(), 'posts', ['id', 'title']), **kwargs),
+            'comments, author': lambda **kwargs: Comment(
+                author_id=('<', 100)).join(
+                    (Person(), 'author', ['id', 'last_name']), **kwargs),
+        }
+        results = []
+        for label, scenario in scenarios.items():
+            results.append((f'{label}: join', best_of(scenario, number=1)))
+            results.append((
+                f'{label}: single_query',
+                best_of(lambda: scenario(single_query=True), number=1)))
+        report('per call', results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+#-*- coding: utf-8 -*-
+
+"""Compares the execution of the relation queries with and without the
+server side prepared statements.
+
+    HALFORM_CONF_DIR=./.config python -m test.bench.prepared
+"""
+
+from . import best_of, populate, report
+
+def main():
+    with populate() as halftest:
+        Person = halftest.pers.__class__
+        Post = halftest.post.__class__
+        Comment = halftest.comment.__class__
+        prepared = halftest.pers._model.prepared_statements
+        def get_person():
+            return Person(first_name='bench123', last_name='bench23').get()
+        def count_comments():
+            comment = Comment()
+            comment.post_ = Post(title='title 2')
+            comment.author_ = Person(first_name='bench42')
+            return comment.count()
+        results = []
+        for scenario in (get_person, count_comments):
+            for label, prepared.enabled in (('text', False), ('prepared', True)):
+                results.append((
+                    f'{scenario.__name__} {label}',
+                    best_of(lambda: [scenario() for _ in range(100)]) / 100))
+        report('per query', results)
+        print(f'\n{prepared.stats()}')
+
+if __name__ == '__main__':
+    main()
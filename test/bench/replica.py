@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+#-*- coding: utf-8 -*-
+
+"""Compares the lookups by primary key and by unique column on a replicated
+relation (see Model.replicate) with the SQL queries.
+
+    HALFORM_CONF_DIR=./.config python -m test.bench.replica
+"""
+
+from . import best_of, report
+from ..init import halftest
+
+def main():
+    Person = halftest.pers.__class__
+    model = halftest.pers._model
+    ids = [elt['id'] for elt in model.execute_query('select id from actor.person')]
+    def get_by_pk():
+        return Person(first_name='ab', last_name='ab', birth_date=halftest.today).get()
+    def get_by_unique():
+        return Person(id=ids[7]).get()
+    def select_by_name():
+        return list(Person(last_name='cd').select())
+    results = []
+    for scenario in (get_by_pk, get_by_unique, select_by_name):
+        results.append((f'{scenario.__name__} sql', best_of(lambda: [scenario() for _ in range(100)]) / 100))
+        model.replicate('actor.person')
+        results.append((f'{scenario.__name__} replica', best_of(lambda: [scenario() for _ in range(100)]) / 100))
+        model.drop_replica('actor.person')
+    report('per call', results)
+
+if __name__ == '__main__':
+    main()
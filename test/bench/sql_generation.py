@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+#-*- coding: utf-8 -*-
+
+"""Time spent generating the SQL select query of deep set operations trees.
+
+    HALFORM_CONF_DIR=./.config python -m test.bench.sql_generation
+
+The trees are balanced. Each level combines two sub-trees with |, & or -.
+The leaves are constrained persons, half of them joined to a post.
+
+The SQL text is compiled once per shape (see Model.sql_cache). The first
+series is run with the cache disabled (the query is compiled on each call),
+the second one with the cache (only the shape and the values are extracted).
+"""
+
+from . import best_of, report
+from ..init import halftest
+
+OPERATORS = (
+    lambda left, right: left | right,
+    lambda left, right: left & right,
+    lambda left, right: left - right)
+
+def set_op_tree(depth, leaf=0):
+    "Returns a balanced tree of set operations on Person of the given depth."
+    Person = halftest.pers.__class__
+    if depth == 0:
+        person = Person(last_name=('like', f'{"abcdef"[leaf % 6]}%'))
+        if leaf % 2:
+            person = halftest.post.__class__(title=f'title {leaf}').author_
+        return person
+    left = set_op_tree(depth - 1, leaf * 2)
+    right = set_op_tree(depth - 1, leaf * 2 + 1)
+    return OPERATORS[depth % 3](left, right)
+
+def main():
+    cache = halftest.pers._model.sql_cache
+    maxsize = cache.maxsize
+    for title, cache.maxsize in (('no cache', 0), ('cached', maxsize)):
+        results = []
+        for depth in (2, 4, 6, 8, 10):
+            tree = set_op_tree(depth)
+            results.append((f'depth {depth:2} ({2 ** depth:4} leaves)', best_of(tree._prep_select)))
+        report(f'relation._prep_select() {title}', results)
+    print(f'\n{cache.stats()}')
+
+if __name__ == '__main__':
+    main()
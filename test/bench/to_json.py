@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#-*- coding: utf-8 -*-
+
+"""Serialization throughput (rows per second) of the JSON encoding of the
+rows of a relation: the default handler of json.dumps called on every value
+(previous implementation) against the compiled per column encoders of
+half_orm.json_encoders, and the orjson backend if it is installed.
+
+The rows have the types the encoders convert (timestamptz, uuid, numeric,
+interval and date). The second part measures the serialization of 100k
+persons (int, text and date) and Relation.to_json on them.
+
+    HALFORM_CONF_DIR=./.config python -m test.bench.to_json
+"""
+
+import datetime
+import decimal
+import json
+import uuid
+
+from half_orm import json_encoders
+
+from . import best_of, populate
+
+COUNT = 100000
+METADATA = {
+    'id': {'fieldtype': 'int4', 'fielddim': 0},
+    'name': {'fieldtype': 'text', 'fielddim': 0},
+    'created': {'fieldtype': 'timestamptz', 'fielddim': 0},
+    'key': {'fieldtype': 'uuid', 'fielddim': 0},
+    'amount': {'fieldtype': 'numeric', 'fielddim': 0},
+    'duration': {'fieldtype': 'interval', 'fielddim': 0},
+    'day': {'fieldtype': 'date', 'fielddim': 0},
+}
+
+def rows(count):
+    "Returns count rows."
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return [{
+        'id': idx, 'name': f'name {idx}',
+        'created': now - datetime.timedelta(seconds=idx), 'key': uuid.uuid4(),
+        'amount': decimal.Decimal(idx) / 100, 'duration': datetime.timedelta(minutes=idx),
+        'day': now.date()} for idx in range(count)]
+
+def legacy_handler(obj):
+    "The default handler of the previous implementation of to_json."
+    if hasattr(obj, 'isoformat'):
+        return str(obj.isoformat())
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, datetime.timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError(obj)
+
+def throughput(title, results, count):
+    "Prints the results [(label, seconds), ...] in rows per second."
+    print(f'\n{title}')
+    width = max(len(label) for label, _ in results)
+    for label, seconds in results:
+        print(f'  {label:<{width}}  {count / seconds:12,.0f} rows/s')
+
+def encode(table, data):
+    "Returns the JSON text of the rows."
+    return f'[{json_encoders.encode_rows(table, data)}]'
+
+def main():
+    data = rows(COUNT)
+    table = json_encoders.encoder_table(METADATA)
+    assert json.loads(json.dumps(data, default=legacy_handler)) == json.loads(encode(table, data))
+    results = [
+        ('default handler', best_of(
+            lambda: json.dumps(data, default=legacy_handler), number=1)),
+        ('compiled encoders', best_of(lambda: encode(table, data), number=1))]
+    try:
+        import orjson
+        json_encoders.set_backend(orjson.dumps)
+        results.append(('orjson backend', best_of(lambda: json_encoders.dumps(data), number=1)))
+    except ImportError:
+        pass
+    finally:
+        json_encoders.set_backend()
+    throughput(f'serialization of {COUNT} rows', results, COUNT)
+
+    with populate(persons=100000, posts_per_person=0, comments_per_post=0) as halftest:
+        persons = halftest.pers(first_name=('like', 'bench%'))
+        count = persons.count()
+        rows_ = list(persons.select())
+        table = getattr(persons, '__json_encoders')
+        results = [
+            ('default handler', best_of(
+                lambda: json.dumps(rows_, default=legacy_handler), number=1)),
+            ('compiled encoders', best_of(lambda: encode(table, rows_), number=1)),
+            ('to_json', best_of(persons.to_json, number=1)),
+            ('to_json in_database', best_of(
+                lambda: persons.to_json(in_database=True), number=1))]
+        throughput(f'{count} persons', results, count)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+import datetime
+import json
+import shutil
+import tempfile
+import time
+import uuid
+from decimal import Decimal
+from unittest import TestCase
+
+from psycopg2.extras import NumericRange
+
+from half_orm.disk_cache import DiskCache, Column
+
+from ..init import halftest
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.model = self.pers._model
+        self.directory = tempfile.mkdtemp()
+        self.model.disk_cache.directory = self.directory
+        self.cache = self.model.disk_cache
+        self.cache.hits = self.cache.misses = 0
+
+    def tearDown(self):
+        self.model.disk_cache.directory = None
+        shutil.rmtree(self.directory)
+
+    def test_select_columns(self):
+        self.model.disk_cache.directory = None
+        persons = self.pers(last_name=('like', 'a%')).order_by('last_name')
+        columns = persons.select_columns('last_name', 'birth_date')
+        self.assertEqual(list(columns), ['last_name', 'birth_date'])
+        self.assertEqual(
+            list(columns['last_name']), [elt['last_name'] for elt in persons.select()])
+        self.assertEqual(len(columns['birth_date']), 10)
+
+    def test_columns_cached(self):
+        persons = self.pers(last_name=('like', 'a%')).order_by('last_name')
+        expected = persons.select_columns()
+        self.assertEqual(self.cache.stats()['entries'], 1)
+        self.assertEqual(self.cache.misses, 1)
+        cached = self.pers(last_name=('like', 'a%')).order_by('last_name').select_columns()
+        self.assertEqual(self.cache.hits, 1)
+        self.assertIsInstance(cached['id'], Column)
+        self.assertEqual(cached['id'].values.format, 'q')
+        self.assertEqual(cached['id'].values.tolist(), expected['id'])
+        for name, values in expected.items():
+            self.assertEqual(list(cached[name]), values)
+        self.assertEqual(cached['last_name'][-1], expected['last_name'][-1])
+        self.assertEqual(cached['last_name'][1:3], expected['last_name'][1:3])
+
+    def test_shared_directory(self):
+        persons = self.pers(last_name='aa')
+        expected = persons.select_columns('id', 'last_name')
+        fingerprint, marker = getattr(persons, '__disk_cache_entry')(
+            'columns', 'id', 'last_name')
+        other = DiskCache(self.directory)
+        columns = other.get_columns(fingerprint, marker)
+        self.assertEqual(list(columns['last_name']), expected['last_name'])
+        self.assertEqual(other.hits, 1)
+
+    def test_to_json(self):
+        persons = self.pers(last_name=('like', 'b%'))
+        expected = persons.to_json(res_field_name='persons', page=1)
+        self.assertEqual(persons.to_json(res_field_name='persons', page=1), expected)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(len(json.loads(persons.to_json())), 10)
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_dml_invalidates(self):
+        persons = self.pers(last_name='aa')
+        persons.select_columns('first_name')
+        persons.update(first_name='disk_cache')
+        try:
+            self.assertEqual(self.cache.stats()['entries'], 0)
+            self.assertEqual(
+                list(persons.select_columns('first_name')['first_name']), ['disk_cache'])
+        finally:
+            persons.update(first_name='aa')
+
+    def test_external_change(self):
+        relations = {(self.model._dbname, 'actor', 'person')}
+        marker = self.model._change_marker(relations)
+        connection = self.model._new_connection()
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "update actor.person set first_name = first_name where last_name = 'aa'")
+        # the statistics are flushed when the backend exits.
+        connection.close()
+        for _ in range(50):
+            if self.model._change_marker(relations) != marker:
+                break
+            time.sleep(.1)
+        self.assertNotEqual(self.model._change_marker(relations), marker)
+
+    def test_transaction_bypass(self):
+        @self.pers.Transaction
+        def select_columns(pers):
+            return pers(last_name='aa').select_columns()
+        select_columns(self.pers)
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_encodings(self):
+        columns = {
+            'int': [1, None, -2 ** 63], 'float': [1.5, 2., None], 'bool': [True, None, False],
+            'text': ['é', '', None], 'date': [datetime.date(2020, 1, 1), None, None],
+            'mixed': [Decimal('1.10'), {'a': [1]}, b'\x00'], 'null': [None] * 3}
+        self.cache.put_columns('fingerprint', 'marker', columns, set())
+        cached = self.cache.get_columns('fingerprint', 'marker')
+        for name, values in columns.items():
+            self.assertEqual(list(cached[name]), values)
+        self.assertEqual(cached['float'].values.format, 'd')
+        self.assertEqual(cached['bool'].encoding, '?')
+        self.assertIsNone(self.cache.get_columns('fingerprint', 'other'))
+        self.cache.put_columns('fingerprint', 'other', columns, set())
+        self.assertEqual(self.cache.stats()['entries'], 1)
+
+    def test_tagged_arrays(self):
+        columns = {
+            'dates': [[datetime.date(2020, 1, 1), None], None, []],
+            'nested': [[[Decimal('1.10'), None], [uuid.UUID(int=1), 'a']], [{'a': 1}], ['b']]}
+        self.cache.put_columns('fingerprint', 'marker', columns, set())
+        cached = self.cache.get_columns('fingerprint', 'marker')
+        for name, values in columns.items():
+            self.assertEqual(list(cached[name]), values)
+
+    def test_unsupported_types(self):
+        "a result with values that can't be converted back is not cached"
+        self.cache.put_columns(
+            'fingerprint', 'marker', {'range': [NumericRange(1, 2)]}, set())
+        self.assertIsNone(self.cache.get_columns('fingerprint', 'marker'))
+        self.assertEqual(self.cache.stats()['entries'], 0)
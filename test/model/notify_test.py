@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+import time
+from unittest import TestCase
+
+from ..init import halftest
+from half_orm import notify
+
+class Test(TestCase):
+    def setUp(self):
+        self.post = halftest.post
+        self.model = self.post._model
+        self.cache = self.model.result_cache
+        self.enabled = self.cache.enabled
+        self.cache.clear()
+        self.cache.enabled = True
+        self.post().delete(delete_all=True)
+        self.model.install_change_triggers('blog.post')
+        self.listener = self.model.start_change_listener(timeout=.1)
+        self.assertTrue(self.listener.ready.wait(5))
+
+    def tearDown(self):
+        self.model.stop_change_listener()
+        self.model.execute_query(f'drop trigger {notify.FUNCTION} on blog.post')
+        self.post().delete(delete_all=True)
+        self.cache.clear()
+        self.cache.enabled = self.enabled
+
+    def test_triggers_sql(self):
+        sql = notify.triggers_sql(['blog.view.post_comment'], channel='chan')
+        self.assertIn('on "blog.view"."post_comment"', sql)
+        self.assertIn("('chan')", sql)
+
+    def test_quoted_names(self):
+        sql = notify.triggers_sql(['blog.post'], channel="it's 100%", schema='pub"lic')
+        self.assertIn('"pub""lic".half_orm_notify_change(\'it\'\'s 100%\')', sql)
+        self.model.install_change_triggers('blog.post', channel="it's 100%")
+        self.assertEqual(self.model.execute_query(
+            """select tgargs from pg_trigger
+               where tgrelid = 'blog.post'::regclass and tgname = %s""",
+            (notify.FUNCTION,)).fetchone()['tgargs'].tobytes(), b"it's 100%\x00")
+
+    def test_not_a_table(self):
+        with self.assertRaises(ValueError):
+            self.model.install_change_triggers('blog.view.post_comment')
+
+    def test_outside_change(self):
+        self.assertEqual(self.post().count(), 0)
+        self.assertEqual(len(self.cache), 1)
+        connection = self.model._new_connection()
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "insert into blog.post (title, content) values ('notify', 'notify')")
+        connection.close()
+        for _ in range(50):
+            if not len(self.cache):
+                break
+            time.sleep(.1)
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.post().count(), 1)
+
+    def test_invalid_payloads(self):
+        "the listener survives the invalid payloads and the callback errors"
+        calls = []
+        def callback(schema, relation):
+            if schema == 'error':
+                raise RuntimeError('callback error')
+            calls.append((schema, relation))
+        listener = notify.Listener(
+            self.model._new_connection, callback, channel='half_orm_test', timeout=.1)
+        listener.start()
+        try:
+            self.assertTrue(listener.ready.wait(5))
+            for payload in ('{bad', '1', '[1, 2, 3]', '["error", "x"]', '["blog", "post"]'):
+                self.model.execute_query("select pg_notify('half_orm_test', %s)", (payload,))
+            for _ in range(50):
+                if len(calls) > 1:
+                    break
+                time.sleep(.1)
+            self.assertTrue(listener.is_alive())
+            self.assertEqual(calls, [(None, None), ('blog', 'post')])
+        finally:
+            listener.stop()
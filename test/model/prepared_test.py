@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+import threading
+from unittest import TestCase
+
+from ..init import halftest
+from half_orm.null import NULL
+from half_orm.prepared import PreparedStatements
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.model = self.pers._model
+        self.prepared = self.model.prepared_statements
+        self.prepared.configure(enabled=True, threshold=2, maxsize=256)
+        self.prepared.clear()
+        self.result_cache = self.model.result_cache.enabled
+        self.model.result_cache.enabled = False
+
+    def tearDown(self):
+        self.prepared.clear()
+        self.prepared.configure(enabled=False, threshold=5, maxsize=256)
+        self.model.result_cache.enabled = self.result_cache
+
+    def server_statements(self):
+        return [elt['statement'] for elt in self.model.execute_query(
+            "select statement from pg_prepared_statements where name like 'half_orm_%%'")]
+
+    def test_threshold(self):
+        query, _ = self.pers(last_name='aa')._prep_select()
+        self.assertEqual(self.pers(last_name='aa').get().last_name.value, 'aa')
+        self.assertNotIn(query, self.prepared)
+        self.assertEqual(self.pers(last_name='ab').get().last_name.value, 'ab')
+        self.assertIn(query, self.prepared)
+        self.assertEqual(self.pers(last_name='ac').get().last_name.value, 'ac')
+        self.assertIn(query.replace('%s', '$1'), [
+            statement.split(' as ', 1)[1] for statement in self.server_statements()])
+
+    def test_null_not_prepared(self):
+        relation = self.pers(last_name=('is not', NULL))
+        for _ in range(3):
+            self.assertEqual(len(list(relation.select())), 60)
+        self.assertNotIn(relation._prep_select()[0], self.prepared)
+
+    def test_in_transaction(self):
+        @self.pers.Transaction
+        def count(pers):
+            return [len(pers(last_name=name)) for name in ('aa', 'ab', 'ac')]
+        self.assertEqual(count(self.pers), [1, 1, 1])
+        self.assertEqual(self.prepared.stats()['hits'], 1)
+
+    def test_eviction(self):
+        self.prepared.configure(threshold=1, maxsize=1)
+        self.pers(last_name='aa').count()
+        self.pers(first_name='aa').count()
+        self.assertEqual(len(self.server_statements()), 1)
+
+    def test_reconnect(self):
+        for _ in range(2):
+            self.pers(last_name='aa').count()
+        self.assertEqual(self.prepared.stats()['size'], 1)
+        self.model.disconnect()
+        self.model.ping()
+        self.model.result_cache.enabled = False
+        self.assertEqual(self.prepared.stats()['size'], 0)
+        for _ in range(2):
+            self.assertEqual(self.pers(last_name='aa').count(), 1)
+        self.assertEqual(len(self.server_statements()), 1)
+
+    def test_disabled(self):
+        self.prepared.enabled = False
+        for _ in range(3):
+            self.pers(last_name='aa').count()
+        self.assertEqual(self.prepared.stats()['size'], 0)
+        self.assertEqual(self.server_statements(), [])
+
+    def test_disabled_by_default(self):
+        self.assertFalse(PreparedStatements().enabled)
+
+    def test_result_type_changed(self):
+        "a statement whose result type changed is deallocated and run unprepared"
+        self.model.execute_query('create table public.half_orm_prepared (a int)')
+        try:
+            query = 'select * from public.half_orm_prepared where a = %s'
+            with self.model._connection.cursor() as cursor:
+                for _ in range(2):
+                    self.prepared.execute(cursor, query, (1,))
+                self.assertIn(query, self.prepared)
+                self.model.execute_query('alter table public.half_orm_prepared add b int')
+                self.prepared.execute(cursor, query, (1,))
+                self.assertEqual(cursor.description[-1].name, 'b')
+            self.assertNotIn(query, self.prepared)
+            self.assertEqual(self.server_statements(), [])
+        finally:
+            self.model.execute_query('drop table public.half_orm_prepared')
+
+    def test_unpreparable_bounded(self):
+        self.prepared.configure(threshold=1, maxsize=1)
+        with self.model._connection.cursor() as cursor:
+            for idx in range(6):
+                self.prepared.execute(cursor, f'select {idx} where true is not %s', (None,))
+        unpreparable = self.prepared._PreparedStatements__unpreparable
+        self.assertEqual(len(unpreparable), 4)
+
+    def test_threads(self):
+        "the statements are prepared and deallocated by concurrent threads"
+        self.prepared.configure(threshold=1, maxsize=2)
+        errors = []
+        def run(name):
+            try:
+                for _ in range(20):
+                    for field in ('last_name', 'first_name', 'birth_date'):
+                        value = name if field != 'birth_date' else '1970-01-01'
+                        self.pers(**{field: value}).count()
+            except Exception as err: #pylint: disable=broad-except
+                errors.append(err)
+        threads = [threading.Thread(target=run, args=(name,)) for name in ('aa', 'ab', 'ac')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(self.server_statements()), 2)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+from unittest import TestCase
+
+from half_orm.replica import _exact_columns
+
+from ..init import halftest
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.model = self.pers._model
+        self.replica = self.model.replicate('actor.person')
+        self.aa_id = next(self.model.execute_query(
+            "select id from actor.person where last_name = 'aa'"))['id']
+
+    def tearDown(self):
+        self.model.drop_replica('actor.person')
+
+    def test_indexes(self):
+        indexes = self.replica.stats()['indexes']
+        self.assertIn(('first_name', 'last_name', 'birth_date'), indexes)
+        self.assertIn(('id',), indexes)
+        self.assertEqual(self.replica.stats()['rows'], 60)
+
+    def test_local_get(self):
+        person = self.pers(id=self.aa_id).get()
+        self.assertEqual(person.last_name.value, 'aa')
+        self.assertEqual(self.replica.hits, 2)
+        self.assertEqual(self.replica.fallbacks, 0)
+        self.assertEqual(len(self.pers()), 60)
+        self.assertEqual(self.pers(first_name='ab').count(), 1)
+        self.assertEqual(
+            list(self.pers(last_name='ab').select('first_name')), [{'first_name': 'ab'}])
+        self.assertTrue(self.pers(last_name='zz').is_empty())
+
+    def test_fallbacks(self):
+        self.assertEqual(self.pers(last_name=('like', 'a%')).count(), 10)
+        self.assertEqual(self.pers(id=str(self.aa_id)).count(), 1)
+        self.assertEqual(self.replica.fallbacks, 2)
+        self.assertEqual(self.replica.hits, 0)
+        persons = self.pers().order_by('last_name').limit(1)
+        self.assertEqual(next(persons.select())['last_name'], 'aa')
+        self.assertEqual(self.replica.hits, 0)
+
+    def test_exact_columns(self):
+        "the equality of these types differs in Python and in SQL"
+        fields = {
+            name: {'fieldtype': fieldtype} for name, fieldtype in (
+                ('a', 'int4'), ('b', 'bpchar'), ('c', 'citext'), ('d', 'numeric'),
+                ('e', 'float8'), ('f', 'text'), ('g', 'text'), ('h', 'timestamptz'))}
+        self.assertEqual(_exact_columns(fields, {'g'}), {'a', 'f'})
+        self.assertEqual(
+            _exact_columns(self.model._metadata['byname'][('halftest', 'actor', 'person')]['fields'], set()),
+            {'id', 'first_name', 'last_name', 'birth_date'})
+
+    def test_dml_reloads(self):
+        self.pers(last_name='aa').update(first_name='replica')
+        try:
+            self.assertEqual(self.pers(first_name='replica').count(), 1)
+            self.assertEqual(self.replica.hits, 1)
+        finally:
+            self.pers(last_name='aa').update(first_name='aa')
+        self.assertEqual(self.pers(first_name='replica').count(), 0)
+
+    def test_refresh(self):
+        query = "update actor.person set first_name = %s where last_name = 'aa'"
+        self.model.execute_query(query, ('replica',))
+        try:
+            self.assertEqual(self.pers(first_name='replica').count(), 0)
+            self.replica.refresh = 0
+            self.assertEqual(self.pers(first_name='replica').count(), 1)
+        finally:
+            self.model.execute_query(query, ('aa',))
+
+    def test_transaction_bypass(self):
+        @self.pers.Transaction
+        def count(pers):
+            return pers(last_name='aa').count()
+        self.assertEqual(count(self.pers), 1)
+        self.assertEqual(self.replica.hits, 0)
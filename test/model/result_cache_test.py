@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+import time
+from unittest import TestCase
+
+from ..init import halftest
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.post = halftest.post
+        self.model = self.pers._model
+        self.cache = self.model.result_cache
+        self.enabled = self.cache.enabled
+        self.cache.clear()
+        self.cache.configure(enabled=True, ttl=60, maxsize=1024)
+        self.post().delete(delete_all=True)
+
+    def tearDown(self):
+        self.post().delete(delete_all=True)
+        self.cache.clear()
+        self.cache.enabled = self.enabled
+
+    def insert_post(self, title, author):
+        post = self.post(title=title, content='result cache')
+        post.author_first_name = author.first_name.value
+        post.author_last_name = author.last_name.value
+        post.author_birth_date = author.birth_date.value
+        post.insert()
+
+    def test_hits(self):
+        self.assertEqual(self.pers(last_name='aa').get().first_name.value, 'aa')
+        self.assertEqual(self.pers(last_name='aa').get().first_name.value, 'aa')
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 2))
+        self.assertEqual(stats['hit_ratio'], .5)
+        self.assertGreater(stats['memory'], 0)
+
+    def test_rows_are_copies(self):
+        row = next(self.pers(last_name='aa').select())
+        row['last_name'] = 'modified'
+        self.assertEqual(next(self.pers(last_name='aa').select())['last_name'], 'aa')
+
+    def test_dml_invalidation(self):
+        self.assertEqual(self.post().count(), 0)
+        self.insert_post('a', self.pers(last_name='aa').get())
+        self.assertEqual(self.post().count(), 1)
+        self.post(title='a').update(title='b')
+        self.assertEqual([elt['title'] for elt in self.post().select('title')], ['b'])
+        self.post(title='b').delete()
+        self.assertEqual(self.post().count(), 0)
+        self.assertGreater(self.cache.stats()['invalidations'], 0)
+
+    def test_joined_relation_invalidation(self):
+        posts = self.post()
+        posts.author_ = self.pers(last_name='aa')
+        self.assertEqual(posts.count(), 0)
+        self.insert_post('a', self.pers(last_name='aa').get())
+        posts = self.post()
+        posts.author_ = self.pers(last_name='aa')
+        self.assertEqual(posts.count(), 1)
+
+    def test_dependents(self):
+        dependents = self.model._dependent_relations(('halftest', 'actor', 'person'))
+        self.assertIn(('halftest', 'blog', 'post'), dependents)
+        self.assertIn(('halftest', 'blog', 'comment'), dependents)
+        self.assertIn(('halftest', 'blog.view', 'post_comment'), dependents)
+        dependents = self.model._dependent_relations(('halftest', 'blog', 'event'))
+        self.assertIn(('halftest', 'blog', 'post'), dependents)
+
+    def test_view_invalidation(self):
+        view = halftest.relation('blog.view.post_comment')
+        self.assertEqual(view().count(), 0)
+        aa = self.pers(last_name='aa').get()
+        self.insert_post('a', aa)
+        post_id = next(self.post(title='a').select('id'))['id']
+        halftest.comment(author_id=aa.id.value, post_id=post_id, content='view').insert()
+        self.assertEqual(view().count(), 1)
+
+    def test_ttl(self):
+        self.cache.ttl = 0
+        self.pers(last_name='aa').count()
+        time.sleep(.01)
+        self.pers(last_name='aa').count()
+        self.assertEqual(self.cache.stats()['hits'], 0)
+
+    def test_transaction_bypass(self):
+        @self.pers.Transaction
+        def count(pers):
+            return pers(last_name='aa').count()
+        self.assertEqual(count(self.pers), 1)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_lru(self):
+        self.cache.configure(maxsize=2)
+        for name in ('aa', 'ab', 'ac'):
+            self.pers(last_name=name).count()
+        self.assertEqual(len(self.cache), 2)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+import threading
+import time
+from unittest import TestCase
+
+from half_orm.single_flight import SingleFlight
+
+from ..init import halftest
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.model = self.pers._model
+
+    def tearDown(self):
+        self.model.single_flight.enabled = False
+
+    def waiters(self, single_flight, key, count):
+        "Starts count threads calling single_flight.do(key, ...)."
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                single_flight.do(key, lambda: 'waiter')))
+            for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    def test_coalescing(self):
+        single_flight = SingleFlight(enabled=True)
+        running = threading.Event()
+        release = threading.Event()
+        def leader():
+            running.set()
+            release.wait()
+            return 'leader'
+        leader_result = []
+        thread = threading.Thread(
+            target=lambda: leader_result.append(single_flight.do('key', leader)))
+        thread.start()
+        running.wait()
+        threads, results = self.waiters(single_flight, 'key', 5)
+        while single_flight.stats()['waiting'] != 5:
+            time.sleep(0.001)
+        self.assertEqual(single_flight.do('other', lambda: 'other'), 'other')
+        release.set()
+        for elt in threads + [thread]:
+            elt.join()
+        self.assertEqual(leader_result, ['leader'])
+        self.assertEqual(results, ['leader'] * 5)
+        stats = single_flight.stats()
+        self.assertEqual((stats['executions'], stats['shared']), (2, 5))
+        self.assertEqual((stats['in_flight'], stats['waiting']), (0, 0))
+
+    def test_error_shared(self):
+        single_flight = SingleFlight(enabled=True)
+        running = threading.Event()
+        release = threading.Event()
+        def failure():
+            running.set()
+            release.wait()
+            raise ValueError('failure')
+        errors = []
+        def call():
+            try:
+                single_flight.do('key', failure)
+            except ValueError as err:
+                errors.append(err)
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        threads[0].start()
+        running.wait()
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 3)
+
+    def test_timeout(self):
+        single_flight = SingleFlight(timeout=0.01, enabled=True)
+        running = threading.Event()
+        release = threading.Event()
+        def slow():
+            running.set()
+            release.wait()
+            return 'slow'
+        thread = threading.Thread(target=lambda: single_flight.do('key', slow))
+        thread.start()
+        running.wait()
+        self.assertEqual(single_flight.do('key', lambda: 'fast'), 'fast')
+        release.set()
+        thread.join()
+        self.assertEqual(single_flight.timeouts, 1)
+
+    def test_relation_queries(self):
+        self.model.single_flight.enabled = True
+        results = []
+        def read():
+            pers = self.pers(last_name=('like', 'a%'))
+            results.append((pers.count(), [elt['last_name'] for elt in pers.select('last_name')]))
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 8)
+        for count, names in results:
+            self.assertEqual(count, 10)
+            self.assertEqual(sorted(names), [f'a{chr(ord("a") + i)}' for i in range(10)])
+        self.assertEqual(self.model.single_flight.stats()['in_flight'], 0)
+
+    def test_transaction_bypass(self):
+        self.model.single_flight.enabled = True
+        executions = self.model.single_flight.executions
+        @self.pers.Transaction
+        def count(pers):
+            return pers(last_name='aa').count()
+        self.assertEqual(count(self.pers), 1)
+        self.assertEqual(self.model.single_flight.executions, executions)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+import io
+from unittest import TestCase
+
+from half_orm.snapshot import Snapshot
+
+from ..init import halftest, model
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.persons = self.pers(last_name=('like', 'a%'))
+        self.new = self.pers(first_name='snap', last_name='az', birth_date='1970-01-01')
+        self.new.delete()
+
+    def tearDown(self):
+        self.new.delete()
+
+    def test_current(self):
+        self.assertIsNone(Snapshot.current())
+        with model.snapshot() as snapshot:
+            self.assertIs(Snapshot.current(), snapshot)
+            self.assertIsInstance(snapshot.id, str)
+        self.assertIsNone(Snapshot.current())
+        self.assertIsNone(snapshot.id)
+
+    def test_connection(self):
+        with model.snapshot() as snapshot:
+            self.new.insert()
+            with snapshot.connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "select count(*) from actor.person where last_name like 'a%%'")
+                    self.assertEqual(cursor.fetchone()['count'], 10)
+        self.assertEqual(self.persons.count(), 11)
+
+    def test_copy_to(self):
+        with model.snapshot() as snapshot:
+            self.new.insert()
+            with snapshot.connection() as connection:
+                fileobj = io.StringIO()
+                self.assertEqual(
+                    self.persons.copy_to(fileobj, header=False, connection=connection), 10)
+        self.assertNotIn('snap', fileobj.getvalue())
+
+    def test_parallel_select(self):
+        with model.snapshot():
+            self.new.insert()
+            self.assertEqual(
+                sum(self.persons.parallel_select(workers=2, split_on='id', callback=len)), 10)
+        self.assertEqual(
+            sum(self.persons.parallel_select(workers=2, split_on='id', callback=len)), 11)
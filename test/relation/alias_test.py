@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+from unittest import TestCase
+
+from ..init import halftest
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.post = halftest.post
+        self.comment = halftest.comment
+        self.cache = self.pers._model.sql_cache
+        self.cache.maxsize = 0
+
+    def tearDown(self):
+        self.cache.maxsize = 1024
+
+    def test_aliases_are_positions(self):
+        query, _ = self.pers(last_name='aa')._prep_select()
+        self.assertEqual(
+            query,
+            'select\n  r0.*\nfrom\n  "halftest"."actor"."person" as r0\nwhere\n    r0."last_name" = %s')
+
+    def test_same_intent_same_text(self):
+        def intent():
+            author = self.pers(last_name='aa')
+            posts = self.post()
+            posts.author_ = author
+            comments = self.comment()
+            comments.author_ = author
+            comments.post_ = posts
+            return comments
+        self.assertEqual(intent()._prep_select()[0], intent()._prep_select()[0])
+        self.assertEqual(
+            intent().semi_join()._prep_select()[0], intent().semi_join()._prep_select()[0])
+
+    def test_reverse_fkey(self):
+        authors = self.post(title='aa').author_
+        query, _ = authors._prep_select()
+        self.assertIn('"actor"."person" as r0', query)
+        self.assertIn('"blog"."post" as r1', query)
+        self.assertIn('r1."title" = %s', query)
+        self.assertEqual(len(list(authors.select())), 0)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+import datetime
+import decimal
+import uuid
+from unittest import TestCase
+
+from half_orm import copy_binary
+
+from ..init import halftest
+
+COLUMNS = {
+    'i2': 'int2', 'i4': 'int4', 'i8': 'int8', 'f4': 'float4', 'f8': 'float8', 'b': 'bool',
+    't': 'text', 'v': 'varchar', 'n': 'numeric', 'd': 'date', 'tm': 'time', 'ts': 'timestamp',
+    'tz': 'timestamptz', 'iv': 'interval', 'u': 'uuid', 'by': 'bytea', 'j': 'jsonb',
+    'ai': '_int4', 'at': '_text'}
+METADATA = {
+    name: {'fieldtype': fieldtype, 'fielddim': fieldtype.startswith('_') and 1 or 0}
+    for name, fieldtype in COLUMNS.items()}
+UTC = datetime.timezone.utc
+
+class Test(TestCase):
+    def setUp(self):
+        self.model = halftest.pers._model
+        self.model.execute_query('create temp table half_orm_binary ({})'.format(', '.join(
+            f"{name} {fieldtype.startswith('_') and fieldtype[1:] + '[]' or fieldtype}"
+            for name, fieldtype in COLUMNS.items())))
+
+    def tearDown(self):
+        self.model.execute_query('drop table half_orm_binary')
+
+    def copy(self, rows):
+        encoder = copy_binary.Encoder(METADATA, list(COLUMNS))
+        with self.model._connection.cursor() as cursor:
+            for chunk in rows:
+                cursor.copy_expert(
+                    f"copy half_orm_binary ({', '.join(COLUMNS)}) from stdin with (format binary)",
+                    encoder.load(chunk))
+        return [
+            tuple(bytes(value) if isinstance(value, memoryview) else value for value in row.values())
+            for row in self.model.execute_query(
+                f"select {', '.join(COLUMNS)} from half_orm_binary order by i4")]
+
+    def test_round_trip(self):
+        row = (
+            -2, 2**31 - 1, -2**62, 1.5, -2.25, True, 'tab\t', 'varchar',
+            decimal.Decimal('-12345.000670'),
+            datetime.date(1999, 12, 31), datetime.time(23, 59, 59, 123456),
+            datetime.datetime(2024, 2, 29, 1, 2, 3, 4),
+            datetime.datetime(1970, 1, 1, 12, tzinfo=UTC),
+            datetime.timedelta(days=-3, seconds=5, microseconds=6),
+            uuid.UUID(int=2**100), b'\x00\xff', {'a': [1, None]},
+            [1, None, 3], [['a', 'b'], ['c', None]])
+        nulls = (None, 0, *(None,) * (len(COLUMNS) - 2))
+        empty = (None, 1, None, None, None, False, '', None, decimal.Decimal('0.00'),
+                 None, None, None, None, None, None, b'', [], [], [])
+        self.assertEqual(self.copy([[nulls, empty], [row]]), [nulls, empty, row])
+
+    def test_numeric(self):
+        values = ['0', '1', '-1', '10000', '123456789.123456789', '0.0001', '1E+8', '9999.9999',
+                  '0.00001234', 'NaN']
+        encoder = copy_binary.Encoder({'n': {'fieldtype': 'numeric'}}, ['n'])
+        self.model.execute_query('create temp table half_orm_numeric (n numeric)')
+        try:
+            with self.model._connection.cursor() as cursor:
+                cursor.copy_expert(
+                    'copy half_orm_numeric from stdin with (format binary)',
+                    encoder.load((decimal.Decimal(value),) for value in values))
+            self.assertEqual(
+                [str(elt['n']) for elt in self.model.execute_query(
+                    'select n from half_orm_numeric')],
+                ['0', '1', '-1', '10000', '123456789.123456789', '0.0001', '100000000',
+                 '9999.9999', '0.00001234', 'NaN'])
+        finally:
+            self.model.execute_query('drop table half_orm_numeric')
+
+    def test_buffer(self):
+        encoder = copy_binary.Encoder({'i': {'fieldtype': 'int4'}}, ['i'])
+        self.assertEqual(
+            encoder.load([(1,)]).getvalue(),
+            b'PGCOPY\n\xff\r\n\x00' + bytes(8) + b'\x00\x01\x00\x00\x00\x04\x00\x00\x00\x01\xff\xff')
+        self.assertEqual(encoder.read(3), b'PGC')
+        self.assertEqual(len(encoder.read()), 28)
+        self.assertEqual(encoder.read(), b'')
+        self.assertEqual(len(encoder.load([]).read()), 21)
+
+    def test_unsupported(self):
+        self.assertRaises(
+            ValueError, copy_binary.Encoder, {'p': {'fieldtype': 'point'}}, ['p'])
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+import csv
+import gzip
+import io
+import os
+import tempfile
+from unittest import TestCase
+
+from half_orm import relation_errors
+
+from ..init import halftest
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.post = halftest.post
+        self.persons = self.pers(last_name=('like', 'a%')).order_by('last_name desc')
+        self.post().delete(delete_all=True)
+        for last_name in ('aa', 'ab'):
+            author = self.pers(last_name=last_name).get()
+            self.post(
+                title=f'by {last_name}', content='copy_to',
+                author_first_name=author.first_name.value, author_last_name=last_name,
+                author_birth_date=author.birth_date.value).insert()
+
+    def tearDown(self):
+        self.post().delete(delete_all=True)
+
+    def test_csv(self):
+        fileobj = io.StringIO()
+        self.assertEqual(self.persons.copy_to(fileobj), 10)
+        rows = list(csv.DictReader(io.StringIO(fileobj.getvalue())))
+        self.assertEqual(list(rows[0]), list(self.pers._fields))
+        self.assertEqual(
+            [row['last_name'] for row in rows],
+            [elt['last_name'] for elt in self.persons.select()])
+
+    def test_fields_limit(self):
+        fileobj = io.StringIO()
+        self.persons.limit(3).offset(1).copy_to(fileobj, fields=['last_name'], header=False)
+        self.assertEqual(fileobj.getvalue().split(), ['ai', 'ah', 'ag'])
+        self.assertRaises(
+            relation_errors.UnknownAttributeError, self.persons.copy_to, fileobj, fields=['nope'])
+        self.assertRaises(ValueError, self.persons.copy_to, fileobj, format='xml')
+
+    def test_fkey_constraint(self):
+        post = self.post()
+        post.author_ = self.pers(last_name='aa')
+        fileobj = io.StringIO()
+        post.copy_to(fileobj, format='text', fields=['title', 'content'])
+        self.assertEqual(fileobj.getvalue(), 'by aa\tcopy_to\n')
+
+    def test_binary_gzip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'persons.bin.gz')
+            with gzip.open(path, 'wb') as fileobj:
+                self.assertEqual(self.persons.copy_to(fileobj, format='binary'), 10)
+            with gzip.open(path, 'rb') as fileobj:
+                self.assertEqual(fileobj.read(11), b'PGCOPY\n\xff\r\n\x00')
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+from unittest import TestCase
+
+from ..init import halftest
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.post = halftest.post
+        self.comment = halftest.comment
+        self.post().delete(delete_all=True)
+        self.aa = self.pers(last_name='aa').get()
+        self.ab = self.pers(last_name='ab').get()
+        for author in (self.aa, self.aa, self.ab):
+            post = self.post(title='count', content='count')
+            post.author_first_name = author.first_name.value
+            post.author_last_name = author.last_name.value
+            post.author_birth_date = author.birth_date.value
+            post_id = post.insert()[0]['id']
+            for _ in range(2):
+                self.comment(
+                    author_id=author.id.value, post_id=post_id, content='count').insert()
+
+    def tearDown(self):
+        self.post().delete(delete_all=True)
+
+    def __count_query(self, relation):
+        return getattr(relation, '__count_query')(_distinct=True)[0]
+
+    def test_no_join_count_star(self):
+        pers = self.pers(last_name=('like', 'a%'))
+        query = self.__count_query(pers)
+        self.assertIn('count(*)', query)
+        self.assertNotIn('distinct', query)
+        self.assertEqual(len(pers), 10)
+
+    def test_semi_join(self):
+        "the joined relations are compiled in exists sub-queries"
+        authors = self.post(title='count').author_
+        query = self.__count_query(authors)
+        self.assertIn('count(*)', query)
+        self.assertIn('exists', query)
+        self.assertNotIn('join', query)
+        self.assertEqual(len(authors), 2)
+        self.assertEqual(authors.count(), 3)
+
+    def test_nested_semi_joins(self):
+        comments = self.comment()
+        comments.post_ = self.post(title='count')
+        comments.author_ = self.pers(last_name='aa')
+        self.assertEqual(self.__count_query(comments).count('exists'), 2)
+        self.assertEqual(len(comments), 4)
+
+    def test_shared_relation_count_distinct_pkey(self):
+        "a relation reached twice keeps the joins and counts the distinct pkey"
+        author = self.pers(last_name='aa')
+        posts = self.post()
+        posts.author_ = author
+        comments = self.comment()
+        comments.author_ = author
+        comments.post_ = posts
+        query = self.__count_query(comments)
+        self.assertIn('count(distinct r', query)
+        self.assertIn('join', query)
+        self.assertEqual(len(comments), 4)
+
+    def test_is_empty(self):
+        self.assertFalse(self.pers(last_name=('like', 'a%')).is_empty())
+        self.assertFalse(self.post(title='count').author_.is_empty())
+        self.assertTrue(self.post(title='no post').author_.is_empty())
+        self.assertTrue((-self.pers()).is_empty())
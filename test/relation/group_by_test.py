@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+import json
+from unittest import TestCase
+
+import psycopg2
+
+from half_orm import grouping, relation_errors
+
+from ..init import halftest
+
+DIRECTIVE = """
+posts:
+  - post_title: title
+    author_post_last_name: author
+    comments:
+      - comment_content: content
+        author_comment_last_name: author
+"""
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.post = halftest.post
+        self.comment = halftest.comment
+        self.post_comment = halftest.relation('"blog.view".post_comment')()
+        self.comment().delete(delete_all=True)
+        self.post().delete(delete_all=True)
+        authors = {name: self.pers(last_name=name).get() for name in ('aa', 'ab')}
+        for title, author in (('first', 'aa'), ('second', 'ab'), ('third', 'aa')):
+            post = self.post(
+                title=title, content='group_by',
+                author_first_name=author, author_last_name=author,
+                author_birth_date=authors[author].birth_date.value).insert()[0]
+            for commenter in ('aa', 'ab')[:title != 'third' and 2 or 0]:
+                self.comment(
+                    content=f'{title} by {commenter}', post_id=post['id'],
+                    author_id=authors[commenter].id.value).insert()
+
+    def tearDown(self):
+        self.comment().delete(delete_all=True)
+        self.post().delete(delete_all=True)
+
+    def test_group_by(self):
+        result = self.post_comment.order_by('post_title, comment_content').group_by(DIRECTIVE)
+        self.assertEqual(result, {'posts': [
+            {'title': 'first', 'author': 'aa', 'comments': [
+                {'content': 'first by aa', 'author': 'aa'},
+                {'content': 'first by ab', 'author': 'ab'}]},
+            {'title': 'second', 'author': 'ab', 'comments': [
+                {'content': 'second by aa', 'author': 'aa'},
+                {'content': 'second by ab', 'author': 'ab'}]},
+            {'title': 'third', 'author': 'aa', 'comments': [
+                {'content': None, 'author': None}]},
+        ]})
+
+    def test_dict_groups(self):
+        result = self.post_comment(post_title='first').group_by("""
+post_title: title
+author:
+  author_post_last_name: name
+""")
+        self.assertEqual(result, {'title': 'first', 'author': {'name': 'aa'}})
+
+    def test_compiled_once(self):
+        fields = tuple(self.post_comment._fields)
+        directive = grouping.compile_directive(DIRECTIVE, fields)
+        self.assertIs(grouping.compile_directive(DIRECTIVE, fields), directive)
+        self.assertEqual(directive.groups[0][0], 'posts')
+        self.assertTrue(directive.groups[0][1])
+
+    def test_streaming(self):
+        directive = grouping.compile_directive("[{a: x, g: [{b: y}]}]", ('a', 'b'))
+        rows = ({'a': idx % 2, 'b': idx} for idx in range(4))
+        self.assertEqual(
+            grouping.group(directive, rows), {'x': 1, 'g': [{'y': idx} for idx in range(4)]})
+
+    def test_unknown_field(self):
+        self.assertRaises(
+            relation_errors.UnknownAttributeError,
+            self.post_comment.group_by, "posts: [{titel: title}]\nnope: 1")
+
+    def test_in_database(self):
+        post_comment = self.post_comment.order_by('post_title, comment_content')
+        directives = [
+            DIRECTIVE,
+            "post_title: title\nauthor:\n  author_post_last_name: name\n",
+            "[{post_title: title, comments: [{comment_content: content}]}]",
+            None]
+        for directive in directives:
+            self.assertEqual(
+                json.loads(post_comment.to_json(directive, in_database=True)),
+                json.loads(post_comment.to_json(directive)))
+        self.assertEqual(
+            json.loads(post_comment.to_json(DIRECTIVE, 'result', in_database=True, page=1)),
+            json.loads(post_comment.to_json(DIRECTIVE, 'result', page=1)))
+
+    def test_in_database_json(self):
+        "the json values are grouped as jsonb"
+        model = self.pers._model
+        query = """select * from (values
+            ('{"a": 1}'::json, 2), ('{"a": 1}'::json, 1), ('{"b": 2}'::json, 3)) as t(doc, n)"""
+        directive = grouping.compile_directive("[{doc: doc, ns: [{n: n}]}]", ('doc', 'n'))
+        self.assertRaises(
+            psycopg2.ProgrammingError, model.execute_query, grouping.to_sql(directive, query))
+        rows = list(model.execute_query(f'{query} order by n'))
+        self.assertEqual(
+            json.loads(model.execute_query(
+                grouping.to_sql(directive, query, {'doc': '::jsonb'}, 'n')).fetchone()['json']),
+            json.loads(json.dumps(grouping.group(directive, rows))))
+
+    def test_in_database_empty(self):
+        post_comment = self.post_comment(post_title='nope')
+        for directive in (DIRECTIVE, None):
+            self.assertEqual(
+                json.loads(post_comment.to_json(directive, in_database=True)),
+                json.loads(post_comment.to_json(directive)))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+import threading
+from unittest import TestCase
+
+from half_orm.identity_map import IdentityMap
+
+from ..init import halftest
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.post = halftest.post
+        self.comment = halftest.comment
+        self.aa = self.pers(last_name='aa').get()
+        self.post.delete(delete_all=True)
+        self.post(
+            title='identity', content='map', author_first_name='aa',
+            author_last_name='aa', author_birth_date=halftest.today).insert()
+
+    def tearDown(self):
+        self.post.delete(delete_all=True)
+
+    def pk(self):
+        return dict(
+            first_name='aa', last_name='aa', birth_date=halftest.today)
+
+    def test_get(self):
+        with self.pers.IdentityMap() as identity_map:
+            person = self.pers(**self.pk()).get()
+            self.assertIs(self.pers(**self.pk()).get(), person)
+            self.assertEqual(identity_map.stats(), {'size': 1, 'hits': 1, 'misses': 1})
+            self.assertIsNot(self.pers(last_name='aa').get(), person)
+        self.assertIsNone(IdentityMap.current())
+        self.assertIsNot(self.pers(**self.pk()).get(), person)
+
+    def test_singleton(self):
+        "get() marks the relation as a singleton, the map being warm or not"
+        with IdentityMap():
+            for _ in range(2):
+                persons = self.pers(**self.pk())
+                self.assertTrue(persons.get()._is_singleton)
+                self.assertTrue(persons._is_singleton)
+
+    def test_fkey_traversal(self):
+        with IdentityMap() as identity_map:
+            post = self.post(title='identity').get()
+            author = post.author_.get()
+            self.assertEqual(author.id.value, self.aa.id.value)
+            self.assertIs(post.author_.get(), author)
+            self.assertIs(self.pers(**self.pk()).get(), author)
+            self.assertEqual(identity_map.hits, 2)
+
+    def test_dml_invalidates(self):
+        with IdentityMap() as identity_map:
+            person = self.pers(**self.pk()).get()
+            self.pers(**self.pk()).update(first_name='aa')
+            self.assertEqual(len(identity_map), 0)
+            self.assertIsNot(self.pers(**self.pk()).get(), person)
+            self.post(title='identity').get()
+            self.assertEqual(len(identity_map), 2)
+            # a change on actor.person may cascade on blog.post
+            self.pers(**self.pk()).update(first_name='aa')
+            self.assertEqual(len(identity_map), 0)
+
+    def test_rollback_clears(self):
+        @self.pers.Transaction
+        def failure(pers):
+            pers(**self.pk()).get()
+            raise RuntimeError
+        with IdentityMap() as identity_map:
+            self.assertRaises(RuntimeError, failure, self.pers)
+            self.assertEqual(len(identity_map), 0)
+
+    def test_context(self):
+        result = []
+        with IdentityMap():
+            self.pers(**self.pk()).get()
+            thread = threading.Thread(target=lambda: result.append(IdentityMap.current()))
+            thread.start()
+            thread.join()
+        self.assertEqual(result, [None])
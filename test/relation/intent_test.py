@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+import pickle
+import subprocess
+import sys
+from decimal import Decimal
+from unittest import TestCase
+
+from half_orm.intent import _canonical
+from half_orm.null import NULL
+
+from ..init import halftest
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.post = halftest.post
+        self.comment = halftest.comment
+        self.post().delete(delete_all=True)
+        for last_name in ('aa', 'ab'):
+            author = self.pers(last_name=last_name).get()
+            self.post(
+                title=f'by {last_name}', content='intent',
+                author_first_name=author.first_name.value, author_last_name=last_name,
+                author_birth_date=author.birth_date.value).insert()
+
+    def tearDown(self):
+        self.post().delete(delete_all=True)
+
+    def roundtrip(self, relation):
+        "Returns the relation rebuilt from its pickled intent."
+        intent = pickle.loads(pickle.dumps(relation.to_intent()))
+        self.assertEqual(intent, relation.to_intent())
+        return relation.__class__.from_intent(intent)
+
+    def assert_same(self, relation):
+        "The relation rebuilt from its intent has the same query and result."
+        rebuilt = self.roundtrip(relation)
+        self.assertEqual(rebuilt.to_intent(), relation.to_intent())
+        self.assertEqual(rebuilt._prep_select()[0], relation._prep_select()[0])
+        self.assertEqual(list(rebuilt.select()), list(relation.select()))
+
+    def test_fields(self):
+        persons = self.pers(last_name=('like', 'a%'), birth_date=('is not', NULL))
+        self.assert_same(persons.order_by('last_name').limit(3))
+        self.assertIs(self.roundtrip(persons).birth_date.value, NULL)
+        rebuilt = self.pers._model.from_intent(persons.to_intent())
+        self.assertIsInstance(rebuilt, self.pers.__class__)
+        self.assertEqual(rebuilt.count(), persons.count())
+        persons.last_name.unaccent = True
+        self.assertTrue(self.roundtrip(persons).last_name.unaccent)
+        self.assertNotEqual(persons.to_intent(), self.pers(last_name=('like', 'a%')).to_intent())
+
+    def test_set_operations(self):
+        persons = self.pers(last_name=('like', 'a%'))
+        self.assert_same(persons - self.pers(last_name='ab'))
+        self.assert_same(-(persons & self.pers(first_name=('like', '%c'))))
+        self.assert_same(persons | self.pers(last_name='bb'))
+
+    def test_fkeys(self):
+        post = self.post(content='intent')
+        post.author_ = self.pers(last_name='aa')
+        self.assert_same(post)
+        # reverse fkey built by FKey.__call__
+        persons = self.post(title='by ab')._fkeys['author']()
+        self.assertIn(' join ', persons._prep_select()[0])
+        self.assert_same(persons)
+        self.assertEqual([elt['last_name'] for elt in persons.select()], ['ab'])
+
+    def test_view(self):
+        post_comment = halftest.relation('"blog.view".post_comment')(post_title='by aa')
+        self.assert_same(post_comment)
+        self.assertEqual(
+            self.pers._model.from_intent(post_comment.to_intent()).count(), post_comment.count())
+
+    def test_canonical(self):
+        "the type of a value is part of its representation"
+        values = [1, 1.0, True, '1', Decimal('1'), b'1', [1], (1,), {'a': 1}, None, NULL]
+        self.assertEqual(len({_canonical(value) for value in values}), len(values))
+        self.assertEqual(_canonical({'a': 1, 'b': 2}), _canonical({'b': 2, 'a': 1}))
+
+    def test_hash(self):
+        intent = self.pers(last_name='aa').to_intent()
+        self.assertEqual(hash(intent), hash(self.pers(last_name='aa').to_intent()))
+        self.assertNotEqual(intent, self.pers(last_name='ab').to_intent())
+        self.assertEqual({intent: 1}[self.pers(last_name='aa').to_intent()], 1)
+        # the digest doesn't depend on the process
+        code = (
+            'import datetime; from half_orm.intent import Intent; '
+            'print(Intent(((("halftest", "actor", "person"), False, '
+            '("fields", False, (("birth_date", "=", datetime.date(2000, 1, 1), False),)), ()),), '
+            '()).digest)')
+        digests = {
+            subprocess.run(
+                [sys.executable, '-c', code], capture_output=True, text=True,
+                env={'PYTHONHASHSEED': seed}, check=True).stdout
+            for seed in ('1', '2')}
+        self.assertEqual(len(digests), 1)
@@ -96,3 +96,25 @@ class Test(HoTestCase):
             (self.comment(), 'comments', 'content')
         )[0]
         self.assertEqual({self.comment_ab_post, self.comment_ab_post_1}, set(res3['comments']))
+
+    def test_single_query(self):
+        "join with single_query should return the same result"
+        def normalize(res):
+            return sorted(
+                repr({key: sorted(map(repr, value)) if isinstance(value, list) else value
+                      for key, value in elt.items()})
+                for elt in res)
+        f_rels = [
+            ((self.comment(), 'comments'), (self.post(), 'posts')),
+            ((self.personne(), 'author', ['id', 'last_name']), (self.post(), 'post', 'title')),
+        ]
+        relations = [self.personne, self.comment(content=self.comment_ab_post_1)]
+        for relation, rels in zip(relations, f_rels):
+            self.assertEqual(
+                normalize(relation.join(*rels)),
+                normalize(relation.join(*rels, single_query=True)))
+        author_ab = self.comment(content=self.comment_ab_post_1).author_
+        res = author_ab.join((self.comment(), 'comments', 'content'), single_query=True)
+        self.assertEqual({self.comment_ab_post, self.comment_ab_post_1}, set(res[0]['comments']))
+        res = self.pers(last_name='ac').join((self.comment(), 'comments'), single_query=True)
+        self.assertEqual(res[0]['comments'], [])
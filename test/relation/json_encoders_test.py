@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+import datetime
+import decimal
+import json
+import uuid
+from unittest import TestCase
+
+from half_orm import json_encoders
+
+from ..init import halftest
+
+METADATA = {
+    'name': {'fieldtype': 'text', 'fielddim': 0},
+    'created': {'fieldtype': 'timestamptz', 'fielddim': 0},
+    'key': {'fieldtype': 'uuid', 'fielddim': 0},
+    'amount': {'fieldtype': 'numeric', 'fielddim': 0},
+    'duration': {'fieldtype': 'interval', 'fielddim': 0},
+    'flag': {'fieldtype': 'bool', 'fielddim': 0},
+    'tags': {'fieldtype': '_text', 'fielddim': 1},
+}
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.table = json_encoders.encoder_table(METADATA)
+        self.row = {
+            'name': 'é "quoted"',
+            'created': datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+            'key': uuid.UUID(int=1), 'amount': decimal.Decimal('12.30'),
+            'duration': datetime.timedelta(minutes=90), 'flag': True, 'tags': ['a', None],
+            'computed': datetime.date(2024, 1, 2)}
+
+    def test_encoder_table(self):
+        self.assertEqual(set(self.table), set(METADATA) - {'tags'})
+        self.assertIs(self.table['key'], json_encoders.ENCODERS['uuid'])
+
+    def test_row_encoder(self):
+        encode = json_encoders.row_encoder(self.table, self.row)
+        self.assertIs(json_encoders.row_encoder(self.table, tuple(self.row)), encode)
+        expected = json.dumps(self.row, default=json_encoders.default)
+        # numerics are exact
+        self.assertEqual(encode(self.row), expected.replace('12.3', '12.30'))
+        self.assertEqual(json.loads(encode(dict.fromkeys(self.row))), dict.fromkeys(self.row))
+
+    def test_odd_columns_names(self):
+        row = {"a = '{1}'": 1, 'b"}': 'x'}
+        table = {"a = '{1}'": json_encoders.ENCODERS['int4'], 'b"}': json_encoders.ENCODERS['text']}
+        self.assertEqual(json.loads(json_encoders.row_encoder(table, row)(row)), row)
+
+    def test_relation(self):
+        persons = self.pers(last_name=('like', 'a%'))
+        self.assertEqual(
+            persons.to_json(), json.dumps(list(persons.select()), default=json_encoders.default))
+        self.assertEqual(
+            json.loads(persons.to_json(page=1)),
+            {'elements': json.loads(persons.to_json()), 'page': 1})
+
+    def test_backend(self):
+        calls = []
+        def backend(obj, default):
+            calls.append(obj)
+            return json.dumps(obj, default=default).encode('utf-8')
+        persons = self.pers(last_name=('like', 'a%'))
+        expected = json.loads(persons.to_json())
+        json_encoders.set_backend(backend)
+        try:
+            self.assertEqual(json.loads(persons.to_json()), expected)
+            self.assertEqual(json.loads(''.join(persons.to_json_stream())), expected)
+        finally:
+            json_encoders.set_backend()
+        self.assertTrue(calls)
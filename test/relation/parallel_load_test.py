@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+import datetime
+import io
+from unittest import TestCase
+
+import psycopg2
+
+from half_orm import bulk_load, relation_errors
+
+from ..init import halftest
+
+FIELDS = ['first_name', 'last_name', 'birth_date']
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.model = self.pers._model
+        self.loaded = self.pers(last_name=('like', 'load%'))
+        self.loaded.delete()
+
+    def tearDown(self):
+        self.loaded.delete()
+
+    def test_encode_row(self):
+        record = bulk_load.encode_row(
+            ['a\tb\\c\nd', None, True, [1, None, 'x"y'], datetime.date(2000, 1, 2)])
+        self.assertEqual(record, 'a\\tb\\\\c\\nd\t\\N\tt\t{"1",NULL,"x\\\\"y"}\t2000-01-02\n')
+        self.assertEqual(
+            bulk_load._keys([record], 'text', [0, 1, 4]),
+            [['a\tb\\c\nd'], [None], ['2000-01-02']])
+
+    def test_rows(self):
+        progress = []
+        rows = [(f'first{idx}', f'load{idx % 3}', datetime.date(2000, 1, 1 + idx % 28))
+                for idx in range(100)]
+        rows[0] = dict(zip(FIELDS, rows[0]))
+        self.assertEqual(
+            self.pers().parallel_load(
+                rows, workers=3, fields=FIELDS, chunk_rows=7,
+                progress=lambda *args: progress.append(args), analyze=True), 100)
+        self.assertEqual(self.loaded.count(), 100)
+        self.assertEqual(len(progress), 15)
+        self.assertEqual(progress[-1], (100, 15))
+
+    def test_binary_rows(self):
+        rows = [(f'first{idx}', f'load{idx % 3}', datetime.date(2000, 1, 1 + idx % 28))
+                for idx in range(50)]
+        rows[0] = dict(zip(FIELDS, rows[0]))
+        self.assertEqual(
+            self.pers().parallel_load(
+                rows, workers=2, fields=FIELDS, format='binary', chunk_rows=7), 50)
+        self.assertEqual(self.pers(last_name='load1', birth_date='2000-01-02').count(), 1)
+
+    def test_csv_file(self):
+        fileobj = io.StringIO(
+            'first_name,last_name,birth_date\n'
+            '"multi\nline",load1,2000-01-01\n'
+            'single,"load ""2""",2000-01-02')
+        self.assertEqual(
+            self.pers().parallel_load(
+                fileobj, fields=FIELDS, format='csv', header=True, chunk_rows=1), 2)
+        self.assertEqual(
+            sorted(elt['first_name'] for elt in self.loaded.select()), ['multi\nline', 'single'])
+        self.assertEqual(self.pers(last_name='load "2"').count(), 1)
+
+    def test_text_file(self):
+        fileobj = io.StringIO('a\tload1\t2000-01-01\nb\tload2\t2000-01-01\n')
+        self.assertEqual(self.pers().parallel_load(fileobj, fields=FIELDS), 2)
+        self.assertEqual(self.loaded.count(), 2)
+        fileobj = io.StringIO('first_name\tlast_name\tbirth_date\nc\tload3\t2000-01-01\n')
+        self.assertEqual(self.pers().parallel_load(fileobj, fields=FIELDS, header=True), 1)
+        self.assertEqual(self.loaded.count(), 3)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, self.pers().parallel_load, [], format='nope')
+        self.assertRaises(
+            ValueError, self.pers().parallel_load, io.StringIO(''), format='binary')
+        self.assertRaises(
+            relation_errors.UnknownAttributeError, self.pers().parallel_load, [], fields=['nope'])
+        self.assertRaises(
+            psycopg2.DataError, self.pers().parallel_load,
+            [('a', 'load1', 'not a date')], fields=FIELDS)
+
+    def test_retry(self):
+        "a chunk failing on a connection error is retried on a new connection"
+        model = self.model
+        class Model:
+            connections = 0
+            def _new_connection(self):
+                connection = model._new_connection()
+                Model.connections += 1
+                if Model.connections == 1:
+                    connection.close()
+                return connection
+        records = [bulk_load.encode_row(('a', 'load1', '2000-01-01'))]
+        self.assertEqual(
+            bulk_load.load(Model(), 'actor.person', FIELDS, [records], 'text', 1), 1)
+        self.assertEqual(Model.connections, 2)
+        Model.connections = 0
+        self.assertRaises(
+            psycopg2.InterfaceError,
+            bulk_load.load, Model(), 'actor.person', FIELDS, [records], 'text', 1, retries=0)
+
+    def test_connection_failure(self):
+        "a chunk is retried when the connection can't be opened"
+        model = self.model
+        class Model:
+            connections = 0
+            def _new_connection(self):
+                Model.connections += 1
+                if Model.connections == 1:
+                    raise psycopg2.OperationalError('no connection')
+                return model._new_connection()
+        records = [bulk_load.encode_row(('a', 'load1', '2000-01-01'))]
+        self.assertEqual(
+            bulk_load.load(Model(), 'actor.person', FIELDS, [records], 'text', 1), 1)
+        self.assertEqual(Model.connections, 2)
+
+    def test_commit_failure(self):
+        "the commit is not retried: the rows are not loaded twice"
+        class Connection(psycopg2.extensions.connection):
+            def commit(self):
+                super().commit()
+                raise psycopg2.OperationalError('connection lost')
+        model = self.model
+        class Model:
+            connections = 0
+            def _new_connection(self):
+                Model.connections += 1
+                params = dict(model._dbinfo)
+                params['dbname'] = params.pop('name')
+                return psycopg2.connect(**params, connection_factory=Connection)
+        records = [bulk_load.encode_row(('a', 'load1', '2000-01-01'))]
+        self.assertRaises(
+            psycopg2.OperationalError,
+            bulk_load.load, Model(), 'actor.person', FIELDS, [records], 'text', 1)
+        self.assertEqual(Model.connections, 1)
+        self.assertEqual(self.loaded.count(), 1)
+
+    def test_routing(self):
+        self.model.execute_query(
+            """create table public.half_orm_load (a int, b text) partition by range (a);
+               create table public.half_orm_load_low partition of public.half_orm_load
+                 for values from (minvalue) to (10);
+               create table public.half_orm_load_high partition of public.half_orm_load
+                 for values from (10) to (20) partition by list (b);
+               create table public.half_orm_load_high_x partition of public.half_orm_load_high
+                 for values in ('x%%');
+               create table public.half_orm_load_high_y partition of public.half_orm_load_high
+                 for values in ('y')""")
+        try:
+            fields = ['a', 'b']
+            route = bulk_load.routing(self.model, 'public.half_orm_load', fields)
+            self.assertEqual(route[0], [0, 1])
+            self.assertIsNone(bulk_load.routing(self.model, 'public.half_orm_load', ['a']))
+            records = [bulk_load.encode_row((idx, idx % 2 and 'x%' or 'y')) for idx in range(20)]
+            self.assertEqual(bulk_load.load(
+                self.model, 'public.half_orm_load', fields,
+                bulk_load.chunks(records, 6), 'text', 2, route), 20)
+            self.assertEqual(
+                {elt['part']: elt['count'] for elt in self.model.execute_query(
+                    """select tableoid::regclass::text as part, count(*)
+                       from public.half_orm_load group by 1""")},
+                {'half_orm_load_low': 10, 'half_orm_load_high_x': 5, 'half_orm_load_high_y': 5})
+            rows = [(idx, 'y') for idx in range(5)]
+            self.assertEqual(bulk_load.load(
+                self.model, 'public.half_orm_load', fields, [rows], 'binary', 1, route,
+                fields_metadata={'a': {'fieldtype': 'int4'}, 'b': {'fieldtype': 'text'}}), 5)
+            self.assertEqual(self.model.execute_query(
+                'select count(*) from public.half_orm_load_low').fetchone()['count'], 15)
+            self.assertRaises(
+                psycopg2.IntegrityError, bulk_load.load, self.model, 'public.half_orm_load',
+                fields, [[bulk_load.encode_row((30, 'y'))]], 'text', 1, route)
+        finally:
+            self.model.execute_query('drop table public.half_orm_load')
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+from unittest import TestCase
+
+from half_orm import parallel, relation_errors
+
+from ..init import halftest
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.model = self.pers._model
+        self.persons = self.pers(last_name=('like', 'a%'))
+
+    def test_ranges(self):
+        query, values = self.persons._prep_select()
+        conditions = parallel.ranges(self.model, query, values, 'id', 3)
+        self.assertEqual(len(conditions), 3)
+        ids = []
+        for condition, condition_values in conditions:
+            ids += [elt['id'] for elt in self.model.execute_query(
+                f'select q.id from ({query}) as q where {condition}',
+                (*values, *condition_values))]
+        self.assertEqual(sorted(ids), sorted(elt['id'] for elt in self.persons.select('id')))
+
+    def test_empty_ranges(self):
+        query, values = self.pers(last_name='nope')._prep_select()
+        self.assertEqual(parallel.ranges(self.model, query, values, 'id', 3), [('true', ())])
+
+    def test_parallel_select(self):
+        rows = list(self.persons.parallel_select(workers=2, split_on='id'))
+        self.assertEqual(
+            sorted(rows, key=lambda row: row['id']),
+            sorted((dict(row) for row in self.persons.select()), key=lambda row: row['id']))
+
+    def test_callback(self):
+        self.assertEqual(
+            sum(self.persons.parallel_select(workers=2, split_on='id', callback=len)), 10)
+
+    def test_null_values(self):
+        "the rows with a null value of the split field are in the first range"
+        post = halftest.post
+        post().delete(delete_all=True)
+        try:
+            author = self.pers(last_name='aa').get()
+            for idx in range(6):
+                post(
+                    title=f'parallel {idx}', content=idx % 3 and f'content {idx}' or None,
+                    author_first_name=author.first_name.value, author_last_name='aa',
+                    author_birth_date=author.birth_date.value).insert()
+            query, values = post()._prep_select()
+            conditions = parallel.ranges(self.model, query, values, 'content', 3)
+            self.assertIn('is null', conditions[0][0])
+            rows = list(post().parallel_select(workers=3, split_on='content'))
+            self.assertEqual(len(rows), 6)
+            self.assertEqual(len([row for row in rows if row['content'] is None]), 2)
+        finally:
+            post().delete(delete_all=True)
+
+    def test_limit_without_order_by(self):
+        self.assertRaises(
+            ValueError, self.pers().limit(3).parallel_select, split_on='id')
+        self.assertRaises(
+            ValueError, self.pers().offset(3).parallel_select, split_on='id')
+        self.assertEqual(
+            len(list(self.pers().order_by('id').limit(3).parallel_select(split_on='id'))), 3)
+
+    def test_split_field(self):
+        self.assertRaises(ValueError, self.persons.parallel_select)
+        self.assertRaises(
+            relation_errors.UnknownAttributeError, self.persons.parallel_select, split_on='nope')
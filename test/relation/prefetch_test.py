@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+from unittest import TestCase
+
+from half_orm import relation_errors
+
+from ..init import halftest
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.post = halftest.post
+        self.comment = halftest.comment
+        self.post().delete(delete_all=True)
+        self.comment().delete(delete_all=True)
+        self.authors = {}
+        for last_name in ('aa', 'ab'):
+            author = self.pers(last_name=last_name).get()
+            self.authors[last_name] = author
+            for title in ('first', 'second'):
+                post = self.post(
+                    title=f'{last_name} {title}', content='prefetch',
+                    author_first_name=author.first_name.value,
+                    author_last_name=last_name,
+                    author_birth_date=author.birth_date.value).insert()[0]
+                for _ in range(title == 'first' and 2 or 0):
+                    self.comment(
+                        author_id=author.id.value, post_id=post['id'],
+                        content=title).insert()
+        self.post(title='orphan', content='prefetch').insert()
+
+    def tearDown(self):
+        self.comment().delete(delete_all=True)
+        self.post().delete(delete_all=True)
+
+    def test_fkey(self):
+        posts = self.post(content='prefetch').order_by('title').prefetch('author_')
+        posts = list(posts.select())
+        self.assertEqual(len(posts), 5)
+        for post in posts[:-1]:
+            self.assertEqual(post['author_']['last_name'], post['title'][:2])
+        self.assertIsNone(posts[-1]['author_'])
+        self.assertIs(posts[0]['author_'], posts[1]['author_'])
+
+    def test_reverse_fkey(self):
+        posts = self.post(content='prefetch').order_by('title').prefetch('comment_fk').select()
+        self.assertEqual(
+            [len(post['comment_fk']) for post in posts], [2, 0, 2, 0, 0])
+
+    def test_fkey_names_and_args(self):
+        comments = self.comment().prefetch('author', 'post').select('content')
+        for comment in comments:
+            self.assertEqual(set(comment), {'content', 'author', 'post'})
+            self.assertEqual(comment['post']['title'][:2], comment['author']['last_name'])
+
+    def test_quoted_and_aliased_args(self):
+        comments = self.comment().prefetch('author', 'post').select(
+            '"author_id"', 'post_id as post_ref')
+        for comment in comments:
+            self.assertEqual(set(comment), {'author_id', 'post_ref', 'author', 'post'})
+            self.assertEqual(comment['author_id'], comment['author']['id'])
+            self.assertEqual(comment['post_ref'], comment['post']['id'])
+
+    def test_reverse_from_person(self):
+        persons = self.pers(last_name=('<', 'ad')).order_by('last_name')
+        comments_fkey = '_reverse_fkey_halftest_blog_comment_author_id'
+        persons = list(persons.prefetch(comments_fkey).select('last_name'))
+        self.assertEqual([len(person[comments_fkey]) for person in persons], [2, 2, 0])
+
+    def test_queries(self):
+        queries = []
+        execute_query = self.post._model.execute_query
+        def spy(query, values=()):
+            queries.append(query)
+            return execute_query(query, values)
+        self.post._model.execute_query = spy
+        try:
+            list(self.post().prefetch('author_', 'comment_fk').select())
+        finally:
+            del self.post._model.execute_query
+        self.assertEqual(len(queries), 2)
+
+    def test_unknown(self):
+        self.assertRaises(relation_errors.UnknownAttributeError, self.post().prefetch, 'title')
+        self.assertRaises(relation_errors.UnknownAttributeError, self.post().prefetch, 'nope')
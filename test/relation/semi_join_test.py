@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+from unittest import TestCase
+
+from ..init import halftest
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.post = halftest.post
+        self.comment = halftest.comment
+        self.post().delete(delete_all=True)
+        self.aa = self.pers(last_name='aa').get()
+        self.ab = self.pers(last_name='ab').get()
+        for author in (self.aa, self.aa, self.ab):
+            post = self.post(title='semi join', content='semi join')
+            post.author_first_name = author.first_name.value
+            post.author_last_name = author.last_name.value
+            post.author_birth_date = author.birth_date.value
+            post_id = post.insert()[0]['id']
+            for _ in range(2):
+                self.comment(
+                    author_id=author.id.value, post_id=post_id, content='semi join').insert()
+
+    def tearDown(self):
+        self.post().delete(delete_all=True)
+
+    def test_join_multiplies_rows(self):
+        authors = self.post(title='semi join').author_
+        self.assertEqual(len(list(authors.select())), 3)
+
+    def test_exists(self):
+        authors = self.post(title='semi join').author_.semi_join()
+        query, _ = authors._prep_select()
+        self.assertIn('exists', query)
+        self.assertNotIn('join', query.replace('semi join', ''))
+        self.assertNotIn('distinct', query)
+        names = sorted(elt['last_name'] for elt in authors.select())
+        self.assertEqual(names, ['aa', 'ab'])
+        self.assertEqual(authors.count(), 2)
+
+    def test_nested_exists(self):
+        comments = self.comment()
+        comments.post_ = self.post(title='semi join')
+        comments.author_ = self.pers(last_name='ab')
+        comments.semi_join()
+        self.assertEqual(comments._prep_select()[0].count('exists'), 2)
+        self.assertEqual(len(list(comments.select())), 2)
+
+    def test_shared_relation_in_sub_query(self):
+        "a relation reached twice in the join graph falls back to pkey in (...)"
+        author = self.pers(last_name='aa')
+        posts = self.post()
+        posts.author_ = author
+        comments = self.comment()
+        comments.author_ = author
+        comments.post_ = posts
+        comments.semi_join()
+        query, _ = comments._prep_select()
+        self.assertIn('."id") in (', query)
+        self.assertEqual(len(list(comments.select('id'))), 4)
+
+    def test_order_by_limit(self):
+        authors = self.post(title='semi join').author_.semi_join()
+        authors.order_by('last_name desc').limit(1)
+        self.assertEqual([elt['last_name'] for elt in authors.select()], ['ab'])
+
+    def test_count_without_pkey(self):
+        "count() counts the rows returned by select(), distinct only if select is"
+        # the SQL texts compiled without primary key must not be reused.
+        sql_cache = self.comment._model.sql_cache
+        sql_cache.clear()
+        try:
+            comments = self.comment(content='semi join')
+            comments.post_ = self.post(title='semi join')
+            comments.semi_join()
+            comments._pkey = {}
+            self.assertNotIn('distinct', comments._prep_select()[0])
+            count_query = getattr(comments, '__count_query')(_semi_join=True)[0]
+            self.assertIn('count(*)', count_query)
+            self.assertEqual(comments.count(), len(list(comments.select())))
+            author = self.pers(last_name='aa')
+            posts = self.post()
+            posts.author_ = author
+            comments = self.comment()
+            comments.author_ = author
+            comments.post_ = posts
+            comments.semi_join()
+            comments._pkey = {}
+            self.assertIn('distinct', comments._prep_select()[0])
+            self.assertEqual(comments.count(), len(list(comments.select())))
+        finally:
+            sql_cache.clear()
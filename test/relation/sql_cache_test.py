@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+import threading
+from unittest import TestCase
+
+from half_orm.cache import LRUCache
+
+from ..init import halftest
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.post = halftest.post
+        self.cache = self.pers._model.sql_cache
+        self.cache.clear()
+
+    def tearDown(self):
+        self.cache.maxsize = 1024
+
+    def test_same_shape_same_query(self):
+        query_aa, values_aa = self.pers(last_name='aa')._prep_select()
+        query_ab, values_ab = self.pers(last_name='ab')._prep_select()
+        self.assertEqual(query_aa, query_ab)
+        self.assertEqual([str(value) for value in values_ab], ['ab'])
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+        self.assertEqual(self.pers(last_name='ab').get().last_name.value, 'ab')
+
+    def test_comparator_is_in_shape(self):
+        self.pers(last_name='aa')._prep_select()
+        self.pers(last_name=('like', 'a%'))._prep_select()
+        self.pers(last_name=['aa', 'ab'])._prep_select()
+        self.assertEqual(self.cache.stats()['misses'], 3)
+        self.assertEqual(len(self.pers(last_name=['aa', 'ab'])), 2)
+
+    def test_set_operations(self):
+        def names(relation):
+            return sorted(elt['last_name'] for elt in relation.select())
+        self.assertEqual(
+            names(self.pers(last_name='aa') | self.pers(last_name='ab')), ['aa', 'ab'])
+        self.assertEqual(
+            names(self.pers(last_name='ba') | self.pers(last_name='bb')), ['ba', 'bb'])
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(names(self.pers(last_name='ba') & self.pers(last_name='bb')), [])
+
+    def test_limit_offset_are_values(self):
+        persons = self.pers(last_name=('like', 'a%')).order_by('last_name')
+        self.assertEqual(next(persons.offset(1).limit(1).select())['last_name'], 'ab')
+        self.assertEqual(next(persons.offset(2).limit(1).select())['last_name'], 'ac')
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_fkeys(self):
+        posts = self.post()
+        posts.author_ = self.pers(last_name='aa')
+        query_aa, _ = posts._prep_select()
+        posts = self.post()
+        posts.author_ = self.pers(last_name='ab')
+        query_ab, values = posts._prep_select()
+        self.assertEqual(query_aa, query_ab)
+        self.assertEqual([str(value) for value in values], ['ab'])
+        posts = self.post()
+        posts.author_ = self.pers(first_name='ab')
+        self.assertNotEqual(posts._prep_select()[0], query_aa)
+
+    def test_update(self):
+        self.pers(last_name='aa').update(first_name='aa_updated')
+        self.pers(last_name='ab').update(first_name='ab_updated')
+        self.assertEqual(self.pers(first_name=('like', '%_updated')).count(), 2)
+        self.pers(first_name='aa_updated').update(first_name='aa')
+        self.pers(first_name='ab_updated').update(first_name='ab')
+        self.assertEqual(self.pers(first_name=('like', '%_updated')).count(), 0)
+
+    def test_disabled(self):
+        self.cache.maxsize = 0
+        self.assertEqual(len(self.pers(last_name='aa')), 1)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_lru(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 2, 'maxsize': 2})
+        cache.maxsize = 1
+        self.assertEqual(list(cache.stats().values())[2], 1)
+
+    def test_threads(self):
+        "the other threads wait for the eviction in progress"
+        readers = []
+        def on_evict(key, value):
+            reader = threading.Thread(target=cache.get, args=('a',))
+            reader.start()
+            reader.join(.1)
+            readers.append((reader, reader.is_alive()))
+        cache = LRUCache(1, on_evict=on_evict)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        (reader, blocked), = readers
+        self.assertTrue(blocked)
+        reader.join()
+        self.assertEqual(cache.stats()['misses'], 1)
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+from unittest import TestCase
+
+from half_orm import sql
+
+class Test(TestCase):
+    def test_and_flattening(self):
+        a, b, c = sql.Pred('a = %s', (1,)), sql.Pred('b'), sql.Pred('c = %s', (3,))
+        node = sql.And(a, sql.And(sql.TRUE, sql.And(b, c))).simplify()
+        self.assertEqual(node.items, [a, b, c])
+        self.assertEqual(node.compile(), ('(a = %s) and\n    (b) and\n    (c = %s)', [1, 3]))
+
+    def test_true_reduction(self):
+        a = sql.Pred('a')
+        self.assertIs(sql.And(sql.TRUE, a).simplify(), a)
+        self.assertIs(sql.And().simplify(), sql.TRUE)
+        self.assertIs(sql.Or(a, sql.TRUE).simplify(), sql.TRUE)
+        self.assertIs(sql.Not(sql.Not(a)).simplify(), a)
+
+    def test_duplicate_joins(self):
+        "a join on an alias already joined is moved to the where clause"
+        on1, on2 = sql.Pred('r1.a = r0.a'), sql.Pred('r1.b = r0.b')
+        select = sql.Select(
+            ['r0.*'], sql.Table('"t0"', 'r0'),
+            [sql.Join(sql.Table('"t1"', 'r1'), on1), sql.Join(sql.Table('"t1"', 'r1'), on2)]
+        ).simplify()
+        self.assertEqual(len(select.joins), 1)
+        self.assertIs(select.where, on2)
+        query, _ = select.compile()
+        self.assertEqual(
+            query,
+            'select\n  r0.*\nfrom\n  "t0" as r0\n  join "t1" as r1 on\n    r1.a = r0.a\nwhere\n    r1.b = r0.b')
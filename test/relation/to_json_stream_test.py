@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+import gzip
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from ..init import halftest
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.persons = self.pers(last_name=('like', 'a%')).order_by('last_name')
+        self.expected = json.loads(self.persons.to_json())
+
+    def test_text_file(self):
+        fileobj = io.StringIO()
+        self.persons.to_json_stream(fileobj, chunk_size=3)
+        self.assertEqual(json.loads(fileobj.getvalue()), self.expected)
+
+    def test_gzip_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'persons.json.gz')
+            with gzip.open(path, 'wb') as fileobj:
+                self.persons.to_json_stream(fileobj, chunk_size=4)
+            with gzip.open(path, 'rt') as fileobj:
+                self.assertEqual(json.load(fileobj), self.expected)
+
+    def test_generator(self):
+        chunks = list(self.persons.to_json_stream(chunk_size=4))
+        # 10 rows: 3 chunks of rows and the end of the array.
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(json.loads(''.join(chunks)), self.expected)
+
+    def test_ndjson(self):
+        fileobj = io.BytesIO()
+        self.persons.to_json_stream(fileobj, ndjson=True)
+        lines = fileobj.getvalue().decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.expected)
+        self.assertRaises(ValueError, self.persons.to_json_stream, ndjson=True, page=1)
+
+    def test_envelope(self):
+        text = ''.join(self.persons.to_json_stream(res_field_name='persons', page=2, total=10))
+        self.assertEqual(json.loads(text), {'persons': self.expected, 'page': 2, 'total': 10})
+
+    def test_envelope_replaces_elements(self):
+        "{res_field_name: [...]}.update(kwargs) as to_json"
+        expected = {'elements': 'replaced', 'page': 1}
+        self.assertEqual(json.loads(''.join(
+            self.persons.to_json_stream(elements='replaced', page=1))), expected)
+        self.assertEqual(json.loads(self.persons.to_json(elements='replaced', page=1)), expected)
+        self.assertEqual(
+            json.loads(self.persons.to_json(in_database=True, elements='replaced')),
+            {'elements': 'replaced'})
+
+    def test_empty(self):
+        persons = self.pers(last_name='nope')
+        self.assertEqual(json.loads(''.join(persons.to_json_stream())), [])
+        self.assertEqual(
+            json.loads(''.join(persons.to_json_stream(page=1))), {'elements': [], 'page': 1})
+        self.assertEqual(''.join(persons.to_json_stream(ndjson=True)), '')
+
+    def test_transaction(self):
+        @self.pers.Transaction
+        def stream(persons):
+            return ''.join(persons.to_json_stream())
+        self.assertEqual(json.loads(stream(self.persons)), self.expected)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+#-*- coding:  utf-8 -*-
+
+import decimal
+import os
+import tempfile
+from unittest import TestCase, skipUnless
+
+from half_orm import parallel, parquet
+
+from ..init import halftest
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+class Test(TestCase):
+    def setUp(self):
+        self.pers = halftest.pers
+        self.model = self.pers._model
+        self.persons = self.pers(last_name=('like', 'a%'))
+
+    def test_column_types(self):
+        self.assertEqual(
+            parquet._column_type({'fieldtype': 'timestamptz', 'fielddim': 0}),
+            ('timestamp', ('us', 'UTC'), 0))
+        self.assertEqual(
+            parquet._column_type({'fieldtype': '_int4', 'fielddim': 2}), ('int32', (), 2))
+        self.assertEqual(parquet._column_type({'fieldtype': 'uuid'}), ('string', (), 0))
+        self.assertIsNone(parquet._converter({'fieldtype': 'text'}))
+        convert = parquet._converter({'fieldtype': '_uuid', 'fielddim': 1})
+        self.assertEqual(convert(['a', None]), ['a', None])
+
+    def test_numeric_types(self):
+        "the numerics are decimals or strings, never floats"
+        numeric = {'fieldtype': 'numeric', 'fielddim': 0, 'fieldtypmod': (12 << 16 | 2) + 4}
+        self.assertEqual(parquet._column_type(numeric), ('decimal128', (12, 2), 0))
+        self.assertIsNone(parquet._converter(numeric))
+        numeric['fieldtypmod'] = (50 << 16 | 0) + 4
+        self.assertEqual(parquet._column_type(numeric), ('decimal256', (50, 0), 0))
+        numeric['fieldtypmod'] = -1
+        self.assertEqual(parquet._column_type(numeric), ('string', (), 0))
+        self.assertEqual(parquet._converter(numeric)(decimal.Decimal('0.1')), '0.1')
+
+    @skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_numeric_file(self):
+        metadata = {
+            'price': {'fieldtype': 'numeric', 'fieldtypmod': (20 << 16 | 4) + 4},
+            'amount': {'fieldtype': 'numeric', 'fieldtypmod': -1}}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'numeric.parquet')
+            parquet.write(
+                self.model._connection,
+                """select 1234567890123.4567::numeric(20, 4) as price,
+                     12345678901234567890.123456789::numeric as amount""",
+                (), path, metadata, 10)
+            row = pyarrow.parquet.read_table(path).to_pylist()[0]
+        self.assertEqual(row, {
+            'price': decimal.Decimal('1234567890123.4567'),
+            'amount': '12345678901234567890.123456789'})
+
+    def test_partitions(self):
+        self.model.execute_query(
+            """create temp table half_orm_parts (a int, b text) partition by range (a);
+               create temp table half_orm_parts_low partition of half_orm_parts
+                 for values from (minvalue) to (10);
+               create temp table half_orm_parts_other partition of half_orm_parts default;
+               insert into half_orm_parts select i, '%%' || i from generate_series(1, 20) as i""")
+        try:
+            parts = parquet.partitions(self.model, 'half_orm_parts')
+            self.assertEqual(len(parts), 2)
+            counts = [
+                self.model.execute_query(
+                    f'select count(*) from (select * from half_orm_parts) as q where {condition}'
+                ).fetchone()['count']
+                for _, condition in parts]
+            self.assertEqual(sorted(counts), [9, 11])
+        finally:
+            self.model.execute_query('drop table half_orm_parts')
+
+    def test_split_errors(self):
+        self.assertRaises(ValueError, self.persons.to_parquet, 'nope', split='partitions')
+        self.assertRaises(ValueError, self.persons.to_parquet, 'nope', split=0)
+        # composite primary key
+        self.assertRaises(ValueError, self.persons.to_parquet, 'nope', split=2)
+
+    @skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'persons.parquet')
+            self.assertEqual(self.persons.to_parquet(path, batch_rows=3), {path: 10})
+            table = pyarrow.parquet.read_table(path)
+            self.assertEqual(table.num_rows, 10)
+            self.assertEqual(pyarrow.parquet.ParquetFile(path).num_row_groups, 4)
+            self.assertFalse(table.schema.field('last_name').nullable)
+            self.assertEqual(
+                sorted(table.column('last_name').to_pylist()),
+                sorted(elt['last_name'] for elt in self.persons.select()))
+
+    @skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_split(self):
+        with tempfile.TemporaryDirectory() as directory:
+            result = self.persons.to_parquet(directory, split=3, split_on='id', workers=3)
+            self.assertEqual(len(result), 3)
+            self.assertEqual(sum(result.values()), 10)
+            self.assertEqual(
+                sum(pyarrow.parquet.read_table(path).num_rows for path in result), 10)
+
+    def test_split_null_values(self):
+        "the rows with a null value of the split field are in the first part"
+        post = halftest.post
+        post().delete(delete_all=True)
+        try:
+            author = self.pers(last_name='aa').get()
+            for idx in range(6):
+                post(
+                    title=f'parquet {idx}', content=idx % 3 and f'content {idx}' or None,
+                    author_first_name=author.first_name.value, author_last_name='aa',
+                    author_birth_date=author.birth_date.value).insert()
+            query, values = post()._prep_select()
+            conditions = parallel.ranges(self.model, query, values, 'content', 3)
+            self.assertEqual(
+                sum(self.model.execute_query(
+                    f'select count(*) from ({query}) as q where {condition}',
+                    (*values, *condition_values)).fetchone()['count']
+                    for condition, condition_values in conditions), 6)
+            if pyarrow is None:
+                return
+            with tempfile.TemporaryDirectory() as directory:
+                result = post().to_parquet(directory, split=3, split_on='content')
+                self.assertEqual(sum(result.values()), 6)
+                self.assertEqual(sum(
+                    pyarrow.parquet.read_table(path).column('content').null_count
+                    for path in result), 2)
+        finally:
+            post().delete(delete_all=True)